@@ -1,8 +1,12 @@
+import functools
 import os
+import threading
+import time
 import google.generativeai as genai
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.agents import initialize_agent, Tool, AgentType
-from langchain.memory import ConversationBufferMemory
+from langchain.agents import initialize_agent, create_tool_calling_agent, Tool, AgentType, AgentExecutor
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 # Charger les variables d'environnement
@@ -13,80 +17,203 @@ from tools.todo_tool import TodoTool
 from tools.search_tool import SearchTool
 from tools.doc_reader import DocReaderTool
 from tools.calculator_tool import CalculatorTool
+from tools.lazy_tool import LazyTool
+from memory.memory_manager import BudgetedSummaryMemory, get_memory, memory_state
+from services.streaming import AgentStreamHandler
+from services.response_cache import ResponseCache, ToolRecorder
+from services.parallel_executor import ParallelAgentExecutor
+from services.tracing import TracingCallbackHandler, record_cache
+from services.llm_gateway import create_chat_model
+from retriever.embeddings import get_embeddings
+
+MODEL_NAME = "models/gemini-1.5-flash-latest"
+# "react" : un outil par étape (JSON ReAct) ; "tools" : appel de fonctions, plusieurs outils
+# par étape exécutés en parallèle
+AGENT_MODE = os.getenv("AGENT_MODE", "react").lower()
+
+TOOL_CALLING_SYSTEM_PROMPT = (
+    "Tu es un assistant utile qui répond en français. Utilise les outils disponibles lorsque c'est nécessaire. "
+    "Si plusieurs informations indépendantes sont nécessaires (recherche web, document, calcul...), "
+    "appelle tous les outils correspondants en une seule fois plutôt que l'un après l'autre."
+)
+
+class ToolInput(BaseModel):
+    """Argument unique des outils, exposé au modèle en mode appel de fonctions"""
+    query: str = Field(description="Entrée de l'outil, au format décrit dans sa description")
+
+class AgentSession:
+    """
+    Exécuteur LangChain et mémoire de conversation propres à un utilisateur.
+    Les requêtes d'une même session sont sérialisées (la mémoire n'est pas thread-safe).
+    """
+    def __init__(self, executor, user_id: str = None, response_cache: ResponseCache = None, cache_context: str = "",
+                 on_exchange=None):
+        self.executor = executor
+        self.user_id = user_id
+        self.response_cache = response_cache
+        self.cache_context = cache_context
+        # on_exchange(question, réponse) est appelé après chaque échange (ex: persistance de l'historique)
+        # et retourne l'identifiant du dernier message enregistré
+        self.on_exchange = on_exchange
+        self.history_last_id = None
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    @property
+    def memory(self):
+        return self.executor.memory
+
+    @property
+    def history_tokens(self):
+        """Tokens d'historique envoyés au LLM lors de la dernière requête (None si non mesuré)"""
+        return getattr(self.memory, "last_token_count", None)
+
+    def _context_key(self) -> str:
+        # La réponse dépend de la configuration de l'agent et de tout l'état de la conversation
+        # (résumé compris) : une réponse n'est partagée qu'entre conversations identiques
+        return ResponseCache.context_key(self.cache_context, *memory_state(self.memory))
+
+    def _execute(self, input_text: str, callbacks=()):
+        """
+        Répond depuis le cache de réponses si possible, sinon exécute l'agent
+        et met la réponse en cache si les outils utilisés le permettent.
+        Retourne (réponse, depuis_le_cache).
+        """
+        callbacks = [*callbacks, TracingCallbackHandler()]
+        if self.response_cache is None:
+            result = self.executor.invoke({"input": input_text}, config={"callbacks": list(callbacks)})
+            return result["output"], False
+
+        context = self._context_key()
+        cached = self.response_cache.lookup(input_text, self.user_id, context)
+        record_cache("response", cached is not None)
+        if cached is not None:
+            # La conversation continue comme si l'agent avait répondu
+            self.memory.save_context({"input": input_text}, {"output": cached})
+            return cached, True
+
+        recorder = ToolRecorder()
+        try:
+            result = self.executor.invoke({"input": input_text}, config={"callbacks": [*callbacks, recorder]})
+        finally:
+            # Un outil a pu modifier les données de l'utilisateur avant un arrêt ou une erreur
+            self.response_cache.invalidate_after(self.user_id, recorder.calls)
+        output = result["output"]
+        if not output.startswith("Agent stopped"):
+            self.response_cache.store(input_text, output, self.user_id, context, recorder.calls)
+        return output, False
+
+    def _record(self, input_text: str, output: str):
+        if self.on_exchange is None:
+            return
+        try:
+            self.history_last_id = self.on_exchange(input_text, output)
+        except Exception as e:
+            print(f"⚠️ Impossible d'enregistrer l'échange dans l'historique : {e}")
+
+    def run(self, input_text: str) -> str:
+        with self.lock:
+            self.last_used = time.monotonic()
+            try:
+                output = self._execute(input_text)[0]
+            except Exception as e:
+                output = f"Erreur lors de l'exécution: {str(e)}"
+            self._record(input_text, output)
+            return output
+
+    def stream(self, input_text: str, emit) -> str:
+        """
+        Exécute une requête en transmettant les étapes intermédiaires et les tokens
+        de la réponse finale à emit(event: dict) au fur et à mesure
+        """
+        with self.lock:
+            self.last_used = time.monotonic()
+            try:
+                handler = AgentStreamHandler(emit, raw_tokens=AGENT_MODE == "tools")
+                output, cached = self._execute(input_text, callbacks=[handler])
+            except Exception as e:
+                error_message = f"Erreur lors de l'exécution: {str(e)}"
+                self._record(input_text, error_message)
+                emit({"type": "error", "content": error_message})
+                return error_message
+            self._record(input_text, output)
+            emit({"type": "final", "content": output, "cached": cached})
+            return output
+
+DEFAULT_TOOL_CLASSES = (TodoTool, SearchTool, DocReaderTool, CalculatorTool)
 
 class GeminiAgent:
-    def __init__(self):
+    def __init__(self, llm=None, tool_classes=DEFAULT_TOOL_CLASSES):
         """
-        Initialise l'agent Gemini avec tous les outils
+        Initialise l'agent Gemini avec tous les outils.
+        llm et tool_classes permettent de substituer le modèle et les outils
+        (ex : banc de charge hors ligne, voir benchmarks/load_test.py).
         """
-        # Vérification de la clé API
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY n'est pas définie dans les variables d'environnement")
-        
-        # Configuration de Gemini
-        genai.configure(api_key=api_key)
-        
-        # Initialisation du LLM Gemini pour LangChain
-        self.llm = ChatGoogleGenerativeAI(
-            model="models/gemini-1.5-flash-latest",
-            temperature=0.5,
-            google_api_key=api_key
-        )
-        
-        # Initialisation des outils avec gestion d'erreurs
+        if llm is None:
+            # Vérification de la clé API
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY n'est pas définie dans les variables d'environnement")
+
+            # Configuration de Gemini
+            genai.configure(api_key=api_key)
+
+            # Initialisation du LLM Gemini pour LangChain, derrière la passerelle partagée
+            # (débit, concurrence, relances, modèle de secours)
+            llm = create_chat_model(MODEL_NAME, temperature=0.5, api_key=api_key)
+        self.llm = llm
+
+        # Déclaration des outils (construits au premier usage)
         self.tools = []
-        self._init_tools()
+        self._init_tools(tool_classes)
         
         # Création de l'agent LangChain
+        self._tool_calling_agent = None
         self.agent = self._create_langchain_agent()
+
+        # Cache de réponses partagé par toutes les sessions (None s'il est désactivé)
+        self.response_cache = ResponseCache.from_env(get_embeddings())
+        self._cache_context = ResponseCache.context_key(MODEL_NAME, self.llm.temperature, AGENT_MODE, *sorted(tool.name for tool in self.tools))
+        self._default_session = AgentSession(self.agent, response_cache=self.response_cache, cache_context=self._cache_context)
     
-    def _init_tools(self):
-        """Initialise tous les outils avec gestion d'erreurs"""
-        tool_classes = [
-            (TodoTool, "TodoTool"),
-            (SearchTool, "SearchTool"),
-            (DocReaderTool, "DocReaderTool"),
-            (CalculatorTool, "CalculatorTool")
-        ]
-        
-        for tool_class, tool_name in tool_classes:
+    def _init_tools(self, tool_classes):
+        """
+        Déclare les outils sans les construire : chacun est instancié à son premier
+        appel (ou par warm_up_tools), le démarrage ne paie ni les imports lourds
+        ni les clients des outils inutilisés
+        """
+        for tool_class in tool_classes:
+            self.tools.append(LazyTool(tool_class))
+        if not self.tools:
+            raise ValueError("Aucun outil déclaré")
+
+    def warm_up_tools(self):
+        """Instancie tous les outils (préchauffage en arrière-plan)"""
+        for tool in self.tools:
             try:
-                tool_instance = tool_class()
-                self.tools.append(tool_instance)
-                print(f"✅ {tool_name} initialisé")
+                tool.get_instance()
             except Exception as e:
-                print(f"❌ Erreur {tool_name}: {e}")
-        
-        if not self.tools:
-            raise ValueError("Aucun outil n'a pu être initialisé")
+                print(f"❌ Erreur {tool.name}: {e}")
+
+    def tools_status(self) -> dict:
+        return {tool.name: tool.loaded for tool in self.tools}
     
     def _create_langchain_agent(self):
         """Crée l'agent LangChain avec les outils"""
         # Convertir en outils LangChain
-        langchain_tools = []
-        for tool in self.tools:
-            langchain_tools.append(
-                Tool(
-                    name=tool.name,
-                    func=tool._run,
-                    description=tool.description
-                )
-            )
-        
-        # Mémoire pour la conversation
-        memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-            output_key="output"
-        )
-        
+        langchain_tools = self._build_langchain_tools()
+
+        if AGENT_MODE == "tools":
+            agent = self._create_executor(get_memory(llm=self.llm))
+            print(f"🤖 Agent (appel de fonctions, outils en parallèle) initialisé avec {len(langchain_tools)} outils")
+            return agent
+
         # Configuration de l'agent
         agent = initialize_agent(
             tools=langchain_tools,
             llm=self.llm,
             agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
-            memory=memory,
+            memory=get_memory(llm=self.llm),
             verbose=True,
             handle_parsing_errors=True,
             max_iterations=5,
@@ -95,16 +222,96 @@ class GeminiAgent:
         
         print(f"🤖 Agent initialisé avec {len(langchain_tools)} outils")
         return agent
+
+    def _build_langchain_tools(self, user_id: str = None):
+        """
+        Convertit les outils en outils LangChain. Les outils qui gèrent des données
+        par utilisateur (méthode run_for_user) sont liés à user_id.
+        """
+        langchain_tools = []
+        for tool in self.tools:
+            func, coroutine = tool._run, tool._arun
+            if user_id is not None and getattr(tool, "user_bound", hasattr(tool, "run_for_user")):
+                func, coroutine = functools.partial(tool.run_for_user, user_id), None
+            langchain_tools.append(
+                Tool(
+                    name=tool.name,
+                    func=func,
+                    coroutine=coroutine,
+                    description=tool.description,
+                    args_schema=ToolInput
+                )
+            )
+        return langchain_tools
+
+    def _create_tool_calling_agent(self):
+        """
+        Agent à appel de fonctions : le modèle peut demander plusieurs outils
+        dans une même étape (exécutés en parallèle par ParallelAgentExecutor)
+        """
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", TOOL_CALLING_SYSTEM_PROMPT),
+            MessagesPlaceholder("chat_history", optional=True),
+            ("human", "{input}"),
+            MessagesPlaceholder("agent_scratchpad"),
+        ])
+        return create_tool_calling_agent(self.llm, self._build_langchain_tools(), prompt)
+
+    def _create_executor(self, memory, user_id: str = None):
+        """
+        Crée un exécuteur léger qui partage le LLM, les outils et le prompt
+        de l'agent principal mais possède sa propre mémoire
+        """
+        if AGENT_MODE == "tools":
+            executor_class = ParallelAgentExecutor
+            if self._tool_calling_agent is None:
+                self._tool_calling_agent = self._create_tool_calling_agent()
+            agent = self._tool_calling_agent
+        else:
+            executor_class, agent = AgentExecutor, self.agent.agent
+        return executor_class.from_agent_and_tools(
+            agent=agent,
+            tools=self._build_langchain_tools(user_id),
+            memory=memory,
+            verbose=True,
+            handle_parsing_errors=True,
+            max_iterations=5,
+            early_stopping_method="generate"
+        )
+
+    def create_session(self, user_id: str = None, history=None, on_exchange=None) -> "AgentSession":
+        """
+        Crée une session de conversation isolée (mémoire propre) pour un utilisateur.
+        history ([{"role", "content"}], ordre chronologique) réhydrate la mémoire
+        d'une conversation existante.
+        """
+        memory = get_memory(llm=self.llm)
+        if history:
+            messages = [
+                HumanMessage(content=message["content"]) if message["role"] == "user" else AIMessage(content=message["content"])
+                for message in history
+            ]
+            if isinstance(memory, BudgetedSummaryMemory):
+                # Même budget de tokens et même résumé que pour une conversation en cours
+                memory.load_history(messages)
+            else:
+                memory.chat_memory.add_messages(messages)
+        session = AgentSession(
+            self._create_executor(memory, user_id=user_id),
+            user_id=user_id,
+            response_cache=self.response_cache,
+            cache_context=self._cache_context,
+            on_exchange=on_exchange
+        )
+        if history:
+            session.history_last_id = history[-1].get("id")
+        return session
     
     def run(self, input_text: str) -> str:
         """
-        Exécute une requête avec l'agent
+        Exécute une requête avec l'agent (réponse servie depuis le cache si possible)
         """
-        try:
-            response = self.agent.run(input=input_text)
-            return response
-        except Exception as e:
-            return f"Erreur lors de l'exécution: {str(e)}"
+        return self._default_session.run(input_text)
     
     def chat(self, message: str) -> str:
         """
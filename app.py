@@ -1,12 +1,28 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, UploadFile, File
 from pydantic import BaseModel
 from typing import Optional
+import asyncio
 import os
 from dotenv import load_dotenv
-from agent import GeminiAgent
+from services.worker_pool import AgentWorkerPool, PoolSaturatedError
+from services.session_manager import SessionManager
+from services.streaming import format_sse
+from memory.history_store import get_history_store, DEFAULT_CONVERSATION
+from services.token_verifier import TokenVerifier
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
-import requests # Ajouté pour les appels HTTP
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+import httpx
+import time
+from services.http_client import request_with_retries, close_http_client
+from services import tracing
+from services.components import ComponentRegistry
+from services.llm_gateway import get_llm_gateway
+from services.document_jobs import (
+    DOC_UPLOAD_MAX_MB, DocumentJobQueue, DocumentJobStore, JobQueueFullError, UploadTooLargeError, new_job_id,
+    save_upload, upload_path
+)
+from services.request_limits import BodySizeLimitMiddleware, MULTIPART_OVERHEAD_BYTES
 
 import firebase_admin
 from firebase_admin import credentials, auth
@@ -16,6 +32,9 @@ load_dotenv()
 
 app = FastAPI(title="LangChain Gemini Agent API", version="1.0.0")
 
+# Logs structurés (JSON) : une ligne par requête avec son identifiant et ses spans
+tracing.configure_logging()
+
 # Configuration CORS
 app.add_middleware(
     CORSMiddleware,
@@ -36,6 +55,12 @@ except Exception as e:
     print(f"❌ Erreur lors de l'initialisation de Firebase Admin SDK: {e}")
     # Gérer l'erreur, par exemple en arrêtant l'application ou en logant gravement.
 
+# Vérification locale et mise en cache des ID tokens (à défaut : firebase_admin à chaque requête)
+# (clés chargées au démarrage ; en attendant, et si elles sont injoignables, Firebase Admin SDK vérifie les jetons)
+token_verifier = TokenVerifier.from_env(FIREBASE_SERVICE_ACCOUNT_PATH, fallback_verifier=auth.verify_id_token)
+if token_verifier is None:
+    print("⚠️ FIREBASE_PROJECT_ID inconnu : vérification des jetons sans cache via Firebase Admin SDK")
+
 # --- Modèles Pydantic pour l'authentification ---
 class UserCredentials(BaseModel):
     email: str
@@ -49,18 +74,167 @@ class AuthResponse(BaseModel):
 # --- Modèles Pydantic pour le Chat ---
 class ChatRequest(BaseModel):
     message: str
+    conversation_id: str = DEFAULT_CONVERSATION
 
 class ChatResponse(BaseModel):
     response: str
     status: str = "success"
+    history_tokens: Optional[int] = None # Tokens d'historique envoyés au LLM
 
-# Initialisation de l'agent Gemini
-try:
-    agent = GeminiAgent()
-    print("Agent Gemini initialisé avec succès")
-except Exception as e:
-    print(f"Erreur lors de l'initialisation de l'agent: {e}")
-    agent = None
+# --- Composants lourds : construits au premier usage, ou préchauffés en arrière-plan au démarrage ---
+# Le serveur accepte le trafic léger (connexion, historique, /health) en quelques secondes ;
+# /ready indique quand l'agent peut répondre sans temps de chargement.
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_COMPONENTS = [name.strip() for name in os.getenv("WARMUP_COMPONENTS", "agent,tools,embeddings").split(",") if name.strip()]
+READY_COMPONENTS = [name.strip() for name in os.getenv("READY_COMPONENTS", "agent").split(",") if name.strip()]
+
+def create_agent():
+    # Import différé : LangChain, client Gemini et outils ne sont chargés qu'à la construction
+    from agent import GeminiAgent
+    return GeminiAgent()
+
+def warm_up_tools():
+    agent = components.get("agent")
+    agent.warm_up_tools()
+    return agent.tools_status()
+
+def warm_up_embeddings():
+    # Chargement du modèle sentence-transformers (recherche documentaire, cache sémantique)
+    from retriever.embeddings import get_embeddings
+    embeddings = get_embeddings()
+    embeddings.model
+    return embeddings
+
+# Tâches d'indexation des documents envoyés (/documents) : suivi léger, sans charger le registre
+document_job_store = DocumentJobStore()
+
+def invalidate_user_responses(uid: str, entry: dict):
+    # Les réponses en cache de l'utilisateur ignorent le document qui vient d'être indexé
+    agent = get_agent()
+    if agent is not None and agent.response_cache is not None:
+        agent.response_cache.invalidate_user(uid)
+
+def create_document_jobs():
+    # Registre partagé avec DocReaderTool : le document indexé est aussitôt interrogeable par l'agent
+    from tools.doc_reader import get_document_registry
+    return DocumentJobQueue.from_env(get_document_registry(), document_job_store, on_indexed=invalidate_user_responses)
+
+components = ComponentRegistry()
+components.register("agent", create_agent)
+components.register("tools", warm_up_tools)
+components.register("embeddings", warm_up_embeddings)
+components.register("documents", create_document_jobs)
+
+def get_agent():
+    """Agent Gemini s'il est construit, sans déclencher sa construction (sinon None)"""
+    return components.get("agent") if components["agent"].ready else None
+
+async def require_agent():
+    """Agent Gemini, construit hors de la boucle d'événements s'il ne l'est pas encore"""
+    try:
+        return await components.get_async("agent")
+    except Exception as e:
+        print(f"Erreur lors de l'initialisation de l'agent: {e}")
+        raise HTTPException(status_code=500, detail=f"Agent non initialisé: {e}")
+
+# Historique persistant des conversations : toute réplique de l'API peut reprendre une conversation
+history_store = get_history_store()
+HISTORY_REHYDRATE_MESSAGES = int(os.getenv("HISTORY_REHYDRATE_MESSAGES", "20"))
+
+def create_conversation_session(key):
+    """Session d'une conversation (uid, conversation_id), réhydratée depuis l'historique persistant"""
+    uid, conversation_id = key
+    history = history_store.read(uid, conversation_id, limit=HISTORY_REHYDRATE_MESSAGES)
+    return components.get("agent").create_session(
+        user_id=uid,
+        history=history,
+        on_exchange=lambda question, answer: history_store.append(
+            uid, conversation_id, [("user", question), ("assistant", answer)]
+        )
+    )
+
+# Sessions par conversation : le LLM et les outils sont partagés, la mémoire est propre à chaque conversation
+sessions = SessionManager.from_env(create_conversation_session)
+
+def get_session(uid: str, conversation_id: str):
+    """
+    Session de la conversation, recréée si une autre réplique l'a fait avancer
+    depuis (le dernier message persisté n'est plus celui connu de la session)
+    """
+    key = (uid, conversation_id)
+    session = sessions.get(key)
+    if session.history_last_id != history_store.last_id(uid, conversation_id):
+        sessions.drop(key)
+        session = sessions.get(key)
+    return session
+
+# Pool de threads borné : l'agent est synchrone, on ne l'exécute jamais sur la boucle d'événements
+worker_pool = AgentWorkerPool.from_env()
+
+tracing.METRICS.gauge("agent_requests_in_flight", "Requêtes de l'agent en cours ou en attente", lambda: worker_pool.in_flight)
+tracing.METRICS.gauge("agent_sessions_active", "Conversations gardées en mémoire", lambda: sessions.stats()["active_sessions"])
+
+# Envois de documents trop volumineux refusés avant d'être écrits sur disque (fichier temporaire de Starlette)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    path="/documents",
+    max_bytes=int(DOC_UPLOAD_MAX_MB * 1024 * 1024) + MULTIPART_OVERHEAD_BYTES,
+    detail=f"fichier trop volumineux (maximum {DOC_UPLOAD_MAX_MB:g} Mo)",
+)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Trace de chaque requête : identifiant (en-tête X-Request-ID, repris du client s'il
+    est fourni), métriques HTTP et log JSON récapitulatif (appels LLM, outils, caches)
+    """
+    trace, token = tracing.start_trace(request.headers.get("X-Request-ID"))
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = trace.request_id
+        return response
+    finally:
+        # Gabarit de la route (ex : /history) plutôt que le chemin : nombre de séries borné
+        route = getattr(request.scope.get("route"), "path", "non_routee")
+        trace.route = route
+        duration = time.perf_counter() - start
+        tracing.HTTP_REQUESTS.inc(route=route, method=request.method, status=status)
+        tracing.HTTP_DURATION.observe(duration, route=route)
+        if route != "/metrics":
+            tracing.log_event("request", method=request.method, route=route, status=status, **trace.summary())
+        tracing.end_trace(token)
+
+@app.on_event("startup")
+async def start_token_verifier():
+    if token_verifier is None:
+        return
+    try:
+        await asyncio.to_thread(token_verifier.start)
+        print("✅ Clés publiques Firebase chargées")
+    except Exception as e:
+        print(f"❌ Chargement des clés publiques Firebase impossible ({e}) : "
+              "vérification via Firebase Admin SDK jusqu'au prochain rafraîchissement réussi")
+
+@app.on_event("startup")
+async def start_warmup():
+    names = WARMUP_COMPONENTS if WARMUP_ENABLED else []
+    # Indexations interrompues par l'arrêt précédent : reprises sans attendre un nouvel envoi
+    if await asyncio.to_thread(document_job_store.count_pending):
+        names = [*names, "documents"]
+    if names:
+        components.warm_up(names)
+
+@app.on_event("shutdown")
+async def shutdown_worker_pool():
+    worker_pool.shutdown()
+    if components["documents"].ready:
+        components.get("documents").shutdown()
+    if token_verifier is not None:
+        token_verifier.stop()
+    await close_http_client()
 
 # --- DEPENDENCY POUR L'AUTHENTIFICATION FIREBASE ---
 async def get_current_user(request: Request):
@@ -74,8 +248,12 @@ async def get_current_user(request: Request):
         raise HTTPException(status_code=401, detail="Format de jeton invalide (doit être 'Bearer <token>')")
 
     try:
-        # Firebase vérifie la signature et l'expiration du token.
-        decoded_token = auth.verify_id_token(id_token)
+        # Vérification de la signature et de l'expiration du token (en cache jusqu'à son expiration)
+        with tracing.span("auth", method="local" if token_verifier is not None else "firebase"):
+            if token_verifier is not None:
+                decoded_token = token_verifier.verify(id_token)
+            else:
+                decoded_token = auth.verify_id_token(id_token)
         uid = decoded_token['uid']
         return uid
     except Exception as e:
@@ -87,9 +265,10 @@ async def get_current_user(request: Request):
 async def signup(credentials: UserCredentials):
     try:
         # Création de l'utilisateur via Firebase Admin SDK
-        user = auth.create_user(email=credentials.email, password=credentials.password)
+        # Appels bloquants du SDK Admin exécutés hors de la boucle d'événements
+        user = await asyncio.to_thread(auth.create_user, email=credentials.email, password=credentials.password)
         # Après création, on peut générer un jeton personnalisé que le client pourra échanger
-        custom_token = auth.create_custom_token(user.uid).decode('utf-8')
+        custom_token = (await asyncio.to_thread(auth.create_custom_token, user.uid)).decode('utf-8')
         
         return AuthResponse(
             status="success", 
@@ -125,8 +304,9 @@ async def login(credentials: UserCredentials):
             "returnSecureToken": True
         }
         
-        # Appel sécurisé à l'API REST de Firebase Auth
-        rest_response = requests.post(rest_api_url, json=payload)
+        # Appel sécurisé à l'API REST de Firebase Auth (client asynchrone partagé : la boucle
+        # d'événements n'est pas bloquée et les connexions TLS sont réutilisées)
+        rest_response = await request_with_retries("POST", rest_api_url, json=payload)
         rest_response.raise_for_status() # Lève une exception pour les codes d'erreur HTTP (400, 401, etc.)
 
         response_data = rest_response.json()
@@ -141,7 +321,7 @@ async def login(credentials: UserCredentials):
         else:
             raise HTTPException(status_code=500, detail="Erreur: Impossible d'obtenir le jeton d'authentification.")
 
-    except requests.exceptions.HTTPError as http_err:
+    except httpx.HTTPStatusError as http_err:
         error_msg = http_err.response.json().get("error", {}).get("message", "Erreur inconnue")
         # Gérer les erreurs spécifiques de connexion (mauvais mot de passe, utilisateur non trouvé)
         if "EMAIL_NOT_FOUND" in error_msg or "INVALID_LOGIN_CREDENTIALS" in error_msg:
@@ -157,23 +337,190 @@ async def login(credentials: UserCredentials):
 async def root():
     return {"message": "LangChain Gemini Agent API is running"}
 
+# Disponibilité : 200 quand les composants requis (READY_COMPONENTS) sont construits, 503 sinon.
+# /health reste un simple test de vie (le processus répond).
+@app.get("/ready")
+async def readiness():
+    agent = get_agent()
+    is_ready = components.ready(READY_COMPONENTS)
+    body = {
+        "ready": is_ready,
+        "uptime_seconds": round(time.monotonic() - components.started_at, 1),
+        "components": components.status(),
+        "tools": agent.tools_status() if agent else None,
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+# Métriques au format texte Prometheus
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(tracing.METRICS.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "agent_loaded": agent is not None}
+    agent = get_agent()
+    response_cache = agent.response_cache.stats() if agent and agent.response_cache is not None else None
+    return {
+        "status": "healthy",
+        "agent_loaded": agent is not None,
+        "workers": worker_pool.stats(),
+        "sessions": sessions.stats(),
+        "response_cache": response_cache,
+        "auth": token_verifier.stats() if token_verifier is not None else None,
+        "llm_gateway": get_llm_gateway().stats(),
+        "document_jobs": {"pending": await asyncio.to_thread(document_job_store.count_pending)}
+    }
 
 # La route /chat est protégée par l'authentification
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest, current_user: str = Depends(get_current_user)):
     print(f"Requête chat de l'utilisateur: {current_user}")
-    
-    if not agent:
-        raise HTTPException(status_code=500, detail="Agent non initialisé")
-    
+    await require_agent()
+
     try:
-        response = agent.run(request.message)
-        return ChatResponse(response=response)
+        # Lecture SQLite (et réhydratation éventuelle) hors de la boucle d'événements
+        session = await asyncio.to_thread(get_session, current_user, request.conversation_id)
+        response = await worker_pool.run(session.run, request.message)
+        return ChatResponse(response=response, history_tokens=session.history_tokens)
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"L'agent n'a pas répondu en moins de {worker_pool.timeout:.0f} secondes")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors du traitement: {str(e)}")
 
+# Variante streaming de /chat : étapes de l'agent et tokens de la réponse en Server-Sent Events
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, current_user: str = Depends(get_current_user)):
+    await require_agent()
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    trace = tracing.current_trace()
+
+    def emit(event: dict):
+        # Appelé depuis le thread du worker
+        try:
+            loop.call_soon_threadsafe(events.put_nowait, event)
+        except RuntimeError:
+            pass  # Boucle fermée : le client est parti
+
+    session = await asyncio.to_thread(get_session, current_user, request.conversation_id)
+    try:
+        worker_pool.submit_nowait(session.stream, request.message, emit)
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    async def event_source():
+        deadline = loop.time() + worker_pool.timeout
+        while True:
+            try:
+                event = await asyncio.wait_for(events.get(), timeout=max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                tracing.log_event("stream_complete", request_id=trace.request_id, route="/chat/stream",
+                                  outcome="timeout", **trace.summary())
+                yield format_sse({"type": "error", "content": f"L'agent n'a pas répondu en moins de {worker_pool.timeout:.0f} secondes"})
+                return
+            yield format_sse(event)
+            if event["type"] in ("final", "error"):
+                # Le log de la requête part au premier octet : récapitulatif complet en fin de flux
+                tracing.log_event("stream_complete", request_id=trace.request_id, route="/chat/stream",
+                                  outcome=event["type"], **trace.summary())
+                return
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def require_document_jobs() -> DocumentJobQueue:
+    try:
+        return await components.get_async("documents")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Indexation des documents indisponible: {e}")
+
+# Envoi d'un PDF : enregistré puis indexé en arrière-plan par des processus dédiés (la requête
+# répond aussitôt) ; la progression se suit via /documents/jobs/{job_id}
+@app.post("/documents", status_code=202)
+async def upload_document(file: UploadFile = File(...), current_user: str = Depends(get_current_user)):
+    jobs = await require_document_jobs()
+    # Requêtes SQLite (tâches d'indexation) hors de la boucle d'événements
+    if await asyncio.to_thread(jobs.is_full):
+        raise HTTPException(status_code=503, detail="Trop de documents en cours d'indexation", headers={"Retry-After": "30"})
+
+    job_id = new_job_id()
+    path = upload_path(current_user, job_id, file.filename)
+    try:
+        await asyncio.to_thread(save_upload, file.file, path)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=f"Fichier refusé : {e}")
+    finally:
+        await file.close()
+
+    try:
+        return await asyncio.to_thread(jobs.submit, current_user, file.filename or os.path.basename(path), path, job_id)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+# Documents de l'utilisateur (catalogue partagé avec l'outil LectureDoc) et indexations récentes
+@app.get("/documents")
+async def list_documents(current_user: str = Depends(get_current_user)):
+    jobs = await require_document_jobs()
+    return {
+        "documents": await asyncio.to_thread(jobs.registry.list, current_user),
+        "jobs": await asyncio.to_thread(document_job_store.list, current_user),
+    }
+
+@app.get("/documents/jobs")
+async def list_document_jobs(limit: int = 20, current_user: str = Depends(get_current_user)):
+    return {"jobs": await asyncio.to_thread(document_job_store.list, current_user, limit=max(1, min(limit, 100)))}
+
+# Suivi d'une indexation : status (queued, processing, done, failed), pages lues, progress (0 à 1)
+@app.get("/documents/jobs/{job_id}")
+async def get_document_job(job_id: str, current_user: str = Depends(get_current_user)):
+    job = await asyncio.to_thread(document_job_store.get, job_id, uid=current_user)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Tâche inconnue")
+    return job
+
+@app.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str, current_user: str = Depends(get_current_user)):
+    jobs = await require_document_jobs()
+    if not await asyncio.to_thread(jobs.registry.unload, current_user, doc_id):
+        raise HTTPException(status_code=404, detail=f"Document {doc_id} inconnu")
+    invalidate_user_responses(current_user, None)
+    return {"status": "success"}
+
+# Libère la session en mémoire d'une conversation (elle sera réhydratée depuis l'historique)
+@app.delete("/session")
+async def reset_session(conversation_id: str = DEFAULT_CONVERSATION, current_user: str = Depends(get_current_user)):
+    sessions.drop((current_user, conversation_id))
+    return {"status": "success"}
+
+# Historique paginé d'une conversation : passer next_before en paramètre before pour la page précédente
+@app.get("/history")
+async def get_history(conversation_id: str = DEFAULT_CONVERSATION, limit: int = 50, before: Optional[int] = None,
+                      current_user: str = Depends(get_current_user)):
+    limit = max(1, min(limit, 200))
+    messages = await asyncio.to_thread(history_store.read, current_user, conversation_id, limit=limit, before_id=before)
+    next_before = messages[0]["id"] if len(messages) == limit else None
+    return {"conversation_id": conversation_id, "messages": messages, "next_before": next_before}
+
+@app.get("/conversations")
+async def list_conversations(limit: int = 50, current_user: str = Depends(get_current_user)):
+    conversations = await asyncio.to_thread(history_store.conversations, current_user, limit=max(1, min(limit, 200)))
+    return {"conversations": conversations}
+
+# Supprime définitivement une conversation et son historique
+@app.delete("/history")
+async def delete_history(conversation_id: str = DEFAULT_CONVERSATION, current_user: str = Depends(get_current_user)):
+    sessions.drop((current_user, conversation_id))
+    if not await asyncio.to_thread(history_store.delete_conversation, current_user, conversation_id):
+        raise HTTPException(status_code=404, detail="Conversation introuvable")
+    return {"status": "success"}
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
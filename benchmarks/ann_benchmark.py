@@ -0,0 +1,93 @@
+"""
+Banc d'essai des types d'index FAISS (retriever/ann.py) sur un corpus synthétique.
+
+Pour chaque type : temps de construction, recall@k par rapport à la recherche
+exacte, latence p50/p99 d'une requête unitaire et empreinte mémoire de l'index.
+
+    python -m benchmarks.ann_benchmark --vectors 100000 --dim 384 --k 10
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from retriever import ann
+
+def synthetic_corpus(n_vectors: int, dim: int, n_clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """Vecteurs regroupés en clusters gaussiens normalisés (proche d'embeddings de phrases)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, n_clusters, n_vectors)
+    vectors = centers[assignments] + 0.35 * rng.standard_normal((n_vectors, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(row_found) & set(row_truth)) for row_found, row_truth in zip(found, truth))
+    return hits / (len(truth) * k)
+
+def run(config: dict, corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    start = time.perf_counter()
+    faiss_index = ann.build_faiss_index(corpus, config)
+    build_seconds = time.perf_counter() - start
+
+    _, found = faiss_index.search(queries, k)
+
+    # Latence unitaire (cas d'une requête utilisateur), un seul thread
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        faiss_index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "index": ann.factory_string(config),
+        "build_s": build_seconds,
+        "recall": recall_at_k(found, truth),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "memory_mb": faiss.serialize_index(faiss_index).nbytes / 1024 ** 2,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall et latence des types d'index FAISS")
+    parser.add_argument("--vectors", type=int, default=50000, help="Taille du corpus synthétique")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension (384 : all-MiniLM-L6-v2)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", choices=list(ann.INDEX_TYPES), default=list(ann.INDEX_TYPES))
+    parser.add_argument("--nprobe", type=int, nargs="+", default=None, help="Valeurs de nprobe à comparer (IVF)")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    corpus = synthetic_corpus(args.vectors, args.dim)
+    queries = synthetic_corpus(args.queries, args.dim, seed=1)
+
+    # Vérité terrain : recherche exacte
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(corpus)
+    _, truth = exact.search(queries, args.k)
+
+    configs = []
+    for index_type in args.types:
+        if args.nprobe and "nprobe" in ann.INDEX_TYPES[index_type]:
+            configs.extend(ann.index_config(index_type, nprobe=nprobe) for nprobe in args.nprobe)
+        else:
+            configs.append(ann.index_config(index_type))
+
+    print(f"Corpus : {args.vectors} vecteurs de dimension {args.dim}, {args.queries} requêtes, k={args.k}")
+    print(f"{'index':<22}{'nprobe':>8}{'build (s)':>11}{f'recall@{args.k}':>11}{'p50 (ms)':>10}{'p99 (ms)':>10}{'mémoire (Mo)':>14}")
+    for config in configs:
+        if args.vectors < ann.min_training_size(config):
+            print(f"{ann.factory_string(config):<22} ignoré : {ann.min_training_size(config)} vecteurs requis pour l'entraînement")
+            continue
+        result = run(config, corpus, queries, truth, args.k)
+        print(
+            f"{result['index']:<22}{config.get('nprobe', '-'):>8}{result['build_s']:>11.2f}{result['recall']:>11.3f}"
+            f"{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}{result['memory_mb']:>14.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Banc d'essai de la passerelle LLM (services/llm_gateway.py) contre un fournisseur simulé
+(ScriptedChatModel : erreurs 429/503 et réponses lentes en proportion configurable).
+
+Compare, pour la même charge (appelants simultanés) :
+- direct : appels au modèle sans passerelle (les erreurs remontent)
+- passerelle : concurrence plafonnée, débit limité, relances
+- passerelle + hedging : requête dupliquée au-delà du p95 observé
+et, avec --fallback, la bascule vers un modèle de secours.
+
+    python -m benchmarks.llm_gateway_benchmark --callers 32 --calls 10 --error-rate 0.1 --slow-rate 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.offline import ScriptedChatModel
+from services.llm_gateway import GatewayChatModel, LLMGateway
+
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+def run_scenario(model, args) -> dict:
+    latencies, errors = [], {}
+    lock = threading.Lock()
+
+    def caller(index: int):
+        for call in range(args.calls):
+            start = time.perf_counter()
+            try:
+                model.invoke([HumanMessage(content=f"Appelant {index}, question {call}")])
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                with lock:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.callers) as pool:
+        list(pool.map(caller, range(args.callers)))
+    duration = time.perf_counter() - start
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    gateway = getattr(model, "gateway", None)
+    return {
+        "calls": args.callers * args.calls,
+        "duration_s": round(duration, 2),
+        "succeeded": len(latencies),
+        "errors": errors,
+        "latency_ms": {"p50": ms(percentile(latencies, 0.50)), "p95": ms(percentile(latencies, 0.95)),
+                       "p99": ms(percentile(latencies, 0.99)), "max": ms(max(latencies, default=None))},
+        "gateway": gateway.stats() if gateway is not None else None,
+    }
+
+def print_scenario(name: str, result: dict):
+    latency = result["latency_ms"]
+    print(f"\n{name}")
+    print(f"  {result['succeeded']}/{result['calls']} réussis en {result['duration_s']} s, erreurs : {result['errors'] or 'aucune'}")
+    print(f"  Latence (ms) : p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    stats = result["gateway"]
+    if stats:
+        print(f"  Tentatives {stats['attempts']}, relances {stats['retries']}, requêtes dupliquées {stats['hedges']} "
+              f"(gagnantes {stats['hedge_wins']}), bascules {stats['fallbacks']}, rejets {stats['rejected']}, "
+              f"échecs {stats['failures']}, attente moyenne {stats['avg_queue_seconds'] * 1000:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", type=int, default=32, help="Appelants simultanés")
+    parser.add_argument("--calls", type=int, default=10, help="Appels par appelant")
+    parser.add_argument("--latency", type=float, default=0.3, help="Latence moyenne du fournisseur simulé (s)")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.1, help="Part des appels en erreur 429/503")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Part des appels lents")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="Latence d'un appel lent (s)")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM_MAX_CONCURRENCY")
+    parser.add_argument("--rpm", type=float, default=0, help="LLM_REQUESTS_PER_MINUTE (0 : illimité)")
+    parser.add_argument("--retries", type=int, default=3, help="LLM_MAX_RETRIES")
+    parser.add_argument("--backoff", type=float, default=0.1, help="LLM_RETRY_BACKOFF_SECONDS")
+    parser.add_argument("--hedge-min", type=float, default=0.3, help="LLM_HEDGE_MIN_SECONDS")
+    parser.add_argument("--queue-timeout", type=float, default=60.0, help="LLM_QUEUE_TIMEOUT_SECONDS")
+    parser.add_argument("--fallback", action="store_true", help="Ajoute un modèle de secours sans erreur")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+    args = parser.parse_args()
+
+    def provider(name: str = "simule", error_rate: float = args.error_rate):
+        return ScriptedChatModel(model=name, latency=args.latency, jitter=args.jitter, seed=args.seed,
+                                 error_rate=error_rate, slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+
+    def gateway(hedge: bool):
+        return LLMGateway(max_concurrency=args.concurrency, requests_per_minute=args.rpm, queue_timeout=args.queue_timeout,
+                          max_retries=args.retries, backoff=args.backoff, hedge=hedge, hedge_min_delay=args.hedge_min)
+
+    fallback = provider("simule-secours", error_rate=0.0) if args.fallback else None
+    scenarios = {
+        "direct": provider(),
+        "passerelle": GatewayChatModel(primary=provider(), fallback=fallback, gateway=gateway(hedge=False)),
+        "passerelle + hedging": GatewayChatModel(primary=provider(), fallback=fallback, gateway=gateway(hedge=True)),
+    }
+    results = {}
+    for name, model in scenarios.items():
+        random.seed(args.seed)
+        results[name] = run_scenario(model, args)
+        print_scenario(name, results[name])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Banc de charge hors ligne du pipeline /chat : l'application FastAPI (app.py) est pilotée
+en processus par N utilisateurs simulés simultanés, avec des substituts locaux de Gemini,
+DuckDuckGo et Firebase (benchmarks/offline.py). Aucun appel réseau.
+
+Rapporte le débit (requêtes/s), les latences p50/p95/p99, les codes de réponse,
+la répartition du temps par étape (LLM, outils, authentification, caches ; d'après
+les traces de services/tracing.py) et l'évolution de la mémoire du processus.
+
+    python -m benchmarks.load_test --users 50 --turns 5 --llm-latency 0.5
+    python -m benchmarks.load_test --users 20 --agent-mode tools --stream --json resultats.json
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import importlib
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+def rss_mb() -> float:
+    """Mémoire résidente actuelle du processus (Mo)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        # Hors Linux : pic de mémoire résidente
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+def configure_environment(args, data_dir: str):
+    """Variables lues à l'import de l'application : à définir avant d'importer app"""
+    os.environ.update({
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY") or "offline",
+        # Ni projet Firebase ni compte de service : le vérificateur local est installé ensuite
+        "FIREBASE_PROJECT_ID": "",
+        "FIREBASE_SERVICE_ACCOUNT_PATH": os.path.join(data_dir, "absent.json"),
+        "WARMUP_ENABLED": "false",
+        "AGENT_MODE": args.agent_mode,
+        "AGENT_MAX_WORKERS": str(args.workers),
+        "AGENT_MAX_QUEUE": str(args.queue),
+        "AGENT_TIMEOUT_SECONDS": str(args.timeout),
+        "RESPONSE_CACHE_ENABLED": "true" if args.response_cache else "false",
+        # Le niveau sémantique chargerait le modèle d'embedding
+        "RESPONSE_CACHE_SEMANTIC": "false",
+        "HISTORY_DB_PATH": os.path.join(data_dir, "chat_history.sqlite3"),
+        "TODO_DB_PATH": os.path.join(data_dir, "todo.sqlite3"),
+        "SEARCH_CACHE_PATH": os.path.join(data_dir, "search_cache.sqlite3"),
+        "EMBEDDING_CACHE_PATH": os.path.join(data_dir, "embedding_cache.sqlite3"),
+        "DOC_CACHE_DIR": os.path.join(data_dir, "doc_cache"),
+        # Passerelle LLM (--gateway)
+        "LLM_MAX_CONCURRENCY": str(args.llm_concurrency),
+        "LLM_REQUESTS_PER_MINUTE": str(args.llm_rpm),
+        "LLM_HEDGE_ENABLED": "true" if args.hedge else "false",
+    })
+
+
+class TraceCollector(logging.Handler):
+    """Récupère les récapitulatifs de requêtes émis par le middleware de traçage"""
+
+    def __init__(self):
+        super().__init__()
+        self.summaries = []
+
+    def emit(self, record):
+        fields = getattr(record, "fields", {})
+        # /chat : log de fin de requête ; /chat/stream : log de fin de flux (celui de la requête part au premier octet)
+        event, route = record.getMessage(), fields.get("route")
+        if (event, route) in (("request", "/chat"), ("stream_complete", "/chat/stream")):
+            self.summaries.append(fields)
+
+    def stage_breakdown(self) -> dict:
+        """Durées cumulées par étape : {étape: {count, mean_ms, p95_ms, total_s}}"""
+        durations = {}
+        for summary in self.summaries:
+            for span in summary.get("spans", []):
+                stage = span["name"]
+                if stage == "tool":
+                    stage = f"tool:{span.get('tool')}"
+                durations.setdefault(stage, []).append(span["duration_ms"])
+        return {
+            stage: {
+                "count": len(values),
+                "mean_ms": round(statistics.fmean(values), 1),
+                "p95_ms": round(percentile(values, 0.95), 1),
+                "total_s": round(sum(values) / 1000, 2),
+            }
+            for stage, values in sorted(durations.items())
+        }
+
+
+async def simulate_user(client, user_index: int, token: str, args, results: list, message_for):
+    headers = {"Authorization": f"Bearer {token}"}
+    conversation_id = f"bench-{user_index}"
+    # Arrivées étalées sur la durée de montée en charge
+    await asyncio.sleep(args.ramp_up * user_index / max(args.users, 1))
+    for turn in range(args.turns):
+        payload = {"message": message_for(user_index, turn, args.tool_ratio, args.seed), "conversation_id": conversation_id}
+        start = time.perf_counter()
+        try:
+            if args.stream:
+                # Le transport ASGI de httpx met la réponse en mémoire : latence jusqu'à la fin du flux
+                async with client.stream("POST", "/chat/stream", json=payload, headers=headers) as response:
+                    status = response.status_code
+                    await response.aread()
+            else:
+                response = await client.post("/chat", json=payload, headers=headers)
+                status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        results.append({"latency": time.perf_counter() - start, "status": status})
+        if args.think_time:
+            await asyncio.sleep(args.think_time)
+
+async def sample_memory(samples: list, stop: asyncio.Event, interval: float = 0.5):
+    while not stop.is_set():
+        samples.append(rss_mb())
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+async def run(args) -> dict:
+    import httpx
+
+    data_dir = tempfile.mkdtemp(prefix="load_test_")
+    configure_environment(args, data_dir)
+
+    from benchmarks.offline import LocalTokenIssuer, ScriptedChatModel, message_for, offline_search_tool_class
+    from services.llm_gateway import GatewayChatModel, get_llm_gateway
+    app_module = importlib.import_module("app")
+    from agent import GeminiAgent
+    from services import tracing
+    from tools.calculator_tool import CalculatorTool
+    from tools.todo_tool import TodoTool
+
+    # Logs JSON remplacés par la collecte des traces
+    collector = TraceCollector()
+    tracing.logger.handlers = [collector]
+    tracing.logger.setLevel(logging.INFO)
+
+    # Substituts : authentification locale, LLM scripté, recherche hors ligne
+    issuer = LocalTokenIssuer()
+    app_module.token_verifier = issuer.verifier()
+    llm = ScriptedChatModel(latency=args.llm_latency, jitter=args.llm_jitter, seed=args.seed,
+                            error_rate=args.llm_error_rate, slow_rate=args.llm_slow_rate)
+    if args.gateway:
+        llm = GatewayChatModel(primary=llm, gateway=get_llm_gateway())
+    tool_classes = (TodoTool, offline_search_tool_class(args.search_latency), CalculatorTool)
+    app_module.components.register("agent", lambda: GeminiAgent(llm=llm, tool_classes=tool_classes))
+    app_module.components.get("agent")
+
+    tokens = [issuer.token(f"bench-user-{index}") for index in range(args.users)]
+    results = []
+    memory_samples = []
+    stop_sampling = asyncio.Event()
+
+    gc.collect()
+    rss_start = rss_mb()
+    if args.tracemalloc:
+        tracemalloc.start(10)
+        snapshot_start = tracemalloc.take_snapshot()
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=args.timeout + 30, limits=limits) as client:
+        sampler = asyncio.create_task(sample_memory(memory_samples, stop_sampling))
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            simulate_user(client, index, tokens[index], args, results, message_for)
+            for index in range(args.users)
+        ))
+        elapsed = time.perf_counter() - start
+        stop_sampling.set()
+        await sampler
+
+    # Les résumés de mémoire se terminent en arrière-plan : courte attente avant la mesure finale
+    await asyncio.sleep(1)
+    gc.collect()
+    rss_end = rss_mb()
+
+    top_allocations = []
+    if args.tracemalloc:
+        snapshot_end = tracemalloc.take_snapshot()
+        for stat in snapshot_end.compare_to(snapshot_start, "lineno")[:10]:
+            top_allocations.append(f"{stat.size_diff / 1024:+.0f} Ko  {stat.traceback[0]}")
+        tracemalloc.stop()
+
+    app_module.worker_pool.shutdown()
+
+    latencies = [r["latency"] for r in results if r["status"] == 200]
+    statuses = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "verbose")},
+        "requests": len(results),
+        "duration_s": round(elapsed, 2),
+        "requests_per_s": round(len(results) / elapsed, 2) if elapsed else None,
+        "statuses": statuses,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "max": ms(max(latencies)) if latencies else None,
+        },
+        "stages": collector.stage_breakdown(),
+        "llm_calls_per_request": round(sum(s.get("llm_calls", 0) for s in collector.summaries) / max(len(collector.summaries), 1), 2),
+        "memory_mb": {
+            "start": round(rss_start, 1),
+            "peak": round(max(memory_samples + [rss_end]), 1),
+            "end": round(rss_end, 1),
+            "growth_per_1000_requests": round((rss_end - rss_start) / max(len(results), 1) * 1000, 1),
+        },
+        "sessions": app_module.sessions.stats(),
+        "top_allocations": top_allocations,
+        "llm_gateway": get_llm_gateway().stats() if args.gateway else None,
+    }
+
+def print_report(report: dict):
+    print(f"\n{report['requests']} requêtes en {report['duration_s']} s : {report['requests_per_s']} req/s")
+    print(f"Codes de réponse : {report['statuses']}")
+    latency = report["latency_ms"]
+    print(f"Latence (ms) : p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"Appels LLM par requête : {report['llm_calls_per_request']}")
+    print("\nÉtape                       appels   moyenne (ms)   p95 (ms)   total (s)")
+    for stage, values in report["stages"].items():
+        print(f"{stage:<27} {values['count']:>6}   {values['mean_ms']:>12}   {values['p95_ms']:>8}   {values['total_s']:>9}")
+    memory = report["memory_mb"]
+    print(f"\nMémoire (Mo) : début {memory['start']}, pic {memory['peak']}, fin {memory['end']} "
+          f"({memory['growth_per_1000_requests']:+} Mo / 1000 requêtes)")
+    print(f"Sessions en mémoire : {report['sessions']['active_sessions']}")
+    for line in report["top_allocations"]:
+        print(f"    {line}")
+    gateway = report["llm_gateway"]
+    if gateway:
+        print(f"Passerelle LLM : {gateway['attempts']} tentatives, {gateway['retries']} relances, "
+              f"{gateway['hedges']} requêtes dupliquées ({gateway['hedge_wins']} gagnantes), {gateway['rejected']} rejets, "
+              f"attente moyenne {gateway['avg_queue_seconds'] * 1000:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="Utilisateurs simulés simultanés")
+    parser.add_argument("--turns", type=int, default=5, help="Messages envoyés par utilisateur (une conversation chacun)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pause entre deux messages d'un utilisateur (s)")
+    parser.add_argument("--ramp-up", type=float, default=1.0, help="Durée d'arrivée des utilisateurs (s)")
+    parser.add_argument("--tool-ratio", type=float, default=0.5, help="Part des questions qui sollicitent des outils")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Latence moyenne d'un appel LLM simulé (s)")
+    parser.add_argument("--llm-jitter", type=float, default=0.1, help="Variation de la latence LLM (s)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Part des appels LLM en erreur 429/503")
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0, help="Part des appels LLM lents (5 s)")
+    parser.add_argument("--gateway", action="store_true", help="Appels LLM via la passerelle (services/llm_gateway.py)")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="LLM_MAX_CONCURRENCY (avec --gateway)")
+    parser.add_argument("--llm-rpm", type=float, default=0, help="LLM_REQUESTS_PER_MINUTE (avec --gateway, 0 : illimité)")
+    parser.add_argument("--hedge", action="store_true", help="LLM_HEDGE_ENABLED (avec --gateway)")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="Latence d'une recherche web simulée (s)")
+    parser.add_argument("--agent-mode", choices=("react", "tools"), default="react")
+    parser.add_argument("--workers", type=int, default=4, help="AGENT_MAX_WORKERS")
+    parser.add_argument("--queue", type=int, default=16, help="AGENT_MAX_QUEUE")
+    parser.add_argument("--timeout", type=float, default=120.0, help="AGENT_TIMEOUT_SECONDS")
+    parser.add_argument("--stream", action="store_true", help="Utilise /chat/stream au lieu de /chat")
+    parser.add_argument("--response-cache", action="store_true", help="Active le cache de réponses (niveau exact)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Allocations Python ayant le plus grossi")
+    parser.add_argument("--verbose", action="store_true", help="Affiche la sortie de l'agent et de l'API")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Écrit le rapport dans ce fichier (comparaison entre versions)")
+    args = parser.parse_args()
+
+    # Les exécuteurs de l'agent sont verbeux (chaîne ReAct sur la sortie standard)
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
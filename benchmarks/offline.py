@@ -0,0 +1,193 @@
+"""
+Substituts locaux et déterministes des services externes, pour les bancs d'essai hors ligne :
+
+- ScriptedChatModel remplace ChatGoogleGenerativeAI : latence configurable, sorties
+  ReAct (JSON) ou appels de fonctions scriptés d'après la question ; erreurs 429/503
+  et réponses lentes simulées pour éprouver la passerelle LLM (services/llm_gateway.py)
+- OfflineSearch remplace DuckDuckGo (latence configurable, résultat dérivé de la requête)
+- LocalTokenIssuer signe des ID tokens RS256 vérifiés par TokenVerifier sans Firebase
+
+Les questions générées par message_for() déclenchent un chemin précis de l'agent :
+réponse directe, calcul, recherche web, ou recherche + calcul.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from services.token_verifier import TokenVerifier
+from tools.search_tool import SearchTool
+
+SEARCH_PATTERN = re.compile(r"recherche\s+«([^»]+)»")
+CALCULATION_PATTERN = re.compile(r"calcule\s+«([^»]+)»")
+
+def message_for(user_index: int, turn: int, tool_ratio: float = 0.5, seed: int = 0) -> str:
+    """Question déterministe d'un utilisateur simulé : une part tool_ratio sollicite des outils"""
+    rng = random.Random(f"{seed}-{user_index}-{turn}")
+    topic = f"sujet {rng.randrange(10_000)}"
+    calculation = f"{rng.randrange(1, 999)} * {rng.randrange(1, 999)}"
+    if rng.random() >= tool_ratio:
+        return f"Utilisateur {user_index}, tour {turn} : que penses-tu du {topic} ?"
+    kind = rng.choice(("search", "calculation", "both"))
+    if kind == "search":
+        return f"Utilisateur {user_index}, tour {turn} : recherche «{topic}»"
+    if kind == "calculation":
+        return f"Utilisateur {user_index}, tour {turn} : calcule «{calculation}»"
+    return f"Utilisateur {user_index}, tour {turn} : recherche «{topic}» puis calcule «{calculation}»"
+
+
+class ProviderError(Exception):
+    """Erreur simulée du fournisseur, avec son code HTTP (comme google.api_core)"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Modèle de chat simulé. Le dernier message utilisateur détermine la réponse :
+    appel de RechercheWeb et/ou Calculator s'il en contient la demande, puis réponse
+    finale une fois les résultats des outils reçus. Compatible avec l'agent ReAct
+    (blocs JSON) et avec l'agent à appel de fonctions (bind_tools).
+    """
+    latency: float = 0.5
+    jitter: float = 0.1
+    temperature: float = 0.0
+    seed: int = 0
+    tool_calling: bool = False
+    # Part des appels en erreur (429 ou 503) et des appels lents (latence slow_latency)
+    error_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 5.0
+    model: str = "scripted"
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tool_calling": True})
+
+    def _sleep(self, prompt: str):
+        rng = random.Random(f"{self.seed}-{prompt}")
+        latency = self.latency + rng.uniform(-self.jitter, self.jitter)
+        # Pannes et lenteurs tirées à chaque appel : une nouvelle tentative peut réussir
+        if self.slow_rate and random.random() < self.slow_rate:
+            latency = self.slow_latency
+        if self.error_rate and random.random() < self.error_rate:
+            time.sleep(max(0.0, latency) / 4)
+            code = random.choice((429, 503))
+            raise ProviderError(code, "Quota dépassé" if code == 429 else "Service indisponible")
+        time.sleep(max(0.0, latency))
+
+    @staticmethod
+    def _requested_tools(text: str) -> list:
+        calls = []
+        match = SEARCH_PATTERN.search(text)
+        if match:
+            calls.append(("RechercheWeb", match.group(1)))
+        match = CALCULATION_PATTERN.search(text)
+        if match:
+            calls.append(("Calculator", match.group(1)))
+        return calls
+
+    def _react_output(self, messages) -> str:
+        last = str(messages[-1].content)
+        if last.startswith("TOOL RESPONSE"):
+            observation = last.split("---------------------", 1)[-1].split("USER'S INPUT", 1)[0].strip()
+            action = {"action": "Final Answer", "action_input": f"D'après mes recherches : {observation[:200]}"}
+        else:
+            calls = self._requested_tools(last)
+            if calls:
+                action = {"action": calls[0][0], "action_input": calls[0][1]}
+            else:
+                action = {"action": "Final Answer", "action_input": "Réponse simulée : voici mon avis sur la question."}
+        return f"```json\n{json.dumps(action, ensure_ascii=False)}\n```"
+
+    def _tool_calling_output(self, messages) -> AIMessage:
+        if isinstance(messages[-1], ToolMessage):
+            observations = [str(m.content)[:100] for m in messages if isinstance(m, ToolMessage)]
+            return AIMessage(content="D'après mes recherches : " + " | ".join(observations))
+        calls = self._requested_tools(str(messages[-1].content))
+        if not calls:
+            return AIMessage(content="Réponse simulée : voici mon avis sur la question.")
+        return AIMessage(content="", tool_calls=[
+            {"name": name, "args": {"query": query}, "id": uuid.uuid4().hex}
+            for name, query in calls
+        ])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        self._sleep(prompt)
+        if "Nouveau résumé" in prompt:
+            message = AIMessage(content="Résumé simulé de la conversation.")
+        elif self.tool_calling:
+            message = self._tool_calling_output(messages)
+        else:
+            message = AIMessage(content=self._react_output(messages))
+        # Estimation à 4 caractères par token, pour alimenter les métriques de tokens
+        input_tokens = len(prompt) // 4 + 1
+        output_tokens = len(str(message.content)) // 4 + 1
+        message.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                  "total_tokens": input_tokens + output_tokens}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class OfflineSearch:
+    """Remplace DuckDuckGoSearchRun : même interface run(query), sans réseau"""
+
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+
+    def run(self, query: str) -> str:
+        time.sleep(self.latency)
+        return f"Résultats simulés pour « {query} » : trois articles pertinents résumés en quelques lignes."
+
+
+def offline_search_tool_class(latency: float = 0.3):
+    """Classe d'outil de recherche branchée sur OfflineSearch (pour GeminiAgent(tool_classes=...))"""
+    class OfflineSearchTool(SearchTool):
+        def __init__(self, **kwargs):
+            super().__init__(search=OfflineSearch(latency), **kwargs)
+
+    return OfflineSearchTool
+
+
+class LocalTokenIssuer:
+    """Émet des ID tokens signés par une clé RSA locale et le TokenVerifier qui les accepte"""
+
+    KID = "offline-benchmark"
+
+    def __init__(self, project_id: str = "offline-benchmark"):
+        self.project_id = project_id
+        self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._lock = threading.Lock()
+
+    def verifier(self) -> TokenVerifier:
+        public_keys = {self.KID: self._private_key.public_key()}
+        verifier = TokenVerifier(self.project_id, key_fetcher=lambda: (public_keys, 3600))
+        # Clés locales chargées d'emblée (verify ne fait jamais de chargement synchrone)
+        verifier.refresh_keys()
+        return verifier
+
+    def token(self, uid: str, lifetime_seconds: int = 3600) -> str:
+        now = int(time.time())
+        claims = {
+            "iss": f"https://securetoken.google.com/{self.project_id}",
+            "aud": self.project_id,
+            "sub": uid,
+            "iat": now,
+            "auth_time": now,
+            "exp": now + lifetime_seconds,
+        }
+        with self._lock:
+            return jwt.encode(claims, self._private_key, algorithm="RS256", headers={"kid": self.KID})
@@ -0,0 +1,97 @@
+"""
+Banc d'essai du démarrage de l'API : lance uvicorn dans un sous-processus et mesure
+
+- le délai avant la première réponse de /health (la réplique accepte le trafic léger)
+- le délai avant que /ready réponde 200 (agent construit, composants préchauffés)
+- le temps de construction de chaque composant rapporté par /ready
+
+    python -m benchmarks.startup_benchmark --runs 3
+    python -m benchmarks.startup_benchmark --no-warmup   # tout à la demande
+
+Utilise le .env du projet (GEMINI_API_KEY, compte de service Firebase...).
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(url: str, deadline: float, expected_status: int = 200):
+    """Réponse JSON de url dès qu'elle renvoie expected_status, None si le délai est dépassé"""
+    while time.monotonic() < deadline:
+        try:
+            response = requests.get(url, timeout=1)
+            if response.status_code == expected_status:
+                return response.json()
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    return None
+
+def run_once(warmup: bool, timeout: float, ready_components: str) -> dict:
+    port = free_port()
+    env = {**os.environ, "WARMUP_ENABLED": "true" if warmup else "false", "READY_COMPONENTS": ready_components}
+    start = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = start + timeout
+        if wait_for(f"{base_url}/health", deadline) is None:
+            raise RuntimeError("/health n'a pas répondu dans le délai imparti")
+        health_seconds = time.monotonic() - start
+
+        ready_seconds, components = None, None
+        if warmup:
+            body = wait_for(f"{base_url}/ready", deadline)
+            if body is not None:
+                ready_seconds = time.monotonic() - start
+                components = body["components"]
+        else:
+            # Sans préchauffage, la première requête authentifiée paiera la construction
+            components = requests.get(f"{base_url}/ready", timeout=5).json()["components"]
+        return {"health": health_seconds, "ready": ready_seconds, "components": components}
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Délai maximal par démarrage (secondes)")
+    parser.add_argument("--no-warmup", action="store_true", help="Désactive le préchauffage en arrière-plan")
+    parser.add_argument("--ready-components", default="agent,tools,embeddings",
+                        help="Composants attendus par /ready (READY_COMPONENTS)")
+    args = parser.parse_args()
+
+    results = []
+    for run in range(1, args.runs + 1):
+        result = run_once(not args.no_warmup, args.timeout, args.ready_components)
+        results.append(result)
+        ready = f"{result['ready']:.2f} s" if result["ready"] is not None else "-"
+        print(f"Démarrage {run}: /health {result['health']:.2f} s, /ready {ready}")
+        for name, status in (result["components"] or {}).items():
+            seconds = f"{status['init_seconds']:.2f} s" if status["init_seconds"] is not None else "-"
+            print(f"    {name:<12} {status['state']:<8} {seconds}")
+
+    print(f"\n/health (médiane) : {statistics.median(r['health'] for r in results):.2f} s")
+    ready_times = [r["ready"] for r in results if r["ready"] is not None]
+    if ready_times:
+        print(f"/ready  (médiane) : {statistics.median(ready_times):.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "chat_history.sqlite3")
+DEFAULT_CONVERSATION = "default"
+
+class HistoryStore(ABC):
+    """
+    Interface d'un stockage d'historique de conversations, par utilisateur (uid Firebase)
+    et identifiant de conversation. Les messages sont ajoutés, jamais modifiés ; chacun
+    reçoit un identifiant croissant qui sert de curseur de pagination.
+    Messages : {"id", "role" ("user" | "assistant"), "content", "created_at"}
+    """
+
+    @abstractmethod
+    def append(self, uid: str, conversation_id: str, messages) -> int:
+        """Ajoute [(role, content)] et retourne l'identifiant du dernier message"""
+        ...
+
+    @abstractmethod
+    def read(self, uid: str, conversation_id: str, limit: int = 50, before_id: int = None) -> list:
+        """Les limit messages précédant before_id (par défaut : les plus récents), dans l'ordre chronologique"""
+        ...
+
+    @abstractmethod
+    def last_id(self, uid: str, conversation_id: str):
+        """Identifiant du dernier message de la conversation, ou None"""
+        ...
+
+    @abstractmethod
+    def conversations(self, uid: str, limit: int = 50) -> list:
+        """Conversations de l'utilisateur, la plus récente d'abord"""
+        ...
+
+    @abstractmethod
+    def delete_conversation(self, uid: str, conversation_id: str) -> bool:
+        """Supprime la conversation et ses messages ; False si elle n'existait pas"""
+        ...
+
+class SQLiteHistoryStore(HistoryStore):
+    """
+    Historique dans SQLite (mode WAL : lectures concurrentes pendant les écritures).
+    Chaque thread a sa propre connexion ; les lectures passent par l'index
+    (uid, conversation_id, id) et ne parcourent que la page demandée.
+    """
+
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                uid TEXT NOT NULL,
+                conversation_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(uid, conversation_id, id);
+            CREATE TABLE IF NOT EXISTS conversations (
+                uid TEXT NOT NULL,
+                conversation_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (uid, conversation_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(uid, updated_at);
+        """)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, uid: str, conversation_id: str, messages) -> int:
+        now = time.time()
+        messages = list(messages)
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages (uid, conversation_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(uid, conversation_id, role, content, now) for role, content in messages]
+            )
+            # Le titre est le premier message de la conversation
+            conn.execute(
+                "INSERT INTO conversations (uid, conversation_id, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(uid, conversation_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (uid, conversation_id, messages[0][1][:100] if messages else "", now, now)
+            )
+            last_id = conn.execute(
+                "SELECT MAX(id) FROM messages WHERE uid = ? AND conversation_id = ?", (uid, conversation_id)
+            ).fetchone()[0]
+        return last_id
+
+    def read(self, uid: str, conversation_id: str, limit: int = 50, before_id: int = None) -> list:
+        query = "SELECT id, role, content, created_at FROM messages WHERE uid = ? AND conversation_id = ?"
+        params = [uid, conversation_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        rows = self._conn().execute(query, params).fetchall()
+        return [
+            {"id": row[0], "role": row[1], "content": row[2], "created_at": row[3]}
+            for row in reversed(rows)
+        ]
+
+    def last_id(self, uid: str, conversation_id: str):
+        return self._conn().execute(
+            "SELECT MAX(id) FROM messages WHERE uid = ? AND conversation_id = ?", (uid, conversation_id)
+        ).fetchone()[0]
+
+    def conversations(self, uid: str, limit: int = 50) -> list:
+        rows = self._conn().execute(
+            "SELECT conversation_id, title, created_at, updated_at FROM conversations "
+            "WHERE uid = ? ORDER BY updated_at DESC LIMIT ?",
+            (uid, limit)
+        ).fetchall()
+        return [
+            {"conversation_id": row[0], "title": row[1], "created_at": row[2], "updated_at": row[3]}
+            for row in rows
+        ]
+
+    def delete_conversation(self, uid: str, conversation_id: str) -> bool:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM messages WHERE uid = ? AND conversation_id = ?", (uid, conversation_id))
+            deleted = conn.execute(
+                "DELETE FROM conversations WHERE uid = ? AND conversation_id = ?", (uid, conversation_id)
+            ).rowcount
+        return deleted > 0
+
+# Stockages disponibles : HISTORY_BACKEND choisit l'un d'eux (d'autres peuvent être enregistrés)
+HISTORY_BACKENDS = {
+    "sqlite": lambda: SQLiteHistoryStore(HISTORY_DB_PATH),
+}
+
+def get_history_store() -> HistoryStore:
+    """Stockage d'historique configuré par HISTORY_BACKEND"""
+    try:
+        factory = HISTORY_BACKENDS[HISTORY_BACKEND]
+    except KeyError:
+        raise ValueError(f"HISTORY_BACKEND inconnu : {HISTORY_BACKEND} (choix : {', '.join(HISTORY_BACKENDS)})")
+    return factory()
@@ -1,4 +1,211 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
 from langchain.memory import ConversationBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+
+# "summary" : mémoire bornée avec résumé ; "buffer" : historique complet (ancien comportement)
+MEMORY_STRATEGY = os.getenv("MEMORY_STRATEGY", "summary")
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "2000"))
+MEMORY_KEEP_TURNS = int(os.getenv("MEMORY_KEEP_TURNS", "6"))
+MEMORY_RETRIEVE_K = int(os.getenv("MEMORY_RETRIEVE_K", "0"))
+
+SUMMARY_PROMPT = """Résume progressivement la conversation en ajoutant les nouveaux échanges au résumé existant.
+Conserve les faits, préférences et décisions utiles pour la suite ; sois concis.
+
+Résumé actuel :
+{summary}
+
+Nouveaux échanges :
+{new_lines}
+
+Nouveau résumé :"""
+
+# Les résumés sont mis à jour en arrière-plan, pendant que l'utilisateur lit la réponse
+_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:  # tiktoken absent ou encodage non téléchargeable (hors ligne)
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """Nombre de tokens (tiktoken si disponible, sinon estimation à 4 caractères par token)"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    return sum(count_tokens(str(message.content)) + 4 for message in messages)
+
+class BudgetedSummaryMemory(BaseChatMemory):
+    """
+    Mémoire de conversation à budget de tokens :
+    - les keep_turns derniers échanges sont conservés tels quels, dans la limite de max_token_limit
+    - les échanges plus anciens sont intégrés à un résumé mis à jour incrémentalement par llm
+      (sans llm, ils sont simplement retirés de l'historique)
+    - optionnellement, les retrieve_k anciens échanges les plus proches de la question
+      sont réinjectés (similarité d'embedding)
+
+    last_token_count donne le nombre de tokens d'historique envoyés au dernier appel.
+    """
+    memory_key: str = "chat_history"
+    llm: Any = None
+    embeddings: Any = None
+    max_token_limit: int = MEMORY_MAX_TOKENS
+    keep_turns: int = MEMORY_KEEP_TURNS
+    retrieve_k: int = MEMORY_RETRIEVE_K
+    summary: str = ""
+    last_token_count: int = 0
+
+    _pending: list = PrivateAttr(default_factory=list)
+    _summary_future: Any = PrivateAttr(default=None)
+    _archive_texts: list = PrivateAttr(default_factory=list)
+    _archive_vectors: list = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def _wait_for_summary(self):
+        future = self._summary_future
+        if future is not None:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"⚠️ Échec de la mise à jour du résumé de conversation : {e}")
+            self._summary_future = None
+
+    def _retrieve(self, query: str) -> List[str]:
+        if not self.retrieve_k or not self._archive_vectors or not query:
+            return []
+        vectors = np.array(self._archive_vectors, dtype=np.float32)
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        scores = vectors @ query_vector / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector) + 1e-12)
+        best = np.argsort(-scores)[:self.retrieve_k]
+        # Ordre chronologique
+        return [self._archive_texts[i] for i in sorted(best)]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        self._wait_for_summary()
+        if self._pending and self.llm is not None:
+            self._update_summary()
+        messages = []
+        if self.summary:
+            messages.append(SystemMessage(content=f"Résumé de la conversation précédente :\n{self.summary}"))
+        query = inputs.get(self.input_key or "input", "")
+        recalled = self._retrieve(query)
+        if recalled:
+            messages.append(SystemMessage(content="Échanges antérieurs pertinents :\n" + "\n\n".join(recalled)))
+        messages.extend(self.chat_memory.messages)
+
+        self.last_token_count = count_message_tokens(messages)
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        self._prune()
+
+    def load_history(self, messages: List[BaseMessage]) -> None:
+        """Réhydrate une conversation enregistrée, élaguée et résumée comme si elle venait d'avoir lieu"""
+        self.chat_memory.add_messages(messages)
+        self._prune()
+
+    def _prune(self):
+        """Retire les échanges au-delà de keep_turns ou du budget de tokens, et les résume"""
+        messages = list(self.chat_memory.messages)
+        overflow = []
+        # On garde toujours au moins le dernier échange
+        while len(messages) > 2 and (
+            len(messages) > 2 * self.keep_turns or count_message_tokens(messages) > self.max_token_limit
+        ):
+            overflow.extend(messages[:2])
+            messages = messages[2:]
+        if not overflow:
+            return
+
+        self.chat_memory.clear()
+        self.chat_memory.add_messages(messages)
+
+        if self.retrieve_k and self.embeddings is not None:
+            turns = [get_buffer_string(overflow[i:i + 2]) for i in range(0, len(overflow), 2)]
+            self._archive_texts.extend(turns)
+            self._archive_vectors.extend(self.embeddings.embed_documents(turns))
+
+        if self.llm is not None:
+            with self._lock:
+                self._pending.extend(overflow)
+                running = self._summary_future is not None and not self._summary_future.done()
+            if not running:
+                self._wait_for_summary()
+                self._summary_future = _summary_pool.submit(self._update_summary)
+
+    def _update_summary(self):
+        # Les échanges retirés pendant une mise à jour sont intégrés au tour suivant
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            prompt = SUMMARY_PROMPT.format(summary=self.summary or "(vide)", new_lines=get_buffer_string(pending))
+            response = self.llm.invoke(prompt)
+            self.summary = getattr(response, "content", response).strip()
+
+    def clear(self) -> None:
+        self._wait_for_summary()
+        super().clear()
+        self.summary = ""
+        self._pending = []
+        self._archive_texts = []
+        self._archive_vectors = []
+
+def memory_state(memory) -> list:
+    """
+    Tout ce qui, dans la mémoire, influe sur la prochaine réponse : résumé, échanges en
+    attente de résumé, échanges archivés et historique récent (clé du cache de réponses)
+    """
+    parts = [get_buffer_string(memory.chat_memory.messages)]
+    if isinstance(memory, BudgetedSummaryMemory):
+        with memory._lock:
+            pending = list(memory._pending)
+        parts = [memory.summary, get_buffer_string(pending), *memory._archive_texts, *parts]
+    return parts
+
+def get_memory(output_key: str = "output", llm=None):
+    """
+    Mémoire de conversation selon MEMORY_STRATEGY. llm sert à résumer les anciens échanges.
+    """
+    if MEMORY_STRATEGY == "buffer":
+        return ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key=output_key)
+
+    embeddings = None
+    if MEMORY_RETRIEVE_K:
+        from retriever.embeddings import get_embeddings
 
-def get_memory():
-    return ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        embeddings = get_embeddings()
+    return BudgetedSummaryMemory(
+        llm=llm,
+        embeddings=embeddings,
+        return_messages=True,
+        output_key=output_key,
+        input_key="input"
+    )
@@ -0,0 +1,136 @@
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+# Paramètres par défaut de chaque type d'index
+INDEX_TYPES = {
+    # Recherche exacte (force brute) : idéal jusqu'à quelques dizaines de milliers de chunks
+    "flat": {},
+    # Graphe HNSW : très rapide, pas d'entraînement, plus de mémoire
+    "hnsw": {"hnsw_m": 32, "ef_construction": 80, "ef_search": 64},
+    # Partitionnement IVF : nprobe listes visitées sur nlist
+    "ivf": {"nlist": 256, "nprobe": 16},
+    # Quantification produit : index compact (m sous-vecteurs de nbits), approximatif
+    "pq": {"m": 16, "nbits": 8},
+    # IVF + PQ : gros corpus, mémoire minimale
+    "ivfpq": {"nlist": 256, "nprobe": 16, "m": 16, "nbits": 8},
+}
+
+def index_config(index_type: str = "flat", **params) -> dict:
+    """Configuration complète d'un type d'index (paramètres par défaut complétés)"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Type d'index inconnu : {index_type} (choix : {', '.join(INDEX_TYPES)})")
+    return {"type": index_type, **INDEX_TYPES[index_type], **params}
+
+def factory_string(config: dict) -> str:
+    """Description faiss.index_factory correspondant à la configuration"""
+    index_type = config["type"]
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{config['hnsw_m']}"
+    if index_type == "ivf":
+        return f"IVF{config['nlist']},Flat"
+    if index_type == "pq":
+        return f"PQ{config['m']}x{config['nbits']}"
+    return f"IVF{config['nlist']},PQ{config['m']}x{config['nbits']}"
+
+def min_training_size(config: dict) -> int:
+    """
+    Nombre de vecteurs requis avant de construire l'index cible
+    (faiss recommande ~39 points par centroïde)
+    """
+    index_type = config["type"]
+    if index_type in ("flat", "hnsw"):
+        return 0
+    sizes = []
+    if index_type in ("ivf", "ivfpq"):
+        sizes.append(39 * config["nlist"])
+    if index_type in ("pq", "ivfpq"):
+        sizes.append(39 * 2 ** config["nbits"])
+    return max(sizes)
+
+def apply_search_params(faiss_index, config: dict):
+    """Règle les paramètres de recherche (nprobe, efSearch) d'un index chargé ou construit"""
+    if "nprobe" in config:
+        try:
+            faiss.extract_index_ivf(faiss_index).nprobe = config["nprobe"]
+        except RuntimeError:
+            pass  # Pas (encore) un index IVF
+    if "ef_search" in config and hasattr(faiss_index, "hnsw"):
+        faiss_index.hnsw.efSearch = config["ef_search"]
+
+def build_faiss_index(vectors: np.ndarray, config: dict):
+    """Construit, entraîne si nécessaire, et remplit un index faiss brut"""
+    dim = vectors.shape[1]
+    faiss_index = faiss.index_factory(dim, factory_string(config))
+    if hasattr(faiss_index, "hnsw") and "ef_construction" in config:
+        faiss_index.hnsw.efConstruction = config["ef_construction"]
+    if not faiss_index.is_trained:
+        faiss_index.train(vectors)
+    faiss_index.add(vectors)
+    apply_search_params(faiss_index, config)
+    return faiss_index
+
+def is_target_type(index, config: dict) -> bool:
+    """L'index FAISS est-il déjà du type demandé par la configuration ?"""
+    return config["type"] == "flat" or config.get("built", False)
+
+def _stored_vectors(index, ids, documents, embeddings) -> np.ndarray:
+    """Vecteurs des chunks ids : relus dans l'index s'il est exact, sinon depuis le cache d'embeddings"""
+    if isinstance(index.index, faiss.IndexFlat):
+        positions = {doc_id: position for position, doc_id in index.index_to_docstore_id.items()}
+        return np.vstack([index.index.reconstruct(int(positions[doc_id])) for doc_id in ids]).astype(np.float32)
+    return np.array(embeddings.embed_documents([documents[doc_id].page_content for doc_id in ids]), dtype=np.float32)
+
+def rebuild(index, config: dict, embeddings, exclude_ids=()):
+    """
+    Reconstruit un index LangChain FAISS avec le type configuré, sans les chunks exclude_ids.
+    Les vecteurs sont relus depuis l'index ou le cache d'embeddings (aucun recalcul).
+    """
+    exclude_ids = set(exclude_ids)
+    ids = [doc_id for doc_id in index.index_to_docstore_id.values() if doc_id not in exclude_ids]
+    documents = {doc_id: index.docstore.search(doc_id) for doc_id in ids}
+
+    if not ids:
+        dim = index.index.d
+        faiss_index = faiss.IndexFlatL2(dim)
+        return FAISS(embeddings, faiss_index, InMemoryDocstore({}), {})
+
+    vectors = _stored_vectors(index, ids, documents, embeddings)
+    if config["type"] != "flat" and len(ids) >= min_training_size(config):
+        faiss_index = build_faiss_index(vectors, config)
+        config["built"] = True
+    else:
+        # Pas assez de vecteurs pour entraîner : on reste en recherche exacte
+        faiss_index = build_faiss_index(vectors, {"type": "flat"})
+        config["built"] = False
+
+    return FAISS(embeddings, faiss_index, InMemoryDocstore(documents), dict(enumerate(ids)))
+
+def delete_chunks(index, chunk_ids, config: dict, embeddings):
+    """
+    Supprime des chunks. Les index flat le font en place ; les index approximatifs
+    (qui ne renumérotent pas leurs vecteurs) sont reconstruits sans ces chunks.
+    Retourne l'index à utiliser ensuite.
+    """
+    if not chunk_ids:
+        return index
+    if not is_target_type(index, config) or config["type"] == "flat":
+        index.delete(list(chunk_ids))
+        return index
+    return rebuild(index, config, embeddings, exclude_ids=chunk_ids)
+
+def ensure_index_type(index, config: dict, embeddings):
+    """
+    Entraînement à l'ingestion : tant qu'il y a trop peu de vecteurs pour entraîner
+    l'index cible, la collection reste en recherche exacte ; dès que le seuil est
+    atteint, l'index est reconstruit avec le type configuré.
+    """
+    if is_target_type(index, config):
+        return index
+    if index.index.ntotal < max(min_training_size(config), 1):
+        return index
+    print(f"🏗️ Construction de l'index {factory_string(config)} sur {index.index.ntotal} vecteurs...")
+    return rebuild(index, config, embeddings)
@@ -0,0 +1,396 @@
+"""
+Découpage des pages PDF en chunks avant embedding :
+
+- la taille est mesurée en tokens du modèle d'embedding, pas en caractères : un
+  chunk ne dépasse pas la fenêtre du modèle, qui en tronquerait la fin ;
+- le découpage suit la structure du texte : titres, puis paragraphes, puis
+  phrases ; le titre de la section courante est rappelé en tête des chunks qui
+  ne commencent pas par lui ;
+- les en-têtes, pieds de page et mentions répétés de page en page sont retirés ;
+- les paragraphes et chunks quasi identiques à un paragraphe ou chunk déjà vu
+  (MinHash) sont écartés avant l'embedding.
+
+TokenChunker s'utilise comme un splitter LangChain (split_documents). Une instance
+par document : elle garde la section courante et les empreintes déjà vues.
+"""
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+from langchain_core.documents import Document
+
+from retriever.embeddings import EMBEDDING_MODEL_NAME
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "30"))
+# Tokenizer servant à compter les tokens (celui du modèle d'embedding par défaut)
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", EMBEDDING_MODEL_NAME)
+# Similarité (Jaccard sur les trigrammes de mots) à partir de laquelle un chunk est un doublon, 0 pour désactiver
+CHUNK_DEDUP_SIMILARITY = float(os.getenv("CHUNK_DEDUP_SIMILARITY", "0.8"))
+CHUNK_STRIP_FURNITURE = os.getenv("CHUNK_STRIP_FURNITURE", "true").lower() == "true"
+# À incrémenter quand l'algorithme change : les index existants sont alors reconstruits
+CHUNKER_VERSION = 3
+
+_WORD_PIECES = re.compile(r"\w+|[^\w\s]")
+_WORDS = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+_HEADING = re.compile(
+    r"^(#{1,6}\s+\S"
+    r"|(\d+(\.\d+)*\.?|[IVXLC]+\.)\s+[A-ZÀ-Ý]"
+    r"|(?i:chapitre|section|partie|annexe|article|chapter|part|appendix)\s+\S)"
+)
+# Taille minimale d'un paragraphe pour le dédoublonner (les textes très courts se répètent légitimement)
+_MIN_DEDUP_TOKENS = 24
+_BULLET = re.compile(r"^([-•*▪◦–]|\d+[.)]|[a-z][.)])\s+")
+
+# Permutations MinHash : (a * x + b) mod p, tirées avec une graine fixe pour que
+# les signatures soient identiques dans tous les processus
+_MINHASH_PERMUTATIONS = 64
+_MINHASH_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(25)
+_MINHASH_A = _rng.integers(1, _MINHASH_PRIME, size=_MINHASH_PERMUTATIONS, dtype=np.uint64)
+_MINHASH_B = _rng.integers(0, _MINHASH_PRIME, size=_MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+@lru_cache(maxsize=None)
+def _load_tokenizer(name: str):
+    """Tokenizer Hugging Face du modèle, ou None si transformers ou le modèle sont indisponibles"""
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(name)
+    except Exception as e:
+        print(f"⚠️ Tokenizer {name} indisponible ({e}) : nombre de tokens estimé")
+        return None
+    # On compte aussi des textes plus longs que la fenêtre du modèle : pas d'avertissement
+    tokenizer.model_max_length = 10 ** 9
+    return tokenizer
+
+def estimate_tokens(text: str) -> int:
+    """Approximation WordPiece : un token par mot court ou signe, davantage pour les mots longs"""
+    return sum(1 + len(piece) // 5 for piece in _WORD_PIECES.findall(text))
+
+def _shingles(text: str) -> set:
+    words = _WORDS.findall(text.lower())
+    return {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+def minhash(text: str) -> np.ndarray:
+    """Signature MinHash du texte (trigrammes de mots), _MINHASH_PERMUTATIONS valeurs"""
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+         for shingle in _shingles(text)],
+        dtype=np.uint64
+    ) % _MINHASH_PRIME
+    return ((np.outer(hashes, _MINHASH_A) + _MINHASH_B) % _MINHASH_PRIME).min(axis=0)
+
+class NearDuplicateFilter:
+    """
+    Signatures MinHash des textes déjà retenus. Un texte dont la similarité de Jaccard
+    estimée (part des valeurs de signature égales) avec l'un d'eux atteint threshold
+    est un quasi-doublon. Les signatures sont indexées par bandes (LSH) : seuls les
+    textes qui partagent une bande entière sont comparés ; à 0,8 de similarité, deux
+    textes en partagent une avec une probabilité supérieure à 99,9 %.
+    """
+
+    def __init__(self, threshold: float = 0.8, bands: int = 16):
+        if _MINHASH_PERMUTATIONS % bands:
+            raise ValueError(f"bands doit diviser {_MINHASH_PERMUTATIONS}")
+        self.threshold = threshold
+        self.rows = _MINHASH_PERMUTATIONS // bands
+        self._bands = [{} for _ in range(bands)]
+        self._signatures = []
+
+    def seen(self, text: str) -> bool:
+        """True si le texte est un quasi-doublon, sinon retient sa signature"""
+        signature = minhash(text)
+        keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(len(self._bands))]
+        candidates = set()
+        for band, key in zip(self._bands, keys):
+            candidates.update(band.get(key, ()))
+        for candidate in candidates:
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                return True
+        for band, key in zip(self._bands, keys):
+            band.setdefault(key, []).append(len(self._signatures))
+        self._signatures.append(signature)
+        return False
+
+def _line_key(line: str) -> str:
+    # Chiffres ignorés : « Page 3 / 12 » et « Page 4 / 12 » sont la même ligne
+    return re.sub(r"\d+", "#", " ".join(line.lower().split()))
+
+class PageFurnitureFilter:
+    """
+    Retire les lignes répétées en haut et en bas des pages : en-têtes, pieds de page,
+    numéros de page, mentions légales. Une ligne en fait partie si elle figure parmi
+    les edge_lines premières ou dernières lignes d'au moins min_pages pages et de la
+    moitié des pages lues. Les window premières pages sont lues avant d'en rendre
+    une ; le filtre continue ensuite d'apprendre au fil des pages.
+    """
+
+    def __init__(self, window: int = 8, edge_lines: int = 6, min_pages: int = 3, min_ratio: float = 0.5):
+        self.window = window
+        self.edge_lines = edge_lines
+        self.min_pages = min_pages
+        self.min_ratio = min_ratio
+        self.counts = Counter()
+        self.pages_seen = 0
+        self.removed_lines = 0
+
+    def _observe(self, lines: list):
+        self.pages_seen += 1
+        content = [line for line in lines if line.strip()]
+        edges = content[:self.edge_lines] + content[-self.edge_lines:]
+        self.counts.update({_line_key(line) for line in edges})
+
+    def _is_furniture(self, line: str) -> bool:
+        if not line.strip():
+            return True
+        count = self.counts[_line_key(line)]
+        return count >= self.min_pages and count >= self.min_ratio * self.pages_seen
+
+    def _clean(self, page: Document, lines: list) -> Document:
+        start, end = 0, len(lines)
+        while start < end and self._is_furniture(lines[start]):
+            start += 1
+        while end > start and self._is_furniture(lines[end - 1]):
+            end -= 1
+        self.removed_lines += sum(1 for line in lines[:start] + lines[end:] if line.strip())
+        page.page_content = "\n".join(lines[start:end])
+        return page
+
+    def filter(self, pages):
+        """Nettoie un flux de pages (Document) ; la mémoire reste bornée à window pages"""
+        buffered = []
+        for page in pages:
+            lines = page.page_content.splitlines()
+            self._observe(lines)
+            buffered.append((page, lines))
+            if self.pages_seen >= self.window:
+                for item in buffered:
+                    yield self._clean(*item)
+                buffered = []
+        for item in buffered:
+            yield self._clean(*item)
+
+def _is_heading(line: str) -> bool:
+    if len(line) > 80 or len(line.split()) > 12 or line[-1] in ".,;":
+        return False
+    if _HEADING.match(line):
+        return True
+    # Ligne en capitales (« CONDITIONS GÉNÉRALES »)
+    return sum(c.isalpha() for c in line) >= 4 and line.upper() == line
+
+def split_blocks(text: str) -> list:
+    """
+    Découpe le texte extrait d'une page en blocs ("heading" | "paragraph", texte).
+    Une fin de paragraphe est une ligne vide, un titre, une puce, ou une ligne
+    nettement plus courte que la largeur du texte terminée par une ponctuation forte.
+    """
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    width = max((len(line) for line in lines), default=0)
+    blocks = []
+    current = ""
+
+    def close():
+        nonlocal current
+        if current:
+            blocks.append(("paragraph", current))
+        current = ""
+
+    for line in lines:
+        if not line:
+            close()
+            continue
+        if _is_heading(line):
+            close()
+            blocks.append(("heading", line))
+            continue
+        if _BULLET.match(line):
+            close()
+        # Mot coupé en fin de ligne : on recolle sans espace
+        current = f"{current}{line}" if current.endswith("-") else f"{current} {line}".strip()
+        if line[-1] in ".!?…:" and len(line) < 0.8 * width:
+            close()
+    close()
+    return blocks
+
+class TokenChunker:
+    """
+    Découpe des pages en chunks d'au plus max_tokens tokens, en respectant titres,
+    paragraphes et phrases ; deux chunks consécutifs d'une même section partagent
+    jusqu'à overlap_tokens tokens. Les chunks ne débordent pas d'une page à l'autre
+    (métadonnée page exacte pour les citations). Chaque chunk porte la métadonnée
+    "section" (titre courant) quand elle est connue.
+    """
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 tokenizer: str = CHUNK_TOKENIZER, dedup_similarity: float = CHUNK_DEDUP_SIMILARITY,
+                 strip_furniture: bool = CHUNK_STRIP_FURNITURE):
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens doit être positif et inférieur à max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self._tokenizer = _load_tokenizer(tokenizer) if tokenizer else None
+        self.tokenizer_name = tokenizer if self._tokenizer is not None else "estimation"
+        self.dedup_similarity = dedup_similarity
+        self.strip_furniture = strip_furniture
+        self.furniture = PageFurnitureFilter()
+        self._dedup = NearDuplicateFilter(dedup_similarity) if dedup_similarity > 0 else None
+        self._dedup_paragraphs = NearDuplicateFilter(dedup_similarity) if dedup_similarity > 0 else None
+        self.section = None
+        self.duplicates = 0
+        self.duplicate_paragraphs = 0
+
+    def params(self) -> dict:
+        """Paramètres qui déterminent le découpage (clés de cache des index)"""
+        return {
+            "chunker": "tokens",
+            "version": CHUNKER_VERSION,
+            "max_tokens": self.max_tokens,
+            "overlap_tokens": self.overlap_tokens,
+            "tokenizer": self.tokenizer_name,
+            "dedup_similarity": self.dedup_similarity,
+            "strip_furniture": self.strip_furniture,
+        }
+
+    @property
+    def signature(self) -> str:
+        payload = json.dumps(self.params(), sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+    def count_tokens(self, text: str) -> int:
+        if self._tokenizer is None:
+            return estimate_tokens(text)
+        return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+    def prepare_pages(self, pages):
+        """Flux de pages débarrassées de leur en-tête et pied de page répétés"""
+        if not self.strip_furniture:
+            return iter(pages)
+        return self.furniture.filter(pages)
+
+    def _pieces(self, text: str, limit: int) -> list:
+        """Morceaux de limit tokens au plus : le paragraphe entier, sinon ses phrases, sinon des groupes de mots"""
+        tokens = self.count_tokens(text)
+        if tokens <= limit:
+            return [(text, tokens)]
+        pieces = []
+        for sentence in _SENTENCE_END.split(text):
+            tokens = self.count_tokens(sentence)
+            if tokens <= limit:
+                pieces.append((sentence, tokens))
+                continue
+            # Phrase trop longue : les mots sont tokenisés séparément, leurs comptes s'additionnent
+            words = sentence.split()
+            if self._tokenizer is not None:
+                counts = [len(ids) for ids in self._tokenizer(words, add_special_tokens=False)["input_ids"]]
+            else:
+                counts = [estimate_tokens(word) for word in words]
+            group, group_tokens = [], 0
+            for word, count in zip(words, counts):
+                if group and group_tokens + count > limit:
+                    pieces.append((" ".join(group), group_tokens))
+                    group, group_tokens = [], 0
+                if count > limit:
+                    # Mot plus long que la limite (URL, texte extrait sans espaces) : coupé en morceaux
+                    pieces.extend(self._split_word(word, limit))
+                    continue
+                group.append(word)
+                group_tokens += count
+            if group:
+                pieces.append((" ".join(group), group_tokens))
+        return pieces
+
+    def _split_word(self, word: str, limit: int) -> list:
+        """Morceaux consécutifs d'un mot, chacun le plus long possible sans dépasser limit tokens"""
+        pieces = []
+        while word:
+            # Préfixe le plus long qui tient dans la limite (recherche dichotomique) ;
+            # un token couvre rarement plus de 64 caractères
+            low, high = 1, min(len(word), limit * 64)
+            while low < high:
+                middle = (low + high + 1) // 2
+                if self.count_tokens(word[:middle]) <= limit:
+                    low = middle
+                else:
+                    high = middle - 1
+            pieces.append((word[:low], self.count_tokens(word[:low])))
+            word = word[low:]
+        return pieces
+
+    def _split_text(self, text: str) -> list:
+        """Chunks (texte, section) d'une page"""
+        chunks = []
+        # Unités du chunk en cours : (texte, tokens, type) avec type heading | paragraph | sentence
+        current = []
+        prefix_tokens = self.count_tokens(self.section) + 1 if self.section else 0
+
+        def used() -> int:
+            return sum(tokens for _, tokens, _ in current)
+
+        def budget() -> int:
+            if current and current[0][2] == "heading":
+                return self.max_tokens
+            return self.max_tokens - prefix_tokens
+
+        def flush(keep_overlap: bool):
+            nonlocal current
+            if not current or all(kind == "heading" for _, _, kind in current):
+                return
+            body = current[0][0]
+            for piece, _, kind in current[1:]:
+                body += (" " if kind == "sentence" else "\n") + piece
+            if self.section and current[0][2] != "heading":
+                body = f"{self.section}\n{body}"
+            chunks.append((body, self.section))
+
+            overlap = []
+            if keep_overlap:
+                total = 0
+                for unit in reversed(current):
+                    if unit[2] == "heading" or total + unit[1] > self.overlap_tokens:
+                        break
+                    overlap.insert(0, unit)
+                    total += unit[1]
+            current = overlap
+
+        for kind, block in split_blocks(text):
+            if kind == "heading":
+                flush(keep_overlap=False)
+                self.section = block
+                prefix_tokens = self.count_tokens(block) + 1
+                current = [(block, prefix_tokens - 1, "heading")]
+                continue
+            # Paragraphe répété ailleurs dans le document (mention légale, clause type) :
+            # il serait sinon embeddé une fois par chunk qui le contient
+            if self._dedup_paragraphs is not None and self.count_tokens(block) >= _MIN_DEDUP_TOKENS:
+                if self._dedup_paragraphs.seen(block):
+                    self.duplicate_paragraphs += 1
+                    continue
+            limit = max(1, self.max_tokens - prefix_tokens)
+            for position, (piece, tokens) in enumerate(self._pieces(block, limit)):
+                if current and used() + tokens > budget():
+                    flush(keep_overlap=True)
+                    if current and used() + tokens > budget():
+                        current = []
+                current.append((piece, tokens, "paragraph" if position == 0 else "sentence"))
+        flush(keep_overlap=False)
+        return chunks
+
+    def split_documents(self, documents) -> list:
+        """Découpe des pages (Document) en chunks, sans les quasi-doublons de ce qui a déjà été produit"""
+        chunks = []
+        for document in documents:
+            for text, section in self._split_text(document.page_content):
+                if self._dedup is not None and self._dedup.seen(text):
+                    self.duplicates += 1
+                    continue
+                metadata = dict(document.metadata)
+                if section:
+                    metadata["section"] = section
+                chunks.append(Document(page_content=text, metadata=metadata))
+        return chunks
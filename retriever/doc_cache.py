@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+from langchain_community.vectorstores import FAISS
+
+from retriever import hybrid
+
+DOC_CACHE_DIR = os.getenv("DOC_CACHE_DIR", "doc_cache")
+
+def file_hash(filepath: str) -> str:
+    """
+    Empreinte SHA-256 du contenu d'un fichier (lu par blocs pour borner la mémoire)
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_key(filepath: str, splitter_params: dict, model_name: str) -> str:
+    """
+    Clé de cache d'un document : contenu du fichier + paramètres de découpage + modèle d'embedding.
+    Modifier l'un des trois produit un nouvel index.
+    """
+    payload = json.dumps(
+        {"file": file_hash(filepath), "splitter": splitter_params, "model": model_name},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _entry_path(key: str) -> str:
+    return os.path.join(DOC_CACHE_DIR, key)
+
+def load_cached_index(key: str, embeddings):
+    """
+    Recharge un index depuis le cache, ou None s'il n'existe pas.
+    L'index FAISS est mappé en mémoire (mmap) : le chargement est quasi instantané
+    et les pages ne sont lues qu'à la demande.
+    """
+    path = _entry_path(key)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+
+    import faiss
+
+    index_file = os.path.join(path, "index.faiss")
+    try:
+        faiss_index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # Certains types d'index ne supportent pas le mmap
+        faiss_index = faiss.read_index(index_file)
+
+    # Fichier écrit par nous-mêmes (save_index), donc de confiance
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    index = FAISS(embeddings, faiss_index, docstore, index_to_docstore_id)
+    bm25 = hybrid.BM25Index.load(path)
+    if bm25 is not None:
+        hybrid.attach_bm25(index, bm25)
+    return index
+
+def load_cache_meta(key: str):
+    """Métadonnées d'une entrée du cache (source, nombre de chunks...), ou None"""
+    meta_file = os.path.join(_entry_path(key), "meta.json")
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_index(key: str, index, meta: dict):
+    """
+    Sauvegarde un index dans le cache de manière atomique : écriture dans un
+    répertoire temporaire puis renommage. meta.json est écrit en dernier et
+    sert de marqueur d'entrée complète.
+    """
+    path = _entry_path(key)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(DOC_CACHE_DIR, exist_ok=True)
+
+    index.save_local(tmp_path)
+    hybrid.BM25Index.from_faiss(index).save(tmp_path)
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({**meta, "created_at": time.time()}, f)
+
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Entrée déjà écrite par un autre processus : même contenu, on garde la sienne
+        shutil.rmtree(tmp_path, ignore_errors=True)
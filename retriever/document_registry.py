@@ -0,0 +1,276 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from langchain_core.documents import Document
+
+from retriever import doc_cache, hybrid
+from retriever.embeddings import get_embeddings, EMBEDDING_MODEL_NAME
+from retriever.ingest import build_document_index
+
+MAX_LOADED_INDEXES = int(os.getenv("DOC_MAX_LOADED_INDEXES", "32"))
+MAX_CACHED_CATALOGS = 10000
+
+def build_cached_index(filepath: str, splitter, splitter_params: dict, progress=None):
+    """
+    Indexe un PDF dans le cache adressé par contenu, sauf s'il y est déjà.
+    Retourne (clé, métadonnées, depuis le cache). progress(pages, chunks) est appelé
+    après chaque page lue. Lève ValueError si le PDF ne contient pas de texte.
+    Utilisable hors du processus de l'API (tâches d'indexation en arrière-plan).
+    """
+    key = doc_cache.cache_key(filepath, splitter_params, EMBEDDING_MODEL_NAME)
+    meta = doc_cache.load_cache_meta(key)
+    if meta is not None:
+        return key, meta, True
+
+    index, pages_count, chunks_count = build_document_index(filepath, get_embeddings(), splitter, progress=progress)
+    if not pages_count:
+        raise ValueError("le fichier ne contient aucune page ou est corrompu")
+    if index is None:
+        raise ValueError("aucun texte n'a pu être extrait (PDF vide ou non textuel)")
+    meta = {
+        "source": os.path.basename(filepath),
+        "pages": pages_count,
+        "chunks": chunks_count,
+        "model": EMBEDDING_MODEL_NAME
+    }
+    doc_cache.save_index(key, index, meta)
+    return key, meta, False
+
+def _same_file(path, other: str) -> bool:
+    return path is not None and os.path.abspath(path) == os.path.abspath(other)
+
+class DocumentRegistry:
+    """
+    Registre des documents chargés par chaque utilisateur.
+
+    - Le catalogue d'un utilisateur (documents chargés, sélection active) est
+      persisté en JSON dans DOC_CACHE_DIR/users/.
+    - Les index FAISS sont ceux du cache adressé par contenu (doc_cache) : un même
+      PDF chargé par plusieurs utilisateurs n'est indexé et gardé en mémoire qu'une fois.
+    - Au plus max_loaded index sont gardés en mémoire ; les moins récemment
+      interrogés sont évincés et remappés depuis le disque à la demande.
+    - on_removed(user_id, entrée) est appelé quand une entrée quitte le catalogue
+      (retrait, ou remplacement par un autre fichier) : ex. suppression du PDF envoyé.
+    """
+
+    def __init__(self, splitter_factory, splitter_params: dict, max_loaded: int = MAX_LOADED_INDEXES,
+                 on_removed=None):
+        self.splitter_factory = splitter_factory
+        self.splitter_params = splitter_params
+        self.max_loaded = max_loaded
+        self.on_removed = on_removed
+        self._indexes = OrderedDict()
+        self._catalogs = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Catalogues utilisateurs ---
+
+    def _catalog_path(self, user_id: str) -> str:
+        user_hash = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(doc_cache.DOC_CACHE_DIR, "users", f"{user_hash}.json")
+
+    def _catalog(self, user_id: str) -> dict:
+        catalog = self._catalogs.get(user_id)
+        if catalog is not None:
+            self._catalogs.move_to_end(user_id)
+        else:
+            path = self._catalog_path(user_id)
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    catalog = json.load(f)
+            else:
+                catalog = {"documents": {}}
+            self._catalogs[user_id] = catalog
+            # Les catalogues sont persistés : on peut évincer les moins récents
+            while len(self._catalogs) > MAX_CACHED_CATALOGS:
+                self._catalogs.popitem(last=False)
+        return catalog
+
+    def _save_catalog(self, user_id: str):
+        path = self._catalog_path(user_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._catalogs[user_id], f)
+        os.replace(tmp_path, path)
+
+    def _removed(self, user_id: str, entry: dict):
+        if self.on_removed is None:
+            return
+        try:
+            self.on_removed(user_id, entry)
+        except Exception as e:
+            print(f"⚠️ Nettoyage du document retiré impossible : {e}")
+
+    # --- Index en mémoire (LRU) ---
+
+    def _get_index(self, key: str):
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+
+        index = doc_cache.load_cached_index(key, get_embeddings())
+        if index is None:
+            return None
+
+        with self._lock:
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_loaded:
+                self._indexes.popitem(last=False)
+        return index
+
+    # --- API ---
+
+    @staticmethod
+    def _new_doc_id(documents: dict, filepath: str) -> str:
+        """
+        Identifiant d'un fichier chargé : celui qu'il a déjà au catalogue, sinon son nom
+        sans extension, suffixé s'il est pris par un autre fichier (rapport, rapport-2...)
+        """
+        for doc_id, entry in documents.items():
+            if _same_file(entry.get("path"), filepath):
+                return doc_id
+        stem = os.path.splitext(os.path.basename(filepath))[0]
+        doc_id, n = stem, 1
+        while doc_id in documents and not _same_file(documents[doc_id].get("path", filepath), filepath):
+            n += 1
+            doc_id = f"{stem}-{n}"
+        return doc_id
+
+    def load(self, user_id: str, filepath: str, metadata: dict = None, doc_id: str = None) -> dict:
+        """
+        Ajoute un PDF aux documents de l'utilisateur (indexé une seule fois grâce au cache).
+        Le document est ajouté à la sélection active. Retourne son entrée de catalogue.
+        Un doc_id imposé remplace le document de même identifiant ; à défaut, deux fichiers
+        de même nom dans des dossiers différents reçoivent des identifiants distincts.
+        Lève ValueError si le PDF ne contient pas de texte.
+        """
+        key, meta, from_cache = build_cached_index(filepath, self.splitter_factory(), self.splitter_params)
+
+        entry = {
+            "key": key,
+            "source": os.path.basename(filepath),
+            "path": filepath,
+            "pages": meta["pages"],
+            "chunks": meta["chunks"],
+            "metadata": metadata or {},
+            "from_cache": from_cache
+        }
+        with self._lock:
+            catalog = self._catalog(user_id)
+            doc_id = doc_id or self._new_doc_id(catalog["documents"], filepath)
+            previous = catalog["documents"].get(doc_id)
+            catalog["documents"][doc_id] = entry
+            selection = catalog.setdefault("selected", [])
+            if doc_id not in selection:
+                selection.append(doc_id)
+            self._save_catalog(user_id)
+        if previous is not None and not _same_file(previous.get("path"), filepath):
+            self._removed(user_id, previous)
+        return {"doc_id": doc_id, **entry}
+
+    def unload(self, user_id: str, doc_id: str) -> bool:
+        """Retire un document du catalogue de l'utilisateur (l'index reste en cache disque)"""
+        with self._lock:
+            catalog = self._catalog(user_id)
+            entry = catalog["documents"].pop(doc_id, None)
+            if entry is None:
+                return False
+            catalog["selected"] = [d for d in catalog.get("selected", []) if d != doc_id]
+            self._save_catalog(user_id)
+        self._removed(user_id, entry)
+        return True
+
+    def select(self, user_id: str, doc_ids) -> list:
+        """
+        Définit les documents interrogés par défaut (None : tous).
+        Retourne la sélection effective ; lève KeyError si un document est inconnu.
+        """
+        with self._lock:
+            catalog = self._catalog(user_id)
+            if doc_ids is None:
+                doc_ids = list(catalog["documents"])
+            unknown = [d for d in doc_ids if d not in catalog["documents"]]
+            if unknown:
+                raise KeyError(", ".join(unknown))
+            catalog["selected"] = list(doc_ids)
+            self._save_catalog(user_id)
+            return catalog["selected"]
+
+    def list(self, user_id: str) -> dict:
+        """Documents de l'utilisateur : {doc_id: entrée + "selected"}"""
+        with self._lock:
+            catalog = self._catalog(user_id)
+            selection = set(catalog.get("selected", []))
+            return {
+                doc_id: {**entry, "selected": doc_id in selection}
+                for doc_id, entry in catalog["documents"].items()
+            }
+
+    def search(self, user_id: str, query: str, k: int = 4, doc_ids=None, filter: dict = None,
+               doc_filter: dict = None, mode: str = "hybrid", fetch_k: int = 20,
+               rerank: bool = False, mmr: bool = False) -> list:
+        """
+        Recherche les k chunks les plus pertinents pour query parmi les documents
+        doc_ids (par défaut : la sélection active), en fusionnant les résultats
+        de chaque index.
+        - filter s'applique aux métadonnées des chunks (ex: {"page": 3})
+        - doc_filter s'applique aux métadonnées des documents données au chargement
+        - mode "hybrid" combine BM25 et FAISS, mode "dense" n'utilise que FAISS
+        Retourne [{content, score, page, source, doc_id, chunk_id}] par score décroissant.
+        """
+        with self._lock:
+            catalog = self._catalog(user_id)
+            if doc_ids is None:
+                doc_ids = catalog.get("selected", [])
+            targets = []
+            for doc_id in doc_ids:
+                entry = catalog["documents"].get(doc_id)
+                if entry is None:
+                    continue
+                if doc_filter and any(entry["metadata"].get(name) != value for name, value in doc_filter.items()):
+                    continue
+                targets.append((doc_id, entry["key"]))
+        if not targets:
+            return []
+
+        # Un seul embedding de la requête pour tous les index
+        query_vector = get_embeddings().embed_query(query)
+        documents = {}
+        dense, sparse = {}, {}
+        for doc_id, key in targets:
+            index = self._get_index(key)
+            if index is None:
+                continue
+            if mode == "hybrid" and not filter:
+                # Scores bruts de chaque index, normalisés et fusionnés une seule fois ensuite :
+                # un score normalisé par index ne se compare pas d'un document à l'autre
+                index_dense, index_sparse = hybrid.raw_scores(index, query, fetch_k=fetch_k, query_vector=query_vector)
+                dense.update(((doc_id, chunk_id), score) for chunk_id, score in index_dense.items())
+                sparse.update(((doc_id, chunk_id), score) for chunk_id, score in index_sparse.items())
+                for chunk_id in set(index_dense) | set(index_sparse):
+                    documents[(doc_id, chunk_id)] = index.docstore.search(chunk_id)
+            else:
+                for doc, distance in index.similarity_search_with_score_by_vector(query_vector, k=fetch_k, filter=filter):
+                    dense[(doc_id, doc.id)] = -float(distance)
+                    documents[(doc_id, doc.id)] = doc
+
+        scores = hybrid.fuse_scores(dense, sparse) if mode == "hybrid" and not filter else dense
+        candidates = []
+        for (doc_id, chunk_id), score in scores.items():
+            doc = documents[(doc_id, chunk_id)]
+            # Copie : les documents du docstore sont partagés entre utilisateurs
+            doc = Document(page_content=doc.page_content, metadata={**doc.metadata, "doc_id": doc_id})
+            candidates.append((chunk_id, doc, score))
+
+        candidates.sort(key=lambda item: item[2], reverse=True)
+        return hybrid.select_results(query, candidates, k, use_rerank=rerank, use_mmr=mmr)
+
+    def stats(self) -> dict:
+        return {"loaded_indexes": len(self._indexes), "max_loaded_indexes": self.max_loaded}
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+def normalize_text(text: str) -> str:
+    """Normalisation appliquée avant embedding et calcul de la clé de cache"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+class _VectorCache:
+    """
+    Cache disque texte -> vecteur (SQLite), borné à max_entries :
+    au-delà, les entrées les moins récemment utilisées sont supprimées.
+    Un petit LRU en mémoire évite les allers-retours disque pour les textes chauds.
+    Les dates d'accès des lectures sont gardées en mémoire et écrites par lots
+    (toutes les flush_entries lectures ou flush_seconds, et avant chaque éviction) :
+    une lecture ne coûte pas d'écriture disque.
+    """
+
+    def __init__(self, path: str, max_entries: int, memory_entries: int = 10000,
+                 flush_entries: int = 1000, flush_seconds: float = 30.0):
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.flush_entries = flush_entries
+        self.flush_seconds = flush_seconds
+        self._accessed = {}
+        self._last_flush = time.monotonic()
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _remember(self, key: str, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_access(self):
+        """Écrit les dates d'accès en attente (verrou tenu par l'appelant, commit à sa charge)"""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()]
+            )
+            self._accessed = {}
+        self._last_flush = time.monotonic()
+
+    def get_many(self, keys) -> dict:
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+
+            if found:
+                now = time.time()
+                self._accessed.update((key, now) for key in found)
+                if (len(self._accessed) >= self.flush_entries
+                        or time.monotonic() - self._last_flush >= self.flush_seconds):
+                    self._flush_access()
+                    self._conn.commit()
+        return found
+
+    def put_many(self, items: dict):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()]
+            )
+            self._count += self._conn.total_changes - before
+            for key, vector in items.items():
+                self._remember(key, vector)
+
+            if self._count > self.max_entries:
+                # L'éviction doit voir les accès récents
+                self._flush_access()
+                # On libère 10 % de marge pour ne pas évincer à chaque insertion
+                excess = self._count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (excess,)
+                )
+                self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._conn.commit()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Fournisseur d'embeddings partagé par tout le processus :
+    - le modèle sentence-transformers n'est chargé qu'une fois, au premier usage
+    - les textes sont encodés par lots
+    - chaque vecteur calculé est mis en cache (clé : modèle + texte normalisé)
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, cache_path: str = EMBEDDING_CACHE_PATH,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._cache = _VectorCache(cache_path, max_entries)
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+
+                    print(f"⏳ Chargement du modèle d'embedding {self.model_name}...")
+                    self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _embed(self, texts, kind: str, compute):
+        normalized = [normalize_text(text) for text in texts]
+        keys = [self._key(kind, text) for text in normalized]
+        cached = self._cache.get_many(list(dict.fromkeys(keys)))
+
+        # Textes absents du cache, dédupliqués
+        to_compute = {}
+        for key, text in zip(keys, normalized):
+            if key not in cached and key not in to_compute:
+                to_compute[key] = text
+        self.hits += len(keys) - sum(1 for key in keys if key in to_compute)
+        self.misses += len(to_compute)
+
+        pending = list(to_compute.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            vectors = compute([text for _, text in batch])
+            computed = {key: vector for (key, _), vector in zip(batch, vectors)}
+            self._cache.put_many(computed)
+            cached.update(computed)
+
+        return [list(cached[key]) for key in keys]
+
+    def embed_documents(self, texts):
+        return self._embed(texts, "doc", lambda batch: self.model.embed_documents(batch))
+
+    def embed_query(self, text):
+        return self._embed([text], "query", lambda batch: [self.model.embed_query(batch[0])])[0]
+
+    def stats(self) -> dict:
+        return {"model": self.model_name, "loaded": self.loaded, "hits": self.hits, "misses": self.misses}
+
+_shared_embeddings = None
+_shared_lock = threading.Lock()
+
+def get_embeddings() -> CachedEmbeddings:
+    """Instance d'embeddings unique pour tout le processus"""
+    global _shared_embeddings
+    if _shared_embeddings is None:
+        with _shared_lock:
+            if _shared_embeddings is None:
+                _shared_embeddings = CachedEmbeddings()
+    return _shared_embeddings
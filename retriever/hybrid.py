@@ -0,0 +1,232 @@
+import math
+import os
+import pickle
+import re
+import threading
+import unicodedata
+import weakref
+
+import numpy as np
+
+from retriever.embeddings import get_embeddings
+
+BM25_FILE = "bm25.pkl"
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text: str) -> list:
+    """Minuscules, sans accents, découpage sur les caractères de mot"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _TOKEN_RE.findall(text)
+
+class BM25Index:
+    """
+    Index lexical BM25 précalculé (listes inversées numpy) sur les chunks d'un index FAISS.
+    Les identifiants sont ceux du docstore FAISS.
+    """
+
+    def __init__(self, ids, texts, k1: float = 1.5, b: float = 0.75):
+        self.ids = list(ids)
+        self.k1 = k1
+        self.b = b
+        tokenized = [tokenize(text) for text in texts]
+        self.doc_len = np.array([len(tokens) for tokens in tokenized], dtype=np.float32)
+        self.avgdl = float(self.doc_len.mean()) if len(tokenized) else 1.0
+
+        postings = {}
+        for doc_idx, tokens in enumerate(tokenized):
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((doc_idx, tf))
+
+        n_docs = len(tokenized)
+        self.postings = {}
+        for token, entries in postings.items():
+            doc_idx = np.array([e[0] for e in entries], dtype=np.int32)
+            tf = np.array([e[1] for e in entries], dtype=np.float32)
+            idf = math.log(1 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            self.postings[token] = (doc_idx, tf, idf)
+
+    @classmethod
+    def from_faiss(cls, index):
+        ids = list(index.index_to_docstore_id.values())
+        texts = [index.docstore.search(doc_id).page_content for doc_id in ids]
+        return cls(ids, texts)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in set(tokenize(query)):
+            entry = self.postings.get(token)
+            if entry is None:
+                continue
+            doc_idx, tf, idf = entry
+            norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[doc_idx] / self.avgdl)
+            scores[doc_idx] += idf * tf * (self.k1 + 1) / norm
+        return scores
+
+    def top(self, query: str, n: int) -> list:
+        """Les n meilleurs chunks : [(id, score)] (scores strictement positifs)"""
+        scores = self.scores(query)
+        if not len(scores):
+            return []
+        n = min(n, len(scores))
+        best = np.argpartition(-scores, n - 1)[:n]
+        best = best[np.argsort(-scores[best])]
+        return [(self.ids[i], float(scores[i])) for i in best if scores[i] > 0]
+
+    def save(self, folder_path: str):
+        with open(os.path.join(folder_path, BM25_FILE), "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(folder_path: str):
+        path = os.path.join(folder_path, BM25_FILE)
+        if not os.path.exists(path):
+            return None
+        # Fichier écrit par nous-mêmes, donc de confiance
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+# Index BM25 associés aux index FAISS chargés en mémoire
+_bm25_indexes = weakref.WeakKeyDictionary()
+_bm25_lock = threading.Lock()
+
+def attach_bm25(index, bm25: BM25Index):
+    with _bm25_lock:
+        _bm25_indexes[index] = bm25
+
+def get_bm25(index) -> BM25Index:
+    """BM25 de l'index FAISS (construit depuis le docstore s'il n'a pas été chargé du disque)"""
+    with _bm25_lock:
+        bm25 = _bm25_indexes.get(index)
+    if bm25 is None or len(bm25.ids) != len(index.index_to_docstore_id):
+        bm25 = BM25Index.from_faiss(index)
+        attach_bm25(index, bm25)
+    return bm25
+
+_cross_encoder = None
+_cross_encoder_lock = threading.Lock()
+
+def _get_cross_encoder():
+    global _cross_encoder
+    if _cross_encoder is None:
+        with _cross_encoder_lock:
+            if _cross_encoder is None:
+                from sentence_transformers import CrossEncoder
+
+                print(f"⏳ Chargement du modèle de reranking {RERANK_MODEL_NAME}...")
+                _cross_encoder = CrossEncoder(RERANK_MODEL_NAME)
+    return _cross_encoder
+
+def _min_max(values: dict) -> dict:
+    if not values:
+        return {}
+    low, high = min(values.values()), max(values.values())
+    if high - low < 1e-9:
+        return {key: 1.0 for key in values}
+    return {key: (value - low) / (high - low) for key, value in values.items()}
+
+def raw_scores(index, query: str, fetch_k: int = 20, query_vector=None):
+    """
+    Scores bruts des candidats d'un index FAISS : (dense, bm25), deux dicts {id: score}.
+    Le score dense est l'opposé de la distance L2 (plus grand = plus proche).
+    Non normalisés : des index différents peuvent être regroupés avant fuse_scores.
+    """
+    if query_vector is None:
+        query_vector = get_embeddings().embed_query(query)
+
+    dense = {}
+    id_by_position = index.index_to_docstore_id
+    scores, positions = index.index.search(np.array([query_vector], dtype=np.float32), fetch_k)
+    for distance, position in zip(scores[0], positions[0]):
+        if position == -1:
+            continue
+        dense[id_by_position[int(position)]] = -float(distance)
+
+    sparse = dict(get_bm25(index).top(query, fetch_k))
+    return dense, sparse
+
+def fuse_scores(dense: dict, sparse: dict, alpha: float = 0.5) -> dict:
+    """
+    Fusion des scores : chacun est normalisé (min-max) sur l'ensemble des candidats,
+    puis alpha * dense + (1 - alpha) * bm25
+    """
+    dense, sparse = _min_max(dense), _min_max(sparse)
+    return {
+        key: alpha * dense.get(key, 0.0) + (1 - alpha) * sparse.get(key, 0.0)
+        for key in set(dense) | set(sparse)
+    }
+
+def hybrid_candidates(index, query: str, fetch_k: int = 20, alpha: float = 0.5, query_vector=None) -> list:
+    """
+    Candidats d'un index FAISS, fusionnant score dense (FAISS) et lexical (BM25).
+    Retourne [(id, Document, score)] trié par score décroissant.
+    """
+    dense, sparse = raw_scores(index, query, fetch_k=fetch_k, query_vector=query_vector)
+    ranked = sorted(fuse_scores(dense, sparse, alpha).items(), key=lambda item: item[1], reverse=True)
+    return [(doc_id, index.docstore.search(doc_id), score) for doc_id, score in ranked]
+
+def mmr_select(candidates: list, k: int, lambda_mult: float = 0.5) -> list:
+    """
+    Sélection MMR : la pertinence est le score des candidats (fusion hybride ou
+    cross-encoder, normalisé), pénalisée par la similarité des embeddings avec les
+    chunks déjà retenus (élimine les quasi-doublons)
+    """
+    if len(candidates) <= 1:
+        return candidates[:k]
+    # Les vecteurs des chunks sont déjà dans le cache d'embeddings (calculés à l'ingestion)
+    vectors = np.array(get_embeddings().embed_documents([doc.page_content for _, doc, _ in candidates]), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+    normalized = _min_max({i: score for i, (_, _, score) in enumerate(candidates)})
+    relevance = np.array([normalized[i] for i in range(len(candidates))], dtype=np.float32)
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(candidates)):
+        redundancy = np.max(vectors @ vectors[selected].T, axis=1)
+        mmr = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        mmr[selected] = -np.inf
+        selected.append(int(np.argmax(mmr)))
+    return [candidates[i] for i in selected]
+
+def rerank(query: str, candidates: list) -> list:
+    """Réordonne les candidats avec un cross-encoder local"""
+    if not candidates:
+        return candidates
+    scores = _get_cross_encoder().predict([(query, doc.page_content) for _, doc, _ in candidates])
+    reranked = [(doc_id, doc, float(score)) for (doc_id, doc, _), score in zip(candidates, scores)]
+    return sorted(reranked, key=lambda item: item[2], reverse=True)
+
+def select_results(query: str, candidates: list, k: int, use_rerank: bool = False,
+                   use_mmr: bool = False) -> list:
+    """
+    Étapes finales communes : reranking optionnel, puis MMR optionnel, puis top-k.
+    Retourne des dicts {content, score, page, source, doc_id, chunk_id}.
+    """
+    if use_rerank:
+        candidates = rerank(query, candidates)
+    if use_mmr:
+        candidates = mmr_select(candidates, k)
+    return [
+        {
+            "content": doc.page_content,
+            "score": score,
+            "page": doc.metadata.get("page"),
+            "source": doc.metadata.get("source"),
+            "doc_id": doc.metadata.get("doc_id"),
+            "chunk_id": chunk_id,
+        }
+        for chunk_id, doc, score in candidates[:k]
+    ]
+
+def hybrid_search(index, query: str, k: int = 3, fetch_k: int = 20, alpha: float = 0.5,
+                  use_rerank: bool = False, use_mmr: bool = False) -> list:
+    """
+    Recherche hybride BM25 + FAISS sur un index, avec reranking et MMR optionnels.
+    """
+    query_vector = get_embeddings().embed_query(query)
+    candidates = hybrid_candidates(index, query, fetch_k=fetch_k, alpha=alpha, query_vector=query_vector)
+    return select_results(query, candidates, k, use_rerank=use_rerank, use_mmr=use_mmr)
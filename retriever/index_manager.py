@@ -1,68 +1,303 @@
+import hashlib
+import json
 import os
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import shutil
+import threading
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import FAISS
 
 from dotenv import load_dotenv
 
+from retriever.doc_cache import file_hash
+from retriever.embeddings import get_embeddings
+from retriever import ann, hybrid
+from retriever.chunking import TokenChunker
+
 load_dotenv()
 
 INDEX_PATH = "faiss_index"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+MANIFEST_FILE = "manifest.json"
 
-def create_faiss_index(pdf_path: str):
+# Les écritures d'index sont sérialisées dans le processus
+_write_lock = threading.Lock()
+
+def _get_embeddings():
+    return get_embeddings()
+
+def _get_splitter():
+    # Une instance par document (section courante, empreintes des chunks déjà produits)
+    return TokenChunker()
+
+def _recover(index_path: str):
     """
-    Charge un PDF, crée un index FAISS vectoriel, et le sauvegarde sur disque.
+    Termine un remplacement interrompu : si l'index a été déplacé en .old
+    sans que le nouveau soit en place, on restaure l'ancien.
     """
-    print(f"Chargement du PDF : {pdf_path}")
-    loader = PyPDFLoader(pdf_path)
-    documents = loader.load()
-
-    print(f"Nombre de pages chargées : {len(documents)}")
+    old_path = f"{index_path}.old"
+    if not os.path.exists(index_path) and os.path.exists(old_path):
+        os.replace(old_path, index_path)
 
-    # On découpe le texte en chunks gérables
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    docs_split = text_splitter.split_documents(documents)
+def _load_manifest(index_path: str) -> dict:
+    manifest_file = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        return {"documents": {}, "index": ann.index_config("flat")}
+    with open(manifest_file, encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest.setdefault("index", ann.index_config("flat"))
+    return manifest
 
-    print(f"Nombre de chunks : {len(docs_split)}")
+def _load_index(index_path: str, embeddings):
+    if not os.path.exists(os.path.join(index_path, "index.faiss")):
+        return None
+    # Index écrit par nous-mêmes, donc de confiance
+    index = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    ann.apply_search_params(index.index, _load_manifest(index_path)["index"])
+    bm25 = hybrid.BM25Index.load(index_path)
+    if bm25 is not None:
+        hybrid.attach_bm25(index, bm25)
+    return index
 
-    # Embeddings HuggingFace
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+def _save(index, manifest: dict, index_path: str):
+    """
+    Écrit l'index et son manifeste de manière atomique : tout est écrit dans
+    un répertoire temporaire, puis substitué à l'ancien par renommage.
+    L'index est d'abord converti au type de la collection si possible ;
+    retourne l'index effectivement sauvegardé.
+    """
+    tmp_path = f"{index_path}.tmp"
+    old_path = f"{index_path}.old"
+    shutil.rmtree(tmp_path, ignore_errors=True)
 
-    # Crée ou recharge un index FAISS
-    if os.path.exists(INDEX_PATH):
-        print("Chargement de l'index FAISS existant...")
-        index = FAISS.load_local(INDEX_PATH, embeddings)
-    else:
-        print("Création d'un nouvel index FAISS...")
-        index = FAISS.from_documents(docs_split, embeddings)
+    index = ann.ensure_index_type(index, manifest["index"], _get_embeddings())
 
-    # Sauvegarde l'index sur disque
-    index.save_local(INDEX_PATH)
-    print(f"Index sauvegardé dans {INDEX_PATH}")
+    index.save_local(tmp_path)
+    # Index lexical précalculé pour la recherche hybride
+    bm25 = hybrid.BM25Index.from_faiss(index)
+    bm25.save(tmp_path)
+    hybrid.attach_bm25(index, bm25)
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
 
+    if os.path.exists(index_path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(index_path, old_path)
+    os.replace(tmp_path, index_path)
+    shutil.rmtree(old_path, ignore_errors=True)
     return index
 
-def load_faiss_index():
+def create_collection(index_path: str, index_type: str = "flat", **params) -> dict:
+    """
+    Crée une collection vide avec le type d'index choisi (flat, hnsw, ivf, pq, ivfpq).
+    Les index qui nécessitent un entraînement restent en recherche exacte jusqu'à
+    ce que la collection contienne assez de chunks, puis sont construits automatiquement.
+    """
+    config = ann.index_config(index_type, **params)
+    with _write_lock:
+        _recover(index_path)
+        manifest = _load_manifest(index_path)
+        if manifest["documents"]:
+            raise ValueError(f"La collection {index_path} contient déjà des documents")
+        manifest["index"] = config
+        os.makedirs(index_path, exist_ok=True)
+        manifest_file = os.path.join(index_path, MANIFEST_FILE)
+        with open(f"{manifest_file}.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(f"{manifest_file}.tmp", manifest_file)
+    return config
+
+def _page_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def iter_page_chunks(pages, doc_id: str, known_pages: dict, splitter):
+    """
+    Découpe les pages d'un document au fil de l'eau.
+    Pour chaque page, produit (page_no, digest, chunks, chunk_ids) ; chunks et
+    chunk_ids valent None si la page donne les mêmes chunks que ceux déjà indexés
+    (known_pages : {page_no: digest}). Toutes les pages passent par le découpeur,
+    dont l'état déborde d'une page à l'autre (section courante, quasi-doublons) :
+    l'empreinte porte sur les chunks produits et les paramètres de découpage,
+    si bien qu'une mise à jour donne le même index qu'une reconstruction complète.
+    Seul l'embedding des pages inchangées est évité.
+    """
+    for position, page in enumerate(splitter.prepare_pages(pages)):
+        page_no = str(page.metadata.get("page", position))
+        page.metadata["doc_id"] = doc_id
+        chunks = splitter.split_documents([page])
+        produced = json.dumps([(chunk.page_content, chunk.metadata.get("section")) for chunk in chunks], ensure_ascii=False)
+        digest = _page_hash(f"{splitter.signature}\n{produced}")
+        if known_pages.get(page_no) == digest:
+            yield page_no, digest, None, None
+            continue
+
+        chunk_ids = [f"{doc_id}:{page_no}:{digest[:12]}:{i}" for i in range(len(chunks))]
+        yield page_no, digest, chunks, chunk_ids
+
+def stale_chunk_ids(old_pages: dict, new_pages: dict) -> list:
+    """
+    Chunks de l'ancienne version d'un document à supprimer :
+    ceux des pages modifiées ou disparues
+    """
+    stale = []
+    for page_no, old_page in old_pages.items():
+        new_page = new_pages.get(page_no)
+        if new_page is None or new_page["hash"] != old_page["hash"]:
+            stale.extend(old_page["chunk_ids"])
+    return stale
+
+def upsert_document(pdf_path: str, doc_id: str = None, index_path: str = INDEX_PATH) -> dict:
+    """
+    Ajoute un PDF à l'index ou le met à jour s'il y est déjà.
+    Seules les pages dont les chunks ont changé sont ré-embeddées.
+    Retourne un résumé {doc_id, added, removed, skipped}.
+    """
+    doc_id = doc_id or os.path.basename(pdf_path)
+    content_hash = file_hash(pdf_path)
+
+    with _write_lock:
+        _recover(index_path)
+        manifest = _load_manifest(index_path)
+        previous = manifest["documents"].get(doc_id)
+
+        splitter = _get_splitter()
+        if previous and previous["content_hash"] == content_hash and previous.get("chunker") == splitter.signature:
+            print(f"Document {doc_id} inchangé, rien à faire.")
+            return {"doc_id": doc_id, "added": 0, "removed": 0, "skipped": len(previous["pages"])}
+
+        print(f"Chargement du PDF : {pdf_path}")
+        old_pages = previous["pages"] if previous else {}
+        known_pages = {page_no: page["hash"] for page_no, page in old_pages.items()}
+        new_pages = {}
+        to_add, to_add_ids = [], []
+        skipped = 0
+
+        pages = PyPDFLoader(pdf_path).lazy_load()
+        for page_no, digest, chunks, chunk_ids in iter_page_chunks(pages, doc_id, known_pages, splitter):
+            if chunks is None:
+                # Page inchangée : on garde ses chunks tels quels
+                new_pages[page_no] = old_pages[page_no]
+                skipped += 1
+                continue
+            to_add.extend(chunks)
+            to_add_ids.extend(chunk_ids)
+            new_pages[page_no] = {"hash": digest, "chunk_ids": chunk_ids}
+        print(f"Nombre de pages chargées : {len(new_pages)}")
+
+        to_remove = stale_chunk_ids(old_pages, new_pages)
+
+        embeddings = _get_embeddings()
+        index = _load_index(index_path, embeddings)
+
+        if to_remove and index is not None:
+            index = ann.delete_chunks(index, to_remove, manifest["index"], embeddings)
+        if to_add:
+            if index is None:
+                index = FAISS.from_documents(to_add, embeddings, ids=to_add_ids)
+            else:
+                index.add_documents(to_add, ids=to_add_ids)
+
+        manifest["documents"][doc_id] = {
+            "source": pdf_path,
+            "content_hash": content_hash,
+            "chunker": splitter.signature,
+            "pages": new_pages
+        }
+        if index is not None:
+            index = _save(index, manifest, index_path)
+
+    print(f"Document {doc_id} : {len(to_add)} chunks ajoutés, {len(to_remove)} supprimés")
+    return {"doc_id": doc_id, "added": len(to_add), "removed": len(to_remove), "skipped": skipped}
+
+def add_document(pdf_path: str, doc_id: str = None, index_path: str = INDEX_PATH) -> dict:
+    """
+    Ajoute un nouveau PDF à l'index. Lève ValueError si doc_id est déjà indexé.
+    """
+    doc_id = doc_id or os.path.basename(pdf_path)
+    if doc_id in _load_manifest(index_path)["documents"]:
+        raise ValueError(f"Le document {doc_id} est déjà indexé (utilisez upsert_document)")
+    return upsert_document(pdf_path, doc_id=doc_id, index_path=index_path)
+
+def delete_document(doc_id: str, index_path: str = INDEX_PATH) -> int:
+    """
+    Supprime un document et tous ses chunks de l'index. Retourne le nombre de chunks supprimés.
+    """
+    with _write_lock:
+        _recover(index_path)
+        manifest = _load_manifest(index_path)
+        entry = manifest["documents"].pop(doc_id, None)
+        if entry is None:
+            return 0
+
+        chunk_ids = [chunk_id for page in entry["pages"].values() for chunk_id in page["chunk_ids"]]
+        embeddings = _get_embeddings()
+        index = _load_index(index_path, embeddings)
+        if index is not None:
+            index = ann.delete_chunks(index, chunk_ids, manifest["index"], embeddings)
+            _save(index, manifest, index_path)
+
+    print(f"Document {doc_id} supprimé ({len(chunk_ids)} chunks)")
+    return len(chunk_ids)
+
+def list_documents(index_path: str = INDEX_PATH) -> dict:
+    """
+    Documents indexés : {doc_id: {"source", "pages", "chunks"}}
+    """
+    _recover(index_path)
+    documents = _load_manifest(index_path)["documents"]
+    return {
+        doc_id: {
+            "source": entry["source"],
+            "pages": len(entry["pages"]),
+            "chunks": sum(len(page["chunk_ids"]) for page in entry["pages"].values())
+        }
+        for doc_id, entry in documents.items()
+    }
+
+def create_faiss_index(pdf_path: str):
+    """
+    Ajoute (ou met à jour) un PDF dans l'index FAISS et retourne l'index.
+    """
+    upsert_document(pdf_path)
+    return load_faiss_index()
+
+def load_faiss_index(index_path: str = INDEX_PATH):
     """
     Charge un index FAISS depuis le disque
     """
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    if os.path.exists(INDEX_PATH):
-        index = FAISS.load_local(INDEX_PATH, embeddings)
+    _recover(index_path)
+    index = _load_index(index_path, _get_embeddings())
+    if index is not None:
         print("Index FAISS chargé.")
         return index
     else:
         print("Pas d'index FAISS trouvé, crée-le d'abord avec create_faiss_index(pdf_path).")
         return None
 
-def query_index(index, query: str, k=3):
+def search_index(index, query: str, k=3, mode: str = RETRIEVAL_MODE, fetch_k: int = 20,
+                 alpha: float = 0.5, rerank: bool = False, mmr: bool = False) -> list:
+    """
+    Recherche k chunks pertinents et retourne leurs scores et métadonnées :
+    [{content, score, page, source, doc_id, chunk_id}]
+    - mode "dense" : similarité FAISS seule
+    - mode "hybrid" : fusion BM25 + FAISS
+    rerank (cross-encoder local) et mmr (déduplication) sont optionnels.
+    """
+    if mode == "hybrid":
+        return hybrid.hybrid_search(index, query, k=k, fetch_k=fetch_k, alpha=alpha, use_rerank=rerank, use_mmr=mmr)
+
+    candidates = [
+        (doc.id, doc, -float(distance))
+        for doc, distance in index.similarity_search_with_score(query, k=fetch_k if (rerank or mmr) else k)
+    ]
+    return hybrid.select_results(query, candidates, k, use_rerank=rerank, use_mmr=mmr)
+
+def query_index(index, query: str, k=3, mode: str = RETRIEVAL_MODE, **kwargs):
     """
     Recherche k documents pertinents à partir d'une query
     """
     if not index:
         return "Aucun index disponible. Merci de créer un index avec un PDF d'abord."
 
-    docs = index.similarity_search(query, k=k)
-    combined = "\n---\n".join([doc.page_content for doc in docs])
+    results = search_index(index, query, k=k, mode=mode, **kwargs)
+    combined = "\n---\n".join([result["content"] for result in results])
     return combined
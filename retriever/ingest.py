@@ -0,0 +1,295 @@
+"""
+Pipeline d'ingestion en flux de PDF vers l'index FAISS :
+
+    pages (lazy_load) -> découpage (retriever/chunking.py) -> lots d'embeddings -> écriture dans l'index
+
+Le parsing des PDF est réparti sur un pool de processus ; les pages transitent
+par une file bornée, ce qui borne la mémoire quelle que soit la taille des
+documents. Les embeddings sont calculés par lots dans le processus principal
+(un seul modèle chargé).
+
+Usage :
+    python -m retriever.ingest dossier_pdfs/ [autre.pdf ...] --workers 4 --batch-size 64
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import queue as queue_module
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.vectorstores import FAISS
+
+from retriever import ann, index_manager
+from retriever.doc_cache import file_hash
+
+# File partagée avec les processus de parsing (initialisée par _init_worker)
+_queue = None
+
+def _init_worker(queue):
+    global _queue
+    _queue = queue
+
+def _parse_pdf(pdf_path: str, doc_id: str, known_pages: dict):
+    """
+    Processus de parsing : lit le PDF page par page et envoie chaque page
+    découpée dans la file. Les pages déjà indexées à l'identique ne sont
+    transmises que sous forme de marqueur (pas de chunks).
+    """
+    try:
+        pages = PyPDFLoader(pdf_path).lazy_load()
+        splitter = index_manager._get_splitter()
+        for page_no, digest, chunks, chunk_ids in index_manager.iter_page_chunks(pages, doc_id, known_pages, splitter):
+            records = None
+            if chunks is not None:
+                records = [(chunk.page_content, chunk.metadata, chunk_id) for chunk, chunk_id in zip(chunks, chunk_ids)]
+            _queue.put(("page", doc_id, page_no, digest, records))
+        _queue.put(("done", doc_id, None, None, None))
+    except Exception as e:
+        _queue.put(("error", doc_id, None, None, str(e)))
+
+def iter_embedded_batches(records, embeddings, batch_size: int):
+    """
+    Regroupe des (texte, metadata, id) en lots de batch_size et les embedde.
+    Produit des listes de (texte, vecteur, metadata, id).
+    """
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            vectors = embeddings.embed_documents([text for text, _, _ in batch])
+            yield [(text, vector, metadata, chunk_id) for (text, metadata, chunk_id), vector in zip(batch, vectors)]
+            batch = []
+    if batch:
+        vectors = embeddings.embed_documents([text for text, _, _ in batch])
+        yield [(text, vector, metadata, chunk_id) for (text, metadata, chunk_id), vector in zip(batch, vectors)]
+
+def add_batch(index, batch, embeddings):
+    """Ajoute un lot embeddé à l'index (le crée s'il n'existe pas encore)"""
+    text_embeddings = [(text, vector) for text, vector, _, _ in batch]
+    metadatas = [metadata for _, _, metadata, _ in batch]
+    ids = [chunk_id for _, _, _, chunk_id in batch]
+    if not any(ids):
+        ids = None  # Identifiants générés par FAISS
+    if index is None:
+        return FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+    index.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return index
+
+def build_document_index(pdf_path: str, embeddings, splitter, batch_size: int = 64, progress=None):
+    """
+    Construit l'index d'un seul PDF en flux (utilisé par DocReaderTool).
+    Retourne (index, nombre de pages, nombre de chunks) ; index vaut None si aucun texte.
+    progress(pages, chunks), s'il est fourni, est appelé après chaque page lue.
+    """
+    pages_count = 0
+    chunks_count = 0
+
+    def records():
+        nonlocal pages_count, chunks_count
+        for page in splitter.prepare_pages(PyPDFLoader(pdf_path).lazy_load()):
+            pages_count += 1
+            for chunk in splitter.split_documents([page]):
+                chunks_count += 1
+                yield chunk.page_content, chunk.metadata, None
+            if progress is not None:
+                progress(pages_count, chunks_count)
+
+    index = None
+    for batch in iter_embedded_batches(records(), embeddings, batch_size):
+        index = add_batch(index, batch, embeddings)
+    return index, pages_count, chunks_count
+
+class _Throughput:
+    """Compteurs de débit de l'ingestion"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.pages = 0
+        self.chunks = 0
+
+    def report(self, prefix: str = "") -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return (f"{prefix}{self.pages} pages, {self.chunks} chunks en {elapsed:.1f}s "
+                f"({self.pages / elapsed:.1f} pages/s, {self.chunks / elapsed:.1f} chunks/s)")
+
+def _documents(pdf_paths) -> list:
+    """
+    (chemin, doc_id) des PDF à ingérer : un chemin seul a pour doc_id son nom de fichier.
+    Lève ValueError si deux fichiers ont le même doc_id (l'un remplacerait l'autre).
+    """
+    documents = [item if isinstance(item, tuple) else (item, os.path.basename(item)) for item in pdf_paths]
+    seen = {}
+    for pdf_path, doc_id in documents:
+        if doc_id in seen and seen[doc_id] != pdf_path:
+            raise ValueError(f"Identifiant de document en double : {doc_id} ({seen[doc_id]} et {pdf_path})")
+        seen[doc_id] = pdf_path
+    return documents
+
+def ingest_pdfs(pdf_paths, index_path: str = index_manager.INDEX_PATH, workers: int = None,
+                batch_size: int = 64, queue_size: int = 256) -> dict:
+    """
+    Ingère une liste de PDF (chemins, ou couples (chemin, doc_id)) dans l'index
+    incrémental d'index_manager. Les documents inchangés sont ignorés, seules les
+    pages modifiées sont ré-embeddées. Retourne les statistiques de débit.
+    """
+    documents = _documents(pdf_paths)
+    workers = workers or os.cpu_count() or 1
+    stats = _Throughput()
+
+    with index_manager._write_lock:
+        index_manager._recover(index_path)
+        manifest = index_manager._load_manifest(index_path)
+        embeddings = index_manager._get_embeddings()
+        index = index_manager._load_index(index_path, embeddings)
+
+        # Documents à (ré)ingérer : contenu ou paramètres de découpage modifiés
+        chunker = index_manager._get_splitter().signature
+        tasks = {}
+        for pdf_path, doc_id in documents:
+            content_hash = file_hash(pdf_path)
+            previous = manifest["documents"].get(doc_id)
+            if previous and previous["content_hash"] == content_hash and previous.get("chunker") == chunker:
+                continue
+            tasks[doc_id] = (pdf_path, content_hash, previous["pages"] if previous else {})
+
+        print(f"📄 {len(tasks)} document(s) à ingérer sur {len(documents)} ({workers} processus)")
+        if not tasks:
+            return {"documents": 0, "pages": 0, "chunks": 0, "errors": 0}
+
+        ctx = multiprocessing.get_context("spawn")
+        queue = ctx.Queue(maxsize=queue_size)
+        new_pages = {doc_id: {} for doc_id in tasks}
+        pending = set(tasks)
+        errors = 0
+        buffer = []
+
+        def flush():
+            nonlocal index, buffer
+            for batch in iter_embedded_batches(buffer, embeddings, batch_size):
+                index = add_batch(index, batch, embeddings)
+            buffer = []
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(queue,)) as pool:
+            futures = {}
+            for doc_id, (pdf_path, _, old_pages) in tasks.items():
+                known_pages = {page_no: page["hash"] for page_no, page in old_pages.items()}
+                futures[doc_id] = pool.submit(_parse_pdf, pdf_path, doc_id, known_pages)
+
+            last_report = time.perf_counter()
+            while pending:
+                try:
+                    kind, doc_id, page_no, digest, payload = queue.get(timeout=1)
+                except queue_module.Empty:
+                    # Processus de parsing mort sans pouvoir signaler son erreur
+                    for doc_id in list(pending):
+                        future = futures[doc_id]
+                        if future.done() and future.exception() is not None:
+                            queue.put(("error", doc_id, None, None, str(future.exception())))
+                    continue
+                if doc_id not in pending:
+                    continue
+
+                if kind == "page":
+                    stats.pages += 1
+                    if payload is None:
+                        new_pages[doc_id][page_no] = tasks[doc_id][2][page_no]
+                    else:
+                        buffer.extend(payload)
+                        stats.chunks += len(payload)
+                        new_pages[doc_id][page_no] = {"hash": digest, "chunk_ids": [chunk_id for _, _, chunk_id in payload]}
+                    if len(buffer) >= batch_size:
+                        flush()
+
+                elif kind == "done":
+                    pending.discard(doc_id)
+                    pdf_path, content_hash, old_pages = tasks[doc_id]
+                    stale = index_manager.stale_chunk_ids(old_pages, new_pages[doc_id])
+                    if stale and index is not None:
+                        index = ann.delete_chunks(index, stale, manifest["index"], embeddings)
+                    manifest["documents"][doc_id] = {
+                        "source": pdf_path,
+                        "content_hash": content_hash,
+                        "chunker": chunker,
+                        "pages": new_pages[doc_id]
+                    }
+
+                else:
+                    pending.discard(doc_id)
+                    errors += 1
+                    print(f"❌ Erreur sur {doc_id}: {payload}")
+                    # On retire les chunks déjà produits pour ce document : son entrée
+                    # du manifeste reste celle de la version précédente
+                    old_ids = {chunk_id for page in tasks[doc_id][2].values() for chunk_id in page["chunk_ids"]}
+                    partial_ids = {
+                        chunk_id
+                        for page in new_pages[doc_id].values()
+                        for chunk_id in page["chunk_ids"]
+                        if chunk_id not in old_ids
+                    }
+                    buffered_ids = {chunk_id for _, _, chunk_id in buffer}
+                    buffer = [record for record in buffer if record[2] not in partial_ids]
+                    flushed_ids = list(partial_ids - buffered_ids)
+                    if flushed_ids and index is not None:
+                        index = ann.delete_chunks(index, flushed_ids, manifest["index"], embeddings)
+
+                if time.perf_counter() - last_report > 5:
+                    print(stats.report("⏳ "))
+                    last_report = time.perf_counter()
+
+        flush()
+        if index is not None:
+            index_manager._save(index, manifest, index_path)
+
+    print(stats.report("✅ "))
+    elapsed = max(time.perf_counter() - stats.start, 1e-9)
+    return {
+        "documents": len(tasks) - errors,
+        "pages": stats.pages,
+        "chunks": stats.chunks,
+        "errors": errors,
+        "pages_per_second": stats.pages / elapsed,
+        "chunks_per_second": stats.chunks / elapsed,
+    }
+
+def _collect_pdfs(paths) -> list:
+    """
+    (chemin, doc_id) des PDF désignés : le doc_id d'un PDF trouvé dans un dossier est
+    son chemin relatif à ce dossier (a/rapport.pdf et b/rapport.pdf restent distincts)
+    """
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pdf_path in sorted(glob.glob(os.path.join(path, "**", "*.pdf"), recursive=True)):
+                pdfs.append((pdf_path, os.path.relpath(pdf_path, path).replace(os.sep, "/")))
+        else:
+            pdfs.append((path, os.path.basename(path)))
+    return pdfs
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion en masse de PDF dans l'index FAISS")
+    parser.add_argument("paths", nargs="+", help="Fichiers PDF ou dossiers à parcourir")
+    parser.add_argument("--index-path", default=index_manager.INDEX_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="Processus de parsing (défaut : nombre de CPU)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Taille des lots d'embeddings")
+    parser.add_argument("--queue-size", type=int, default=256, help="Pages en attente maximum (borne la mémoire)")
+    parser.add_argument("--index-type", choices=list(ann.INDEX_TYPES), default=None,
+                        help="Type d'index d'une nouvelle collection (défaut : flat)")
+    args = parser.parse_args()
+
+    if args.index_type and not index_manager.list_documents(args.index_path):
+        index_manager.create_collection(args.index_path, args.index_type)
+
+    ingest_pdfs(
+        _collect_pdfs(args.paths),
+        index_path=args.index_path,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size
+    )
+
+if __name__ == "__main__":
+    main()
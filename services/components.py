@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+
+
+class LazyComponent:
+    """
+    Composant coûteux (client LLM, modèle, outil) construit au premier usage,
+    une seule fois même en cas d'appels simultanés. Un échec n'est pas mémorisé :
+    l'appel suivant retente la construction.
+    """
+
+    def __init__(self, name: str, factory):
+        self.name = name
+        self.factory = factory
+        self.state = "cold"  # cold, warming, ready, failed
+        self.error = None
+        self.init_seconds = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def get(self):
+        if self.state == "ready":
+            return self._value
+        with self._lock:
+            if self.state != "ready":
+                self.state = "warming"
+                start = time.perf_counter()
+                try:
+                    self._value = self.factory()
+                except Exception as e:
+                    self.state, self.error = "failed", str(e)
+                    raise
+                self.init_seconds = round(time.perf_counter() - start, 2)
+                self.state, self.error = "ready", None
+                print(f"✅ {self.name} prêt en {self.init_seconds:.1f} s")
+        return self._value
+
+    def status(self) -> dict:
+        return {"state": self.state, "init_seconds": self.init_seconds, "error": self.error}
+
+
+class ComponentRegistry:
+    """
+    Composants paresseux de l'application, avec préchauffage optionnel en arrière-plan :
+    le serveur accepte le trafic léger (authentification, historique) pendant que
+    les composants lourds se construisent.
+    """
+
+    def __init__(self):
+        self._components = {}
+        self._warmup_thread = None
+        self.started_at = time.monotonic()
+
+    def register(self, name: str, factory) -> LazyComponent:
+        component = LazyComponent(name, factory)
+        self._components[name] = component
+        return component
+
+    def __getitem__(self, name: str) -> LazyComponent:
+        return self._components[name]
+
+    def get(self, name: str):
+        return self._components[name].get()
+
+    async def get_async(self, name: str):
+        """Comme get, mais une construction éventuelle ne bloque pas la boucle d'événements"""
+        component = self._components[name]
+        if component.ready:
+            return component.get()
+        return await asyncio.to_thread(component.get)
+
+    def warm_up(self, names):
+        """Construit les composants names, dans l'ordre, dans un thread d'arrière-plan"""
+        def run():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"⚠️ Préchauffage de {name} impossible : {e}")
+
+        if self._warmup_thread is None:
+            self._warmup_thread = threading.Thread(target=run, name="warmup", daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    def status(self) -> dict:
+        return {name: component.status() for name, component in self._components.items()}
+
+    def ready(self, names) -> bool:
+        return all(self._components[name].ready for name in names)
@@ -0,0 +1,330 @@
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+DOC_JOBS_DB_PATH = os.getenv("DOC_JOBS_DB_PATH", "document_jobs.sqlite3")
+DOC_UPLOAD_DIR = os.getenv("DOC_UPLOAD_DIR", "uploads")
+DOC_UPLOAD_MAX_MB = float(os.getenv("DOC_UPLOAD_MAX_MB", "50"))
+# Processus d'indexation (chacun charge son propre modèle d'embedding)
+DOC_INDEX_WORKERS = int(os.getenv("DOC_INDEX_WORKERS", "1"))
+# Tâches en attente ou en cours au-delà desquelles les envois sont refusés
+DOC_JOBS_MAX_PENDING = int(os.getenv("DOC_JOBS_MAX_PENDING", "100"))
+
+PENDING_STATUSES = ("queued", "processing")
+# Fréquence maximale des mises à jour de progression écrites par les processus d'indexation
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+_JOB_FIELDS = ("job_id", "uid", "filename", "path", "status", "pages_done", "pages_total", "chunks",
+               "doc_id", "from_cache", "error", "created_at", "started_at", "finished_at")
+
+
+class JobQueueFullError(Exception):
+    """Levée quand trop de tâches d'indexation sont en attente"""
+
+
+class UploadTooLargeError(Exception):
+    """Levée quand un fichier envoyé dépasse DOC_UPLOAD_MAX_MB"""
+
+
+def safe_filename(filename: str) -> str:
+    """Nom de fichier sans chemin ni caractères spéciaux (il devient l'identifiant du document)"""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    stem, _ = os.path.splitext(name)
+    stem = re.sub(r"[^\w.-]+", "_", stem).strip("._")[:100]
+    return f"{stem or 'document'}.pdf"
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+def upload_path(uid: str, job_id: str, filename: str) -> str:
+    """
+    Emplacement d'un PDF envoyé : un répertoire par utilisateur et par envoi (deux
+    envois du même nom ne s'écrasent pas ; le dernier indexé remplace l'autre au catalogue)
+    """
+    user_hash = hashlib.sha256(uid.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(DOC_UPLOAD_DIR, user_hash, job_id, safe_filename(filename))
+
+def save_upload(source, path: str, max_bytes: int = int(DOC_UPLOAD_MAX_MB * 1024 * 1024)) -> int:
+    """
+    Copie par blocs le fichier envoyé (objet fichier) vers path et retourne sa taille.
+    Lève ValueError si ce n'est pas un PDF, UploadTooLargeError s'il dépasse max_bytes.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            for block in iter(lambda: source.read(1024 * 1024), b""):
+                if size == 0 and not block.startswith(b"%PDF-"):
+                    raise ValueError("le fichier n'est pas un PDF")
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"fichier trop volumineux (maximum {max_bytes // (1024 * 1024)} Mo)")
+                f.write(block)
+        if size == 0:
+            raise ValueError("fichier vide")
+    except Exception:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        raise
+    return size
+
+def remove_upload(uid: str, entry: dict):
+    """
+    Supprime le PDF envoyé d'une entrée retirée du catalogue (avec son répertoire d'envoi).
+    Les fichiers hors de DOC_UPLOAD_DIR (chargés par l'outil LectureDoc) ne sont pas touchés.
+    """
+    path = entry.get("path")
+    if not path:
+        return
+    upload_dir = os.path.realpath(DOC_UPLOAD_DIR)
+    job_dir = os.path.dirname(os.path.realpath(path))
+    if os.path.commonpath([upload_dir, job_dir]) == upload_dir and job_dir != upload_dir:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+class DocumentJobStore:
+    """
+    Tâches d'indexation dans SQLite (mode WAL) : écrites par l'API et par les
+    processus d'indexation (progression), lues par les requêtes de suivi.
+    Chaque thread a sa propre connexion.
+    """
+
+    def __init__(self, path: str = DOC_JOBS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS document_jobs (
+                job_id TEXT PRIMARY KEY,
+                uid TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                pages_total INTEGER,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                doc_id TEXT,
+                from_cache INTEGER,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_document_jobs_uid ON document_jobs(uid, created_at);
+            CREATE INDEX IF NOT EXISTS idx_document_jobs_status ON document_jobs(status);
+        """)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        job = dict(zip(_JOB_FIELDS, row))
+        job["from_cache"] = None if job["from_cache"] is None else bool(job["from_cache"])
+        job.pop("path")
+        # Part des pages lues (None tant que le nombre de pages est inconnu)
+        if job["status"] == "done":
+            job["progress"] = 1.0
+        elif job["pages_total"]:
+            job["progress"] = round(min(job["pages_done"] / job["pages_total"], 1.0), 3)
+        else:
+            job["progress"] = None
+        return job
+
+    def create(self, uid: str, filename: str, path: str, job_id: str = None) -> dict:
+        job_id = job_id or new_job_id()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO document_jobs (job_id, uid, filename, path, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, uid, filename, path, time.time())
+            )
+        return self.get(job_id)
+
+    def update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._conn()
+        with conn:
+            conn.execute(f"UPDATE document_jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str, uid: str = None):
+        """Tâche job_id (de l'utilisateur uid s'il est précisé), ou None"""
+        query = f"SELECT {', '.join(_JOB_FIELDS)} FROM document_jobs WHERE job_id = ?"
+        params = [job_id]
+        if uid is not None:
+            query += " AND uid = ?"
+            params.append(uid)
+        row = self._conn().execute(query, params).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, uid: str, limit: int = 20) -> list:
+        rows = self._conn().execute(
+            f"SELECT {', '.join(_JOB_FIELDS)} FROM document_jobs WHERE uid = ? ORDER BY created_at DESC LIMIT ?",
+            (uid, limit)
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def pending(self) -> list:
+        """(job_id, uid, path) des tâches en attente ou en cours, les plus anciennes d'abord"""
+        return self._conn().execute(
+            "SELECT job_id, uid, path FROM document_jobs WHERE status IN (?, ?) ORDER BY created_at",
+            PENDING_STATUSES
+        ).fetchall()
+
+    def count_pending(self) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM document_jobs WHERE status IN (?, ?)", PENDING_STATUSES
+        ).fetchone()[0]
+
+
+def _count_pages(filepath: str):
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(filepath).pages)
+    except Exception:
+        return None  # Le PDF sera rejeté (ou lu malgré tout) par l'indexation
+
+def _index_document(db_path: str, job_id: str, filepath: str, splitter_factory, splitter_params: dict) -> dict:
+    """
+    Exécuté dans un processus d'indexation : lecture du PDF, découpage et embeddings,
+    écriture de l'index dans le cache de documents. La progression est écrite dans la
+    table des tâches ; l'inscription au catalogue de l'utilisateur revient à l'API.
+    """
+    from retriever.document_registry import build_cached_index
+
+    store = DocumentJobStore(db_path)
+    store.update(job_id, status="processing", started_at=time.time(), pages_total=_count_pages(filepath))
+    last_update = 0.0
+
+    def progress(pages: int, chunks: int):
+        nonlocal last_update
+        now = time.monotonic()
+        if now - last_update >= PROGRESS_INTERVAL_SECONDS:
+            store.update(job_id, pages_done=pages, chunks=chunks)
+            last_update = now
+
+    _, meta, from_cache = build_cached_index(filepath, splitter_factory(), splitter_params, progress=progress)
+    return {"pages": meta["pages"], "chunks": meta["chunks"], "from_cache": from_cache}
+
+
+class DocumentJobQueue:
+    """
+    File d'indexation des documents envoyés à l'API : le parsing et les embeddings
+    tournent dans des processus séparés, sans bloquer ni la boucle d'événements ni
+    les workers de l'agent. Une tâche terminée inscrit le document dans le catalogue
+    de l'utilisateur (registre partagé avec DocReaderTool) puis appelle
+    on_indexed(uid, entrée du catalogue).
+    Les tâches interrompues par un redémarrage sont relancées à la construction.
+    """
+
+    def __init__(self, registry, store: DocumentJobStore, workers: int = 1, max_pending: int = 100, on_indexed=None):
+        self.registry = registry
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.on_indexed = on_indexed
+        self._executor = None
+        self._lock = threading.Lock()
+        self._recover()
+
+    @classmethod
+    def from_env(cls, registry, store: DocumentJobStore = None, on_indexed=None):
+        return cls(
+            registry,
+            store if store is not None else DocumentJobStore(DOC_JOBS_DB_PATH),
+            workers=DOC_INDEX_WORKERS,
+            max_pending=DOC_JOBS_MAX_PENDING,
+            on_indexed=on_indexed,
+        )
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn : processus neufs, sans les threads ni les modèles du processus de l'API
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _recover(self):
+        for job_id, uid, path in self.store.pending():
+            if os.path.exists(path):
+                print(f"🔄 Reprise de l'indexation {job_id}")
+                self._start(job_id, uid, path)
+            else:
+                self.store.update(job_id, status="failed", error="Fichier introuvable après redémarrage", finished_at=time.time())
+
+    def is_full(self) -> bool:
+        return self.store.count_pending() >= self.max_pending
+
+    def submit(self, uid: str, filename: str, path: str, job_id: str = None) -> dict:
+        """Crée la tâche d'indexation du PDF path ; lève JobQueueFullError si la file est pleine"""
+        if self.is_full():
+            raise JobQueueFullError("Trop de documents en cours d'indexation, réessayez dans quelques instants")
+        job = self.store.create(uid, filename, path, job_id)
+        self._start(job["job_id"], uid, path)
+        return job
+
+    def _start(self, job_id: str, uid: str, path: str):
+        future = self._get_executor().submit(
+            _index_document, self.store.path, job_id, path, self.registry.splitter_factory, self.registry.splitter_params
+        )
+        future.add_done_callback(lambda f: self._finish(f, job_id, uid, path))
+
+    def _finish(self, future, job_id: str, uid: str, path: str):
+        """Fin d'une tâche (thread de gestion du pool) : inscription au catalogue ou échec"""
+        if future.cancelled():
+            return  # Arrêt de l'API : la tâche reste en attente et sera reprise au redémarrage
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # Processus d'indexation tué (mémoire...) : un nouveau pool sera créé
+            with self._lock:
+                self._executor = None
+        if error is not None:
+            message = str(error) if isinstance(error, ValueError) else f"{type(error).__name__}: {error}"
+            self.store.update(job_id, status="failed", error=message, finished_at=time.time())
+            print(f"❌ Indexation {job_id} en échec : {message}")
+            # Le PDF ne sera jamais au catalogue : inutile de le garder
+            remove_upload(uid, {"path": path})
+            return
+
+        result = future.result()
+        try:
+            # L'index est déjà dans le cache : l'inscription ne fait que lire ses métadonnées
+            # Un nouvel envoi du même nom remplace le document précédent
+            doc_id = os.path.splitext(os.path.basename(path))[0]
+            entry = self.registry.load(uid, path, doc_id=doc_id)
+        except Exception as e:
+            self.store.update(job_id, status="failed", error=str(e), finished_at=time.time())
+            remove_upload(uid, {"path": path})
+            return
+        self.store.update(
+            job_id, status="done", doc_id=entry["doc_id"], pages_done=result["pages"], pages_total=result["pages"],
+            chunks=result["chunks"], from_cache=int(result["from_cache"]), finished_at=time.time()
+        )
+        if self.on_indexed is not None:
+            try:
+                self.on_indexed(uid, entry)
+            except Exception as e:
+                print(f"⚠️ Suite de l'indexation {job_id} : {e}")
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "pending": self.store.count_pending(), "max_pending": self.max_pending}
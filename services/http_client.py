@@ -0,0 +1,64 @@
+import asyncio
+import os
+import random
+
+import httpx
+
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_RETRY_BACKOFF_SECONDS = float(os.getenv("HTTP_RETRY_BACKOFF_SECONDS", "0.5"))
+# Attente maximale entre deux tentatives, Retry-After du serveur compris
+HTTP_RETRY_MAX_DELAY_SECONDS = float(os.getenv("HTTP_RETRY_MAX_DELAY_SECONDS", "5"))
+
+# Réponses qui justifient une nouvelle tentative (surcharge ou indisponibilité passagère)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Client HTTP asynchrone partagé par l'API : les connexions (TCP + TLS) sont
+    gardées ouvertes et réutilisées d'une requête à l'autre (keep-alive)
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS // 2
+            ),
+        )
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def request_with_retries(method: str, url: str, max_retries: int = HTTP_MAX_RETRIES,
+                               backoff: float = HTTP_RETRY_BACKOFF_SECONDS,
+                               max_delay: float = HTTP_RETRY_MAX_DELAY_SECONDS, **kwargs) -> httpx.Response:
+    """
+    Requête via le client partagé, relancée en cas d'erreur réseau ou de réponse
+    429/5xx, avec un délai exponentiel (backoff * 2^tentative, plus une part aléatoire)
+    ou le Retry-After du serveur, plafonnés à max_delay.
+    Retourne la dernière réponse, sans lever d'exception pour les codes d'erreur HTTP.
+    """
+    client = get_http_client()
+    for attempt in range(max_retries + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                await asyncio.sleep(min(float(retry_after), max_delay))
+                continue
+        except httpx.TransportError:
+            if attempt == max_retries:
+                raise
+        await asyncio.sleep(min(backoff * 2 ** attempt, max_delay) + random.uniform(0, backoff))
@@ -0,0 +1,465 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables import RunnableBinding
+
+from services.tracing import METRICS, current_trace
+
+# Passerelle unique vers le fournisseur LLM, partagée par l'agent et DocReaderTool
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Limites de débit côté client (0 : pas de limite), à aligner sur le quota du projet
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "300"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))
+# Attente maximale d'un créneau (débit + concurrence) avant d'abandonner l'appel
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.5"))
+LLM_RETRY_MAX_DELAY_SECONDS = float(os.getenv("LLM_RETRY_MAX_DELAY_SECONDS", "20"))
+# Requête dupliquée quand la réponse tarde au-delà du p95 observé (jamais avant LLM_HEDGE_MIN_SECONDS)
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_MIN_SECONDS = float(os.getenv("LLM_HEDGE_MIN_SECONDS", "2"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+# Modèle utilisé quand le modèle principal reste indisponible après les relances ("" : aucun)
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+# Tokens générés supposés pour réserver le débit avant l'appel (corrigé d'après l'usage réel)
+LLM_ESTIMATED_OUTPUT_TOKENS = int(os.getenv("LLM_ESTIMATED_OUTPUT_TOKENS", "256"))
+
+# Latences gardées par modèle pour estimer le délai de duplication, et minimum avant d'en dupliquer
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+# Erreurs passagères du fournisseur (quota, surcharge, indisponibilité, délai dépassé)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+GATEWAY_QUEUE = METRICS.histogram("llm_gateway_queue_seconds", "Attente d'un créneau avant un appel au LLM (débit et concurrence)")
+GATEWAY_EVENTS = METRICS.counter(
+    "llm_gateway_events_total",
+    "Événements de la passerelle LLM (relances, requêtes dupliquées, bascules, rejets)",
+    ("event",)
+)
+
+
+class LLMQueueTimeoutError(Exception):
+    """Levée quand aucun créneau d'appel au LLM ne se libère dans le délai imparti"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Erreur passagère qui justifie une nouvelle tentative (429, 5xx, délai, réseau)"""
+    if isinstance(error, LLMQueueTimeoutError):
+        return False
+    # google.api_core (ResourceExhausted, ServiceUnavailable...) : code HTTP dans .code
+    code = getattr(error, "code", None)
+    if not isinstance(code, int):
+        code = getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+def estimate_tokens(messages) -> int:
+    """Tokens d'un appel (prompt à 4 caractères par token, plus la réponse attendue)"""
+    return sum(len(str(message.content)) for message in messages) // 4 + LLM_ESTIMATED_OUTPUT_TOKENS
+
+
+def _unwrap(model):
+    """(modèle de chat, arguments liés) : bind_tools retourne souvent un RunnableBinding"""
+    if isinstance(model, RunnableBinding):
+        return model.bound, dict(model.kwargs)
+    return model, {}
+
+
+def model_name(model) -> str:
+    chat_model = _unwrap(model)[0]
+    return getattr(chat_model, "model", None) or getattr(chat_model, "model_name", None) or chat_model._llm_type
+
+
+def _usage_tokens(message) -> int:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_tokens") or usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+
+class TokenBucket:
+    """Seau à jetons : rate jetons par seconde, au plus capacity en réserve (rate <= 0 : illimité)"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, amount: float = 1) -> float:
+        """Prélève amount si possible et retourne 0, sinon le délai d'attente estimé (rien n'est prélevé)"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Une demande plus grosse que la capacité passe quand le seau est plein
+            needed = min(amount, self.capacity)
+            if self.tokens >= needed:
+                self.tokens -= amount
+                return 0.0
+            return (needed - self.tokens) / self.rate
+
+    def acquire(self, amount: float, deadline: float) -> bool:
+        """Attend de pouvoir prélever amount ; False si ce n'est pas possible avant deadline"""
+        while True:
+            delay = self.try_acquire(amount)
+            if delay == 0:
+                return True
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+
+    def adjust(self, amount: float):
+        """Prélève (ou rend, si négatif) amount après coup : le solde peut devenir négatif"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class LLMGateway:
+    """
+    Point de passage de tous les appels au LLM :
+
+    - débit limité côté client (requêtes et tokens par minute, seaux à jetons)
+    - nombre d'appels simultanés plafonné, avec une attente bornée (queue_timeout)
+    - relances avec délai exponentiel et aléatoire sur les erreurs passagères (429, 5xx)
+    - requête dupliquée (hedging) si la réponse tarde au-delà du p95 observé : la
+      première réponse est retenue, l'autre est ignorée
+    - bascule vers le modèle de secours quand le principal reste en échec
+    """
+
+    def __init__(self, max_concurrency: int = 8, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 queue_timeout: float = 30.0, max_retries: int = 3, backoff: float = 0.5, max_delay: float = 20.0,
+                 hedge: bool = False, hedge_min_delay: float = 2.0, hedge_percentile: float = 0.95):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_percentile = hedge_percentile
+        # Capacité : une minute de débit au plus en rafale
+        self.requests = TokenBucket(requests_per_minute / 60, max(requests_per_minute, 1))
+        self.tokens = TokenBucket(tokens_per_minute / 60, max(tokens_per_minute, 1))
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-call") if hedge else None
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self._counts = {"calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+                        "fallbacks": 0, "failures": 0, "rejected": 0}
+        self._queue_wait = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_concurrency=LLM_MAX_CONCURRENCY,
+            requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+            queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS,
+            max_retries=LLM_MAX_RETRIES,
+            backoff=LLM_RETRY_BACKOFF_SECONDS,
+            max_delay=LLM_RETRY_MAX_DELAY_SECONDS,
+            hedge=LLM_HEDGE_ENABLED,
+            hedge_min_delay=LLM_HEDGE_MIN_SECONDS,
+            hedge_percentile=LLM_HEDGE_PERCENTILE,
+        )
+
+    def _count(self, event: str, value: int = 1):
+        with self._lock:
+            self._counts[event] += value
+        if event not in ("calls", "attempts"):
+            GATEWAY_EVENTS.inc(value, event=event)
+
+    # --- Créneaux (débit + concurrence) ---
+
+    def _reserve(self, estimated_tokens: int):
+        """Attend un créneau d'appel ; lève LLMQueueTimeoutError après queue_timeout"""
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        with self._lock:
+            self._queued += 1
+        try:
+            if not self.requests.acquire(1, deadline):
+                raise LLMQueueTimeoutError("Limite de requêtes au LLM atteinte")
+            if not self.tokens.acquire(estimated_tokens, deadline):
+                self.requests.adjust(-1)
+                raise LLMQueueTimeoutError("Limite de tokens du LLM atteinte")
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self.requests.adjust(-1)
+                self.tokens.adjust(-estimated_tokens)
+                raise LLMQueueTimeoutError("Trop d'appels au LLM en cours")
+        except LLMQueueTimeoutError:
+            self._count("rejected")
+            raise
+        finally:
+            waited = time.monotonic() - start
+            with self._lock:
+                self._queued -= 1
+                self._queue_wait += waited
+            GATEWAY_QUEUE.observe(waited)
+        with self._lock:
+            self._in_flight += 1
+        # Attente visible dans la trace de la requête (répartition par étape du banc de charge)
+        trace = current_trace()
+        if trace is not None and waited >= 0.001:
+            trace.add_span("llm_queue", time.perf_counter() - waited, waited)
+
+    def _try_reserve(self, estimated_tokens: int) -> bool:
+        """Créneau pour une requête dupliquée, seulement s'il est libre immédiatement"""
+        if self.requests.try_acquire(1):
+            return False
+        if self.tokens.try_acquire(estimated_tokens):
+            self.requests.adjust(-1)
+            return False
+        if not self._slots.acquire(blocking=False):
+            self.requests.adjust(-1)
+            self.tokens.adjust(-estimated_tokens)
+            return False
+        with self._lock:
+            self._in_flight += 1
+        return True
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    # --- Appels ---
+
+    def _record_latency(self, name: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(name, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def hedge_delay(self, name: str):
+        """Délai avant de dupliquer un appel à name (None : pas de duplication)"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies.get(name, ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        observed = latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile))]
+        return max(self.hedge_min_delay, observed)
+
+    def _execute(self, name: str, model, messages, stop, kwargs, estimated_tokens: int):
+        """Un appel au fournisseur, créneau déjà réservé (libéré à la fin)"""
+        self._count("attempts")
+        try:
+            start = time.perf_counter()
+            chat_model, bound = _unwrap(model)
+            result = chat_model._generate(messages, stop=stop, **{**bound, **kwargs})
+            self._record_latency(name, time.perf_counter() - start)
+        finally:
+            self._release()
+        used = sum(_usage_tokens(generation.message) for generation in result.generations)
+        if used:
+            self.tokens.adjust(used - estimated_tokens)
+        return result
+
+    def _call(self, name: str, model, messages, stop, kwargs):
+        estimated_tokens = estimate_tokens(messages)
+        self._reserve(estimated_tokens)
+        delay = self.hedge_delay(name)
+        if delay is None:
+            return self._execute(name, model, messages, stop, kwargs, estimated_tokens)
+
+        context = contextvars.copy_context()
+        first = self._executor.submit(context.run, self._execute, name, model, messages, stop, kwargs, estimated_tokens)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+        if not self._try_reserve(estimated_tokens):
+            return first.result()
+        self._count("hedges")
+        hedged = self._executor.submit(context.copy().run, self._execute, name, model, messages, stop, kwargs, estimated_tokens)
+        pending, errors = {first, hedged}, []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedged:
+                        self._count("hedge_wins")
+                    return future.result()
+                errors.append(future.exception())
+        raise errors[0]
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        retry_after = getattr(error, "retry_after", None)
+        if isinstance(retry_after, (int, float)) and retry_after > 0:
+            return min(float(retry_after), self.max_delay)
+        return min(self.backoff * 2 ** (attempt - 1), self.max_delay) + random.uniform(0, self.backoff)
+
+    def _attempts(self, candidates):
+        """(nom, modèle) de chaque tentative : relances du principal, puis du modèle de secours"""
+        for index, model in enumerate(candidates):
+            name = model_name(model)
+            for attempt in range(self.max_retries + 1):
+                yield index, attempt, name, model
+
+    def generate(self, candidates, messages, stop=None, **kwargs):
+        """
+        Appel complet (ChatResult) : candidates = [modèle principal, modèle de secours...].
+        Les erreurs non passagères (requête invalide...) sont propagées sans relance.
+        """
+        self._count("calls")
+        last_error = None
+        for index, attempt, name, model in self._attempts(candidates):
+            if last_error is not None:
+                self._before_attempt(index, attempt, name, last_error)
+            try:
+                result = self._call(name, model, messages, stop, kwargs)
+                result.llm_output = {**(result.llm_output or {}), "model": name}
+                return result
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                last_error = e
+        self._count("failures")
+        raise last_error
+
+    def stream(self, candidates, messages, stop=None, **kwargs):
+        """
+        Appel en flux (ChatGenerationChunk) : relances et bascule possibles tant
+        qu'aucun fragment n'a été produit ; pas de requête dupliquée
+        """
+        self._count("calls")
+        last_error = None
+        for index, attempt, name, model in self._attempts(candidates):
+            if last_error is not None:
+                self._before_attempt(index, attempt, name, last_error)
+            estimated_tokens = estimate_tokens(messages)
+            self._reserve(estimated_tokens)
+            self._count("attempts")
+            started, used = False, 0
+            try:
+                start = time.perf_counter()
+                chat_model, bound = _unwrap(model)
+                for chunk in chat_model._stream(messages, stop=stop, **{**bound, **kwargs}):
+                    started = True
+                    used += _usage_tokens(chunk.message)
+                    yield chunk
+                self._record_latency(name, time.perf_counter() - start)
+            except Exception as e:
+                if started or not is_retryable(e):
+                    raise
+                last_error = e
+                continue
+            finally:
+                self._release()
+            if used:
+                self.tokens.adjust(used - estimated_tokens)
+            return
+        self._count("failures")
+        raise last_error
+
+    def _before_attempt(self, index: int, attempt: int, name: str, error: Exception):
+        if attempt == 0:
+            self._count("fallbacks")
+            print(f"⚠️ Bascule vers le modèle de secours {name} : {error}")
+            return
+        self._count("retries")
+        time.sleep(self._retry_delay(attempt, error))
+
+    def stats(self) -> dict:
+        hedge_delays = {}
+        for name in list(self._latencies):
+            delay = self.hedge_delay(name)
+            if delay is not None:
+                hedge_delays[name] = round(delay, 3)
+        with self._lock:
+            calls = self._counts["calls"]
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "max_concurrency": self.max_concurrency,
+                **self._counts,
+                "avg_queue_seconds": round(self._queue_wait / calls, 4) if calls else 0.0,
+                "hedge_delays": hedge_delays,
+            }
+
+
+class GatewayChatModel(BaseChatModel):
+    """
+    Modèle de chat LangChain dont les appels passent par une LLMGateway :
+    utilisable partout où un modèle est attendu (agent, mémoire, chaînes QA).
+    primary et fallback sont des modèles de chat (ou le résultat de leur bind_tools).
+    """
+    primary: object
+    fallback: object = None
+    gateway: object = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-gateway"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": model_name(self.primary), "fallback": model_name(self.fallback) if self.fallback is not None else None}
+
+    @property
+    def temperature(self):
+        return getattr(_unwrap(self.primary)[0], "temperature", None)
+
+    def _candidates(self) -> list:
+        return [model for model in (self.primary, self.fallback) if model is not None]
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={
+            "primary": self.primary.bind_tools(tools, **kwargs),
+            "fallback": self.fallback.bind_tools(tools, **kwargs) if self.fallback is not None else None,
+        })
+
+    def _should_stream(self, *, async_api: bool, run_manager=None, **kwargs) -> bool:
+        # Flux seulement si le modèle principal sait le produire (sinon appel complet)
+        if type(_unwrap(self.primary)[0])._stream is BaseChatModel._stream:
+            return False
+        return super()._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.gateway.generate(self._candidates(), messages, stop=stop, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        yield from self.gateway.stream(self._candidates(), messages, stop=stop, **kwargs)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway() -> LLMGateway:
+    """Passerelle partagée par tous les modèles du processus (quotas et concurrence communs)"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway.from_env()
+                METRICS.gauge("llm_gateway_in_flight", "Appels au LLM en cours", lambda: _gateway.stats()["in_flight"])
+                METRICS.gauge("llm_gateway_queued", "Appels au LLM en attente d'un créneau", lambda: _gateway.stats()["queued"])
+    return _gateway
+
+def create_chat_model(model: str, temperature: float, api_key: str) -> GatewayChatModel:
+    """
+    ChatGoogleGenerativeAI derrière la passerelle partagée, avec LLM_FALLBACK_MODEL
+    comme modèle de secours s'il est défini. Les relances sont confiées à la passerelle.
+    """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    def build(name: str):
+        return ChatGoogleGenerativeAI(model=name, temperature=temperature, google_api_key=api_key, max_retries=1)
+
+    fallback = build(LLM_FALLBACK_MODEL) if LLM_FALLBACK_MODEL and LLM_FALLBACK_MODEL != model else None
+    return GatewayChatModel(primary=build(model), fallback=fallback, gateway=get_llm_gateway())
@@ -0,0 +1,34 @@
+import contextvars
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from langchain.agents import AgentExecutor
+
+AGENT_TOOL_CONCURRENCY = int(os.getenv("AGENT_TOOL_CONCURRENCY", "8"))
+
+# Pool partagé par toutes les sessions : borne le nombre d'appels d'outils simultanés
+_tool_pool = ThreadPoolExecutor(max_workers=AGENT_TOOL_CONCURRENCY, thread_name_prefix="agent-tool")
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor qui exécute simultanément les appels d'outils émis dans une même
+    étape (agent à appel de fonctions) : toutes les observations sont renvoyées
+    ensemble au LLM à l'étape suivante, dans l'ordre des appels.
+    """
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        # Démarre l'appel sans attendre : le résultat est récupéré dans _iter_next_step
+        perform = super()._perform_agent_action
+        context = contextvars.copy_context()
+        return _tool_pool.submit(context.run, perform, name_to_tool_map, color_mapping, agent_action, run_manager)
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        pending = []
+        for item in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+            if isinstance(item, Future):
+                pending.append(item)
+            else:
+                yield item
+        for future in pending:
+            yield future.result()
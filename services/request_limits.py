@@ -0,0 +1,44 @@
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# Marge pour l'enveloppe multipart (en-têtes de partie, délimiteurs) autour du fichier
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class BodySizeLimitMiddleware:
+    """
+    Middleware ASGI qui refuse (413) les requêtes POST sur path dont le corps dépasse
+    max_bytes, avant que Starlette ne l'écrive dans un fichier temporaire : dès
+    l'en-tête Content-Length s'il est présent, sinon au fil des blocs reçus
+    (envoi chunked ou Content-Length mensonger).
+    """
+
+    def __init__(self, app, path: str, max_bytes: int, detail: str = "Requête trop volumineuse"):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+        self.detail = detail
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await JSONResponse({"detail": self.detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Relevée telle quelle par FastAPI pendant la lecture du formulaire
+                    raise HTTPException(status_code=413, detail=self.detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
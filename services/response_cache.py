@@ -0,0 +1,290 @@
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Résultat d'une règle de cache d'outil
+NEVER = "never"        # la réponse ne doit pas être mise en cache
+MUTATION = "mutation"  # idem, et les réponses en cache de l'utilisateur deviennent obsolètes
+
+def _doc_reader_rule(tool_input: str):
+    command = tool_input.strip().lower()
+    if command.startswith(("load:", "load ", "use:", "unload:")):
+        return MUTATION
+    if command in ("docs", "list"):
+        return NEVER
+    # Réponse qui dépend des documents de l'utilisateur
+    return ("user", None)
+
+def _todo_rule(tool_input: str):
+    # Ajout ou suppression de tâches : les réponses de l'utilisateur qui en dépendent sont obsolètes
+    if tool_input.strip().lower().startswith(("add:", "remove:")):
+        return MUTATION
+    return NEVER
+
+# Règles par outil : tool_input -> NEVER, MUTATION ou (portée, ttl en secondes ou None).
+# La portée "global" partage la réponse entre utilisateurs, "user" la restreint à l'utilisateur.
+# Un outil absent de cette table rend la réponse non cacheable.
+TOOL_CACHE_RULES = {
+    "TODO": _todo_rule,
+    "RechercheWeb": lambda tool_input: ("global", 600),
+    "Calculator": lambda tool_input: ("global", None),
+    "LectureDoc": _doc_reader_rule,
+}
+
+def normalize_prompt(text: str) -> str:
+    """Forme canonique d'une question : casse, accents composés, espaces et ponctuation finale"""
+    text = " ".join(unicodedata.normalize("NFC", text).casefold().split())
+    return text.rstrip(" ?!.;")
+
+class ToolRecorder(BaseCallbackHandler):
+    """Callback qui note les outils appelés par l'agent pendant une exécution"""
+
+    def __init__(self):
+        self.calls = []
+
+    def on_agent_action(self, action, **kwargs):
+        self.calls.append((action.tool, str(action.tool_input)))
+
+class _Entry:
+    __slots__ = ("key", "scope", "context", "response", "expires_at", "slot")
+
+    def __init__(self, key, scope, context, response, expires_at):
+        self.key = key
+        self.scope = scope
+        self.context = context
+        self.response = response
+        self.expires_at = expires_at
+        self.slot = None
+
+class ResponseCache:
+    """
+    Cache des réponses de l'agent, à deux niveaux :
+    - exact : question normalisée + empreinte du contexte (modèle, outils, état de la conversation)
+    - sémantique : question dont l'embedding est assez proche (cosinus >= similarity_threshold)
+      d'une question en cache, dans le même contexte
+
+    Les entrées expirent après ttl_seconds (ou le TTL plus court imposé par un outil)
+    et, au-delà de max_entries, les moins récemment utilisées sont évincées (LRU).
+    Les vecteurs sont rangés dans une matrice numpy préallouée : la recherche
+    sémantique est un simple produit matrice-vecteur.
+    """
+
+    def __init__(self, embeddings=None, max_entries: int = 2000, ttl_seconds: float = 3600.0,
+                 similarity_threshold: float = 0.95, semantic: bool = True, tool_rules: dict = None):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.semantic = semantic and embeddings is not None
+        self.tool_rules = TOOL_CACHE_RULES if tool_rules is None else tool_rules
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._slots = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.uncacheable = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, embeddings=None):
+        """Construit le cache à partir des variables d'environnement (None s'il est désactivé)"""
+        if os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            embeddings,
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000")),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+            similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95")),
+            semantic=os.getenv("RESPONSE_CACHE_SEMANTIC", "true").lower() == "true",
+        )
+
+    @staticmethod
+    def context_key(*parts) -> str:
+        """Empreinte des éléments de contexte dont dépend la réponse"""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def _key(scope, context: str, prompt: str) -> str:
+        return hashlib.sha256(f"{scope or ''}\0{context}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _embed(self, prompt: str):
+        try:
+            vector = np.asarray(self.embeddings.embed_query(prompt), dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️ Cache sémantique désactivé (embedding impossible) : {e}")
+            self.semantic = False
+            return None
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+    def _remove(self, entry: _Entry):
+        del self._entries[entry.key]
+        if entry.slot is not None:
+            self._matrix[entry.slot] = 0.0
+            self._slots[entry.slot] = None
+            self._free_slots.append(entry.slot)
+
+    def _semantic_lookup(self, vector, scopes, context: str, now: float):
+        if self._matrix is None:
+            return None
+        similarities = self._matrix @ vector
+        candidates = np.flatnonzero(similarities >= self.similarity_threshold)
+        for slot in candidates[np.argsort(-similarities[candidates])]:
+            entry = self._slots[slot]
+            if entry is None or entry.scope not in scopes or entry.context != context:
+                continue
+            if entry.expires_at <= now:
+                self._remove(entry)
+                continue
+            return entry
+        return None
+
+    def lookup(self, prompt: str, user_id: str = None, context: str = ""):
+        """Réponse en cache pour cette question, ou None"""
+        normalized = normalize_prompt(prompt)
+        now = time.monotonic()
+        scopes = (user_id, None) if user_id is not None else (None,)
+
+        with self._lock:
+            for scope in scopes:
+                entry = self._entries.get(self._key(scope, context, normalized))
+                if entry is None:
+                    continue
+                if entry.expires_at <= now:
+                    self._remove(entry)
+                    continue
+                self._entries.move_to_end(entry.key)
+                self.exact_hits += 1
+                return entry.response
+
+        if self.semantic:
+            vector = self._embed(normalized)
+            if vector is not None:
+                with self._lock:
+                    entry = self._semantic_lookup(vector, scopes, context, now)
+                    if entry is not None:
+                        self._entries.move_to_end(entry.key)
+                        self.semantic_hits += 1
+                        return entry.response
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def policy(self, tool_calls):
+        """
+        Applique les règles des outils appelés : retourne (portée, ttl) si la réponse
+        est cacheable, NEVER ou MUTATION sinon
+        """
+        scope, ttl = "global", self.ttl_seconds
+        result = None
+        for tool_name, tool_input in tool_calls:
+            rule = self.tool_rules.get(tool_name)
+            decision = rule(tool_input) if rule is not None else NEVER
+            if decision == MUTATION:
+                return MUTATION
+            if decision == NEVER:
+                result = NEVER
+                continue
+            tool_scope, tool_ttl = decision
+            if tool_scope == "user":
+                scope = "user"
+            if tool_ttl is not None:
+                ttl = min(ttl, tool_ttl)
+        return result or (scope, ttl)
+
+    def store(self, prompt: str, response: str, user_id: str = None, context: str = "", tool_calls=()) -> bool:
+        """
+        Met en cache la réponse à prompt si les outils utilisés le permettent.
+        Retourne True si la réponse a été mise en cache. Les réponses rendues obsolètes
+        par les outils appelés sont à supprimer à part (invalidate_after).
+        """
+        decision = self.policy(tool_calls)
+        if decision in (NEVER, MUTATION):
+            with self._lock:
+                self.uncacheable += 1
+            return False
+
+        scope, ttl = decision
+        if scope == "user":
+            if user_id is None:
+                # Réponse propre à un utilisateur inconnu : on ne la partage pas
+                return False
+            scope = user_id
+        else:
+            scope = None
+
+        normalized = normalize_prompt(prompt)
+        vector = self._embed(normalized) if self.semantic else None
+        key = self._key(scope, context, normalized)
+        entry = _Entry(key, scope, context, response, time.monotonic() + ttl)
+
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._remove(previous)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries.values())))
+                self.evictions += 1
+            self._entries[key] = entry
+            if vector is not None:
+                if self._matrix is None:
+                    self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                entry.slot = self._free_slots.pop()
+                self._matrix[entry.slot] = vector
+                self._slots[entry.slot] = entry
+            self.stores += 1
+        return True
+
+    def invalidate_after(self, user_id: str, tool_calls) -> int:
+        """
+        Supprime les réponses de l'utilisateur si un des outils appelés a modifié ses données
+        (à appeler après chaque exécution, même interrompue ou en erreur)
+        """
+        if user_id is None or self.policy(tool_calls) != MUTATION:
+            return 0
+        return self.invalidate_user(user_id)
+
+    def invalidate_user(self, user_id: str) -> int:
+        """Supprime les réponses propres à un utilisateur (ses données ont changé)"""
+        with self._lock:
+            stale = [entry for entry in self._entries.values() if entry.scope == user_id]
+            for entry in stale:
+                self._remove(entry)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            for entry in list(self._entries.values()):
+                self._remove(entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "uncacheable": self.uncacheable,
+            "evictions": self.evictions,
+        }
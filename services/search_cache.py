@@ -0,0 +1,150 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def normalize_query(query: str) -> str:
+    """Forme canonique d'une requête de recherche (casse, accents composés, espaces)"""
+    return " ".join(unicodedata.normalize("NFC", query).casefold().split())
+
+
+class SearchCache:
+    """
+    Cache des résultats de recherche web, avec expiration (TTL) :
+    - un LRU en mémoire pour les requêtes chaudes
+    - une table SQLite partagée par les processus et conservée entre redémarrages,
+      bornée à max_entries (les entrées expirées puis les plus anciennes sont supprimées) ;
+      la taille n'est vérifiée que toutes les prune_every insertions, la table peut donc
+      dépasser temporairement max_entries de prune_every entrées par processus
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 600.0, max_entries: int = 50000, memory_entries: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.prune_every = max(1, max_entries // 100)
+        self._inserts = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_results (key TEXT PRIMARY KEY, query TEXT NOT NULL, result TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_results_expires_at ON search_results(expires_at)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query: str) -> str:
+        return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+    def get(self, query: str):
+        """Résultat en cache encore valide pour query, ou None"""
+        key = self.key(query)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self._conn.execute(
+                    "SELECT result, expires_at FROM search_results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+            else:
+                self._memory.move_to_end(key)
+
+            if entry is None or entry[1] <= now:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def _remember(self, key: str, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, query: str, result: str):
+        key = self.key(query)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, (result, expires_at))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results (key, query, result, expires_at) VALUES (?, ?, ?, ?)",
+                (key, normalize_query(query), result, expires_at)
+            )
+            self._inserts += 1
+            if self._inserts >= self.prune_every:
+                self._inserts = 0
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self):
+        """Ramène la table sous max_entries (verrou tenu par l'appelant)"""
+        count = self._conn.execute("SELECT COUNT(*) FROM search_results").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute("DELETE FROM search_results WHERE expires_at <= ?", (time.time(),))
+            # Toujours trop d'entrées : on supprime celles qui expirent le plus tôt
+            self._conn.execute(
+                "DELETE FROM search_results WHERE key IN (SELECT key FROM search_results ORDER BY expires_at LIMIT "
+                "MAX((SELECT COUNT(*) FROM search_results) - ?, 0))",
+                (int(self.max_entries * 0.9),)
+            )
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._memory), "ttl_seconds": self.ttl_seconds}
+
+
+class SingleFlight:
+    """
+    Regroupe les appels concurrents identiques : tant qu'un appel pour une clé est
+    en cours, les demandes suivantes reçoivent le même Future au lieu d'en relancer un.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: str, func, executor) -> Future:
+        """Exécute func() sur executor, sauf si un appel pour key est déjà en cours"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = Future()
+            self._calls[key] = future
+
+        def call():
+            try:
+                result = func()
+            except BaseException as e:
+                with self._lock:
+                    self._calls.pop(key, None)
+                future.set_exception(e)
+                return
+            # Retirée avant de publier le résultat : les demandes suivantes liront le cache
+            with self._lock:
+                self._calls.pop(key, None)
+            future.set_result(result)
+
+        try:
+            executor.submit(call)
+        except RuntimeError as e:
+            # Pool arrêté
+            with self._lock:
+                self._calls.pop(key, None)
+            future.set_exception(e)
+        return future
+
+    def in_flight(self) -> int:
+        return len(self._calls)
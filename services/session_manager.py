@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionManager:
+    """
+    Sessions d'agent par utilisateur (uid Firebase), créées à la demande.
+
+    Les sessions sont conservées dans un OrderedDict trié par dernier accès :
+    - au-delà de max_sessions, la session la moins récemment utilisée est évincée (LRU)
+    - une session inactive depuis plus de ttl_seconds est évincée (TTL)
+    """
+
+    def __init__(self, session_factory, max_sessions: int = 1000, ttl_seconds: float = 3600.0):
+        self.session_factory = session_factory
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, session_factory):
+        """Construit le gestionnaire à partir des variables d'environnement"""
+        return cls(
+            session_factory,
+            max_sessions=int(os.getenv("AGENT_MAX_SESSIONS", "1000")),
+            ttl_seconds=float(os.getenv("AGENT_SESSION_TTL_SECONDS", "3600")),
+        )
+
+    def _evict_expired(self, now: float):
+        # Les plus anciennes sessions sont en tête : on s'arrête à la première encore valide
+        while self._sessions:
+            key, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access < self.ttl_seconds:
+                break
+            del self._sessions[key]
+            self.evictions += 1
+
+    def get(self, key: str):
+        """Retourne la session associée à key, en la créant si nécessaire"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._sessions.get(key)
+            if entry is not None:
+                self._sessions[key] = (entry[0], now)
+                self._sessions.move_to_end(key)
+                return entry[0]
+
+        # Création hors du verrou : elle peut être coûteuse
+        session = self.session_factory(key)
+
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None:
+                # Une autre requête a créé la session entre-temps
+                session = entry[0]
+            self._sessions[key] = (session, now)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return session
+
+    def drop(self, key: str) -> bool:
+        """Supprime la session associée à key"""
+        with self._lock:
+            return self._sessions.pop(key, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {
+            "active_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions": self.evictions,
+        }
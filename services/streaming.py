@@ -0,0 +1,107 @@
+import json
+import re
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+try:
+    # Marqueur utilisé par langchain-core pour activer le streaming des modèles de chat
+    # (sans lui, ChatGoogleGenerativeAI n'appelle jamais on_llm_new_token en mode synchrone)
+    from langchain_core.tracers._streaming import _StreamingCallbackHandler
+except ImportError:  # pragma: no cover - anciennes versions de langchain-core
+    _StreamingCallbackHandler = object
+
+
+_FINAL_ANSWER_RE = re.compile(r'"action"\s*:\s*"Final Answer"\s*,\s*"action_input"\s*:\s*"')
+_JSON_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", '"': '"', "\\": "\\", "/": "/"}
+
+
+class FinalAnswerExtractor:
+    """
+    Extrait, au fil des tokens, le texte de la réponse finale d'un agent ReAct
+    conversationnel dont la sortie est un blob JSON :
+    {"action": "Final Answer", "action_input": "..."}
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None
+        self.done = False
+
+    def feed(self, token: str) -> str:
+        self.buffer += token
+        if self.done:
+            return ""
+        if self.pos is None:
+            match = _FINAL_ANSWER_RE.search(self.buffer)
+            if not match:
+                return ""
+            self.pos = match.end()
+
+        out = []
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if char == "\\":
+                # Séquence d'échappement JSON : on attend d'avoir tous ses caractères
+                if self.pos + 1 >= len(self.buffer):
+                    break
+                escaped = self.buffer[self.pos + 1]
+                if escaped == "u":
+                    if self.pos + 6 > len(self.buffer):
+                        break
+                    out.append(chr(int(self.buffer[self.pos + 2:self.pos + 6], 16)))
+                    self.pos += 6
+                    continue
+                out.append(_JSON_ESCAPES.get(escaped, escaped))
+                self.pos += 2
+                continue
+            if char == '"':
+                self.done = True
+                break
+            out.append(char)
+            self.pos += 1
+        return "".join(out)
+
+
+class AgentStreamHandler(BaseCallbackHandler, _StreamingCallbackHandler):
+    """
+    Callback LangChain qui transmet les étapes de l'agent (appels d'outils)
+    et les tokens de la réponse finale à une fonction emit(event: dict).
+    raw_tokens=True transmet les tokens tels quels (agent à appel de fonctions :
+    le texte généré est directement la réponse, les appels d'outils n'en produisent pas).
+    """
+
+    def __init__(self, emit, raw_tokens: bool = False):
+        self.emit = emit
+        self.raw_tokens = raw_tokens
+        self._extractors = {}
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs):
+        if self.raw_tokens:
+            if token:
+                self.emit({"type": "token", "content": token})
+            return
+        extractor = self._extractors.setdefault(run_id, FinalAnswerExtractor())
+        text = extractor.feed(token)
+        if text:
+            self.emit({"type": "token", "content": text})
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._extractors.pop(run_id, None)
+
+    def on_agent_action(self, action, **kwargs):
+        self.emit({"type": "tool_start", "tool": action.tool, "input": str(action.tool_input)})
+
+    def on_tool_end(self, output, **kwargs):
+        self.emit({"type": "tool_end", "output": str(output)[:1000]})
+
+    # Interface _StreamingCallbackHandler : on ne modifie pas les flux
+    def tap_output_iter(self, run_id, output):
+        return output
+
+    def tap_output_aiter(self, run_id, output):
+        return output
+
+
+def format_sse(event: dict) -> str:
+    """Sérialise un événement au format Server-Sent Events"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
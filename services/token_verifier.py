@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+import jwt
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+from services.tracing import record_cache
+
+# Certificats publics qui signent les ID tokens Firebase
+GOOGLE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+
+class TokenVerificationError(Exception):
+    """Jeton invalide, expiré ou signé par une clé inconnue"""
+
+
+def _load_key(value):
+    """Clé publique depuis un certificat PEM, une clé PEM, ou un objet clé déjà chargé"""
+    if isinstance(value, bytes):
+        value = value.decode("ascii")
+    if isinstance(value, str):
+        if "BEGIN CERTIFICATE" in value:
+            return x509.load_pem_x509_certificate(value.encode("ascii")).public_key()
+        return load_pem_public_key(value.encode("ascii"))
+    return value
+
+
+def fetch_google_certs(url: str = GOOGLE_CERTS_URL, timeout: float = 10.0):
+    """Certificats Google : ({kid: certificat PEM}, durée de validité en secondes)"""
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+    return response.json(), int(match.group(1)) if match else 3600
+
+
+class TokenVerifier:
+    """
+    Vérification locale des ID tokens Firebase (RS256), avec cache des jetons vérifiés.
+
+    - Les clés publiques sont chargées par start() puis rafraîchies en arrière-plan avant
+      leur expiration (Cache-Control des certificats Google) : jamais de requête réseau
+      pendant la vérification. Un kid inconnu (rotation des clés) ou des clés périmées
+      réveillent le rafraîchissement en arrière-plan ; en attendant, les clés connues
+      restent utilisées et le jeton au kid inconnu est refusé.
+    - Tant qu'aucune clé n'a pu être chargée, les jetons sont confiés à
+      fallback_verifier(token) -> claims (ex : auth.verify_id_token), s'il est fourni.
+    - Un jeton vérifié est gardé en cache (clé : SHA-256 du jeton) jusqu'à son exp ;
+      une requête suivante avec le même jeton ne coûte qu'une recherche dans un dict.
+    - key_fetcher() -> ({kid: clé}, max_age) est injectable (tests avec des clés locales).
+    """
+
+    def __init__(self, project_id: str, key_fetcher=None, cache_max_entries: int = 10000,
+                 clock_skew_seconds: int = 10, latency_samples: int = 1000, fallback_verifier=None):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.key_fetcher = key_fetcher or fetch_google_certs
+        self.fallback_verifier = fallback_verifier
+        self.cache_max_entries = cache_max_entries
+        self.clock_skew_seconds = clock_skew_seconds
+        self._keys = {}
+        self._keys_expire_at = 0.0
+        self._keys_lock = threading.Lock()
+        self._last_refresh_request = 0.0
+        self._wake = threading.Event()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = None
+        self._latencies = {"hit": deque(maxlen=latency_samples), "miss": deque(maxlen=latency_samples)}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, service_account_path: str = None, fallback_verifier=None):
+        """
+        Vérificateur configuré par FIREBASE_PROJECT_ID (ou le project_id du compte de service).
+        Retourne None si le projet est inconnu.
+        """
+        project_id = os.getenv("FIREBASE_PROJECT_ID")
+        if not project_id and service_account_path and os.path.exists(service_account_path):
+            with open(service_account_path, encoding="utf-8") as f:
+                project_id = json.load(f).get("project_id")
+        if not project_id:
+            return None
+        return cls(project_id, cache_max_entries=int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000")),
+                   fallback_verifier=fallback_verifier)
+
+    # --- Clés publiques ---
+
+    def refresh_keys(self):
+        """Recharge les clés publiques (appelé en arrière-plan et pour un kid inconnu)"""
+        raw_keys, max_age = self.key_fetcher()
+        keys = {kid: _load_key(value) for kid, value in raw_keys.items()}
+        with self._keys_lock:
+            self._keys = keys
+            self._keys_expire_at = time.time() + max_age
+        return max_age
+
+    def _refresh_loop(self, delay: float):
+        # Attente jusqu'au prochain rafraîchissement prévu, ou jusqu'à une demande (_request_refresh)
+        while not self._stop.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                # Rafraîchissement avant expiration
+                delay = max(self.refresh_keys() * 0.8, 60)
+            except Exception as e:
+                print(f"⚠️ Rafraîchissement des clés Firebase impossible : {e}")
+                delay = 60
+
+    def _start_refresher(self, delay: float):
+        if self._refresher is None:
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, args=(delay,), name="token-keys-refresh", daemon=True
+            )
+            self._refresher.start()
+
+    def start(self):
+        """
+        Charge les clés (appel bloquant, au démarrage) puis lance leur rafraîchissement
+        en arrière-plan. Si le premier chargement échoue, l'erreur est levée après le
+        lancement du rafraîchissement, qui réessaie toutes les 60 s.
+        """
+        if self._refresher is not None:
+            return
+        try:
+            max_age = self.refresh_keys()
+        except Exception:
+            self._start_refresher(60)
+            raise
+        self._start_refresher(max(max_age * 0.8, 60))
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _request_refresh(self):
+        """Réveille le rafraîchissement en arrière-plan (au plus une demande toutes les 30 s)"""
+        now = time.time()
+        with self._keys_lock:
+            if now - self._last_refresh_request < 30:
+                return
+            self._last_refresh_request = now
+        if self._refresher is None:
+            self._start_refresher(0)
+        else:
+            self._wake.set()
+
+    def _get_key(self, kid: str):
+        # Jamais de requête réseau ici : verify() est appelé sur la boucle d'événements
+        with self._keys_lock:
+            key = self._keys.get(kid)
+            expired = time.time() >= self._keys_expire_at
+        if key is None or expired:
+            # kid inconnu (rotation) ou clés périmées : les clés connues servent en attendant
+            self._request_refresh()
+        if key is None:
+            raise TokenVerificationError(f"Clé de signature inconnue (kid={kid})")
+        return key
+
+    # --- Vérification ---
+
+    def _verify_signature(self, token: str) -> dict:
+        with self._keys_lock:
+            loaded = bool(self._keys)
+        if not loaded and self.fallback_verifier is not None:
+            # Aucune clé chargée (démarrage, certificats injoignables) : vérification déléguée
+            self._request_refresh()
+            try:
+                return self.fallback_verifier(token)
+            except Exception as e:
+                raise TokenVerificationError(str(e))
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise TokenVerificationError(f"Jeton mal formé : {e}")
+        if header.get("alg") != "RS256":
+            raise TokenVerificationError("Algorithme de signature inattendu")
+        key = self._get_key(header.get("kid"))
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=self.issuer,
+                leeway=self.clock_skew_seconds,
+                options={"require": ["exp", "iat", "sub", "aud", "iss"]},
+            )
+        except jwt.PyJWTError as e:
+            raise TokenVerificationError(str(e))
+        if not claims["sub"] or len(claims["sub"]) > 128:
+            raise TokenVerificationError("Identifiant utilisateur (sub) invalide")
+        if claims.get("auth_time", 0) > time.time() + self.clock_skew_seconds:
+            raise TokenVerificationError("auth_time dans le futur")
+        claims["uid"] = claims["sub"]
+        return claims
+
+    def verify(self, token: str) -> dict:
+        """Claims du jeton vérifié (dont "uid") ; lève TokenVerificationError sinon"""
+        start = time.perf_counter()
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        now = time.time()
+
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                claims, expires_at = entry
+                if expires_at > now:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    self._latencies["hit"].append(time.perf_counter() - start)
+                    record_cache("token", True)
+                    return claims
+                del self._cache[key]
+
+        record_cache("token", False)
+        try:
+            claims = self._verify_signature(token)
+        except TokenVerificationError:
+            self.failures += 1
+            raise
+
+        with self._cache_lock:
+            self._cache[key] = (claims, claims["exp"])
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+            self.misses += 1
+            self._latencies["miss"].append(time.perf_counter() - start)
+        return claims
+
+    def stats(self) -> dict:
+        def percentiles(samples):
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            return {
+                "p50_us": round(ordered[len(ordered) // 2] * 1e6, 1),
+                "p99_us": round(ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)] * 1e6, 1),
+            }
+
+        return {
+            "cached_tokens": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+            "keys": len(self._keys),
+            "hit_latency": percentiles(list(self._latencies["hit"])),
+            "miss_latency": percentiles(list(self._latencies["miss"])),
+        }
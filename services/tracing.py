@@ -0,0 +1,356 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Spans détaillés gardés par requête (les compteurs agrégés restent exacts au-delà)
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "100"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+# --- Métriques (format texte Prometheus) ---
+
+def _format_labels(labelnames, values, extra=()) -> str:
+    pairs = [*zip(labelnames, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [compteurs par bucket, somme, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge:
+    """Valeur lue au moment de l'export (ex : requêtes en cours)"""
+
+    def __init__(self, name: str, help: str, func):
+        self.name, self.help, self.func = name, help, func
+
+    def render(self) -> list:
+        try:
+            value = self.func()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, func) -> Gauge:
+        # Une nouvelle fonction remplace la précédente (ex : rechargement de l'application)
+        self._metrics[name] = Gauge(name, help, func)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+HTTP_REQUESTS = METRICS.counter("http_requests_total", "Requêtes HTTP traitées", ("route", "method", "status"))
+HTTP_DURATION = METRICS.histogram("http_request_duration_seconds", "Durée des requêtes HTTP", ("route",))
+LLM_CALLS = METRICS.counter("llm_calls_total", "Appels au LLM", ("model", "status"))
+LLM_TOKENS = METRICS.counter("llm_tokens_total", "Tokens consommés par les appels au LLM", ("model", "type"))
+LLM_DURATION = METRICS.histogram("llm_call_duration_seconds", "Durée des appels au LLM", ("model",))
+TOOL_CALLS = METRICS.counter("tool_calls_total", "Appels d'outils de l'agent", ("tool", "status"))
+TOOL_DURATION = METRICS.histogram("tool_duration_seconds", "Durée des appels d'outils", ("tool",))
+SPAN_DURATION = METRICS.histogram("span_duration_seconds", "Durée des opérations tracées (recherche documentaire, authentification...)", ("name",))
+CACHE_LOOKUPS = METRICS.counter("cache_lookups_total", "Consultations des caches", ("cache", "result"))
+
+
+# --- Trace d'une requête ---
+
+class Trace:
+    """Spans et compteurs d'une requête HTTP, partagés avec les threads qui la traitent"""
+
+    def __init__(self, request_id: str, route: str = ""):
+        self.request_id = request_id
+        self.route = route
+        self.started = time.perf_counter()
+        self.spans = []
+        self.dropped_spans = 0
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.tool_calls = 0
+        self.cache = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, duration: float, **attrs):
+        with self._lock:
+            if len(self.spans) >= TRACE_MAX_SPANS:
+                self.dropped_spans += 1
+                return
+            self.spans.append({
+                "name": name,
+                "start_ms": round((start - self.started) * 1000, 1),
+                "duration_ms": round(duration * 1000, 1),
+                **attrs,
+            })
+
+    def add_llm_call(self, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def add_tool_call(self):
+        with self._lock:
+            self.tool_calls += 1
+
+    def add_cache_lookup(self, cache: str, hit: bool):
+        with self._lock:
+            counts = self.cache.setdefault(cache, {"hit": 0, "miss": 0})
+            counts["hit" if hit else "miss"] += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                "llm_calls": self.llm_calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "tool_calls": self.tool_calls,
+                "cache": dict(self.cache),
+                "spans": list(self.spans),
+                "dropped_spans": self.dropped_spans,
+            }
+
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+def start_trace(request_id: str = None, route: str = ""):
+    """Démarre la trace de la requête courante ; retourne (trace, jeton pour end_trace)"""
+    trace = Trace(request_id or new_request_id(), route)
+    return trace, _current_trace.set(trace)
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+def current_trace():
+    return _current_trace.get()
+
+def current_request_id():
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Mesure un bloc de code : histogramme span_duration_seconds et span dans la trace
+    de la requête courante. Le dict produit permet d'ajouter des attributs (ex : nombre de résultats).
+    """
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        SPAN_DURATION.observe(duration, name=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, start, duration, **attrs)
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_cache_lookup(cache, hit)
+
+
+# --- Callback LangChain ---
+
+def _token_usage(response) -> tuple:
+    """(tokens du prompt, tokens générés) d'une réponse LLM, 0 si non fournis par le modèle"""
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not prompt_tokens and not completion_tokens:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Callback LangChain qui mesure les appels au LLM (durée, tokens) et aux outils
+    (durée, erreurs) : métriques globales et spans de la trace de la requête
+    """
+
+    def __init__(self, trace: Trace = None):
+        self.trace = trace if trace is not None else current_trace()
+        self._runs = {}
+
+    def _start(self, run_id, kind: str, attribute: str, name: str):
+        self._runs[run_id] = (kind, attribute, name, time.perf_counter())
+
+    def _finish(self, run_id, error: BaseException = None, **attrs):
+        kind, attribute, name, start = self._runs.pop(run_id, (None, None, None, None))
+        if kind is None:
+            return None
+        duration = time.perf_counter() - start
+        if error is not None:
+            attrs["error"] = type(error).__name__
+        if self.trace is not None:
+            self.trace.add_span(kind, start, duration, **{attribute: name}, **attrs)
+        return name, duration
+
+    # LLM
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "llm", "model", kwargs.get("invocation_params", {}).get("model", "inconnu"))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "llm", "model", kwargs.get("invocation_params", {}).get("model", "inconnu"))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = _token_usage(response)
+        finished = self._finish(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        if finished is None:
+            return
+        model, duration = finished
+        LLM_CALLS.inc(model=model, status="ok")
+        LLM_DURATION.observe(duration, model=model)
+        LLM_TOKENS.inc(prompt_tokens, model=model, type="prompt")
+        LLM_TOKENS.inc(completion_tokens, model=model, type="completion")
+        if self.trace is not None:
+            self.trace.add_llm_call(prompt_tokens, completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        finished = self._finish(run_id, error=error)
+        if finished is not None:
+            LLM_CALLS.inc(model=finished[0], status="error")
+            LLM_DURATION.observe(finished[1], model=finished[0])
+
+    # Outils
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", "tool", (serialized or {}).get("name") or kwargs.get("name", "inconnu"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._record_tool(self._finish(run_id), "ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._record_tool(self._finish(run_id, error=error), "error")
+
+    def _record_tool(self, finished, status: str):
+        if finished is None:
+            return
+        tool, duration = finished
+        TOOL_CALLS.inc(tool=tool, status=status)
+        TOOL_DURATION.observe(duration, tool=tool)
+        if self.trace is not None:
+            self.trace.add_tool_call()
+
+
+# --- Logs JSON ---
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par événement, avec l'identifiant de la requête en cours"""
+
+    def format(self, record) -> str:
+        payload = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            "request_id": getattr(record, "request_id", None) or current_request_id(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+logger = logging.getLogger("agent.trace")
+
+def configure_logging(level: str = LOG_LEVEL):
+    """Logs structurés (JSON) sur la sortie standard pour le logger agent.trace"""
+    if not any(isinstance(handler.formatter, JsonFormatter) for handler in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+def log_event(event: str, level: int = logging.INFO, request_id: str = None, **fields):
+    logger.log(level, event, extra={"fields": fields, "request_id": request_id})
@@ -0,0 +1,84 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolSaturatedError(Exception):
+    """Levée quand le pool et sa file d'attente sont pleins"""
+
+
+class AgentWorkerPool:
+    """
+    Pool de threads borné pour exécuter les appels bloquants de l'agent
+    (Gemini, DuckDuckGo, FAISS) hors de la boucle d'événements d'uvicorn.
+
+    - max_workers : nombre d'exécutions simultanées
+    - max_queue : nombre de requêtes pouvant attendre un thread libre
+    - timeout : délai maximal (en secondes) accordé à une requête
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 16, timeout: float = 120.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-worker")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @classmethod
+    def from_env(cls):
+        """Construit le pool à partir des variables d'environnement"""
+        return cls(
+            max_workers=int(os.getenv("AGENT_MAX_WORKERS", "4")),
+            max_queue=int(os.getenv("AGENT_MAX_QUEUE", "16")),
+            timeout=float(os.getenv("AGENT_TIMEOUT_SECONDS", "120")),
+        )
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def submit_nowait(self, func, *args, **kwargs):
+        """
+        Soumet une tâche au pool sans attendre son résultat.
+        Lève PoolSaturatedError si le pool et la file sont pleins.
+        """
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                raise PoolSaturatedError("Serveur saturé, réessayez dans quelques instants")
+            self._in_flight += 1
+
+        try:
+            # Le contexte (trace de la requête en cours) suit la tâche dans le thread du pool
+            future = self._executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        # Le compteur n'est décrémenté qu'à la fin réelle de la tâche :
+        # un thread bloqué après un timeout continue d'occuper une place.
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Exécute func dans le pool et attend son résultat sans bloquer la boucle.
+        Lève PoolSaturatedError ou asyncio.TimeoutError.
+        """
+        future = self.submit_nowait(func, *args, **kwargs)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,7 +1,10 @@
 import streamlit as st # type: ignore
 import requests # type: ignore
+from requests.adapters import HTTPAdapter # type: ignore
+from urllib3.util.retry import Retry # type: ignore
 import json
 import os
+import uuid
 from dotenv import load_dotenv # type: ignore
 
 # Charger les variables d'environnement
@@ -10,6 +13,35 @@ load_dotenv()
 # Configurez l'URL de votre API FastAPI
 FASTAPI_API_URL = os.getenv("FASTAPI_API_URL", "http://localhost:8000")
 
+# Délais des appels à l'API : (connexion, lecture)
+API_TIMEOUT = (5, 30)
+CHAT_STREAM_TIMEOUT = (5, float(os.getenv("AGENT_TIMEOUT_SECONDS", "120")) + 10)
+UPLOAD_TIMEOUT = (5, 120)
+# Intervalle de rafraîchissement du suivi des indexations (secondes)
+DOCUMENT_POLL_SECONDS = 2
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """
+    Session HTTP partagée par toutes les sessions Streamlit : les connexions à l'API
+    sont réutilisées (keep-alive). Les requêtes idempotentes (GET, DELETE) sont
+    relancées avec backoff en cas d'erreur réseau ou de réponse 502/503/504.
+    """
+    session = requests.Session()
+    retries = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET", "DELETE"],
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http = get_http_session()
+
 # --- Configuration de la page Streamlit ---
 st.set_page_config(
     page_title="Langchain Multitool Agent",
@@ -23,6 +55,8 @@ if "authenticated" not in st.session_state:
     st.session_state.id_token = None
     st.session_state.email = None
     st.session_state.messages = []
+    st.session_state.conversation_id = "default"
+    st.session_state.history_loaded = False
 
 
 # ======================================================================================
@@ -49,9 +83,10 @@ if not st.session_state.authenticated:
                     st.error("Veuillez entrer un email et un mot de passe.")
                 else:
                     try:
-                        auth_response = requests.post(
+                        auth_response = http.post(
                             f"{FASTAPI_API_URL}/login",
-                            json={"email": login_email, "password": login_password}
+                            json={"email": login_email, "password": login_password},
+                            timeout=API_TIMEOUT
                         )
                         auth_response.raise_for_status()
                         auth_data = auth_response.json()
@@ -82,9 +117,10 @@ if not st.session_state.authenticated:
                     st.error("Veuillez entrer un email et un mot de passe.")
                 else:
                     try:
-                        auth_response = requests.post(
+                        auth_response = http.post(
                             f"{FASTAPI_API_URL}/signup",
-                            json={"email": signup_email, "password": signup_password}
+                            json={"email": signup_email, "password": signup_password},
+                            timeout=API_TIMEOUT
                         )
                         auth_response.raise_for_status()
                         auth_data = auth_response.json()
@@ -111,11 +147,133 @@ if st.session_state.authenticated:
     st.sidebar.header(f"👋 Bienvenue,")
     st.sidebar.success(f"**{st.session_state.email}**")
     if st.sidebar.button("Déconnexion", use_container_width=True):
+        # On libère la session (mémoire de conversation) côté API
+        try:
+            http.delete(
+                f"{FASTAPI_API_URL}/session",
+                headers={"Authorization": f"Bearer {st.session_state.id_token}"},
+                params={"conversation_id": st.session_state.conversation_id},
+                timeout=5
+            )
+        except requests.exceptions.RequestException:
+            pass
         st.session_state.authenticated = False
         st.session_state.id_token = None
         st.session_state.email = None
         st.session_state.messages = [] # Optionnel: vider l'historique à la déconnexion
+        st.session_state.conversation_id = "default"
+        st.session_state.history_loaded = False
+        st.rerun()
+    st.sidebar.markdown("---")
+
+    auth_headers = {"Authorization": f"Bearer {st.session_state.id_token}"}
+
+    # --- Conversations (historique conservé côté API) ---
+    st.sidebar.subheader("💬 Conversations")
+    if st.sidebar.button("Nouvelle conversation", use_container_width=True):
+        st.session_state.conversation_id = uuid.uuid4().hex[:12]
+        st.session_state.messages = []
+        st.session_state.history_loaded = True
         st.rerun()
+    try:
+        conversations = http.get(f"{FASTAPI_API_URL}/conversations", headers=auth_headers, timeout=API_TIMEOUT).json()["conversations"]
+    except (requests.exceptions.RequestException, ValueError, KeyError):
+        conversations = []
+    titles = {c["conversation_id"]: c["title"][:40] or c["conversation_id"] for c in conversations}
+    titles.setdefault(st.session_state.conversation_id, "Nouvelle conversation")
+    selected = st.sidebar.radio(
+        "Conversations",
+        list(titles),
+        index=list(titles).index(st.session_state.conversation_id),
+        format_func=lambda conversation_id: titles[conversation_id],
+        label_visibility="collapsed"
+    )
+    if selected != st.session_state.conversation_id:
+        st.session_state.conversation_id = selected
+        st.session_state.history_loaded = False
+
+    # Réhydratation de la conversation depuis l'API (après connexion ou changement de conversation)
+    if not st.session_state.history_loaded:
+        try:
+            history_response = http.get(
+                f"{FASTAPI_API_URL}/history",
+                headers=auth_headers,
+                params={"conversation_id": st.session_state.conversation_id, "limit": 100},
+                timeout=API_TIMEOUT
+            )
+            history_response.raise_for_status()
+            st.session_state.messages = [
+                {"role": message["role"], "content": message["content"]}
+                for message in history_response.json()["messages"]
+            ]
+        except requests.exceptions.RequestException as e:
+            st.sidebar.warning(f"Historique indisponible : {e}")
+            st.session_state.messages = []
+        st.session_state.history_loaded = True
+    st.sidebar.markdown("---")
+
+    # --- Documents (indexés en arrière-plan par l'API, interrogeables ensuite par l'agent) ---
+    st.session_state.setdefault("document_jobs", [])
+    st.session_state.setdefault("uploader_key", 0)
+    st.session_state.setdefault("document_notices", [])
+    st.sidebar.subheader("📄 Documents")
+    uploaded_file = st.sidebar.file_uploader("Ajouter un PDF", type=["pdf"], key=f"uploader_{st.session_state.uploader_key}")
+    if uploaded_file is not None and st.sidebar.button("Indexer le document", use_container_width=True):
+        try:
+            upload_response = http.post(
+                f"{FASTAPI_API_URL}/documents",
+                headers=auth_headers,
+                files={"file": (uploaded_file.name, uploaded_file.getvalue(), "application/pdf")},
+                timeout=UPLOAD_TIMEOUT
+            )
+            upload_response.raise_for_status()
+            st.session_state.document_jobs.append(upload_response.json()["job_id"])
+            st.session_state.document_notices = []
+            # Nouveau widget : le fichier envoyé disparaît du sélecteur
+            st.session_state.uploader_key += 1
+            st.rerun()
+        except requests.exceptions.HTTPError as http_err:
+            st.sidebar.error(f"Envoi refusé : {http_err.response.json().get('detail', http_err)}")
+        except requests.exceptions.RequestException as e:
+            st.sidebar.error(f"Erreur de connexion à l'API : {e}")
+
+    # Rafraîchissement périodique seulement pendant des indexations
+    @st.fragment(run_every=DOCUMENT_POLL_SECONDS if st.session_state.document_jobs else None)
+    def document_panel():
+        """Progression des indexations en cours et documents disponibles"""
+        still_running = []
+        for job_id in st.session_state.document_jobs:
+            try:
+                job = http.get(f"{FASTAPI_API_URL}/documents/jobs/{job_id}", headers=auth_headers, timeout=API_TIMEOUT).json()
+            except (requests.exceptions.RequestException, ValueError):
+                still_running.append(job_id)
+                continue
+            if job.get("status") in ("queued", "processing"):
+                still_running.append(job_id)
+                pages = f"{job['pages_done']}/{job['pages_total']} pages" if job["pages_total"] else "en attente"
+                st.progress(job["progress"] or 0.0, text=f"{job['filename']} : {pages}")
+            elif job.get("status") == "done":
+                st.session_state.document_notices.append(("success", f"{job['filename']} indexé ({job['chunks']} passages)"))
+            else:
+                st.session_state.document_notices.append(("error", f"{job.get('filename', job_id)} : {job.get('error') or job.get('detail')}"))
+        finished = len(still_running) < len(st.session_state.document_jobs)
+        st.session_state.document_jobs = still_running
+        if finished and not still_running:
+            # Dernière indexation terminée : la page entière est relancée (fin du rafraîchissement)
+            st.rerun()
+        # Résultat des indexations terminées, affiché jusqu'au prochain envoi
+        for kind, text in st.session_state.document_notices:
+            (st.success if kind == "success" else st.error)(text)
+
+        try:
+            documents = http.get(f"{FASTAPI_API_URL}/documents", headers=auth_headers, timeout=API_TIMEOUT).json()["documents"]
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            documents = {}
+        for doc_id, entry in documents.items():
+            st.caption(f"{'✅' if entry['selected'] else '⬜'} {doc_id} ({entry['pages']} pages)")
+
+    with st.sidebar:
+        document_panel()
     st.sidebar.markdown("---")
     st.sidebar.info("Posez vos questions dans la zone de texte ci-dessous et validez pour obtenir une réponse de l'agent")
 
@@ -140,35 +298,55 @@ if st.session_state.authenticated:
             with st.chat_message("user"):
                 st.markdown(prompt)
 
-        # Obtenir et afficher la réponse de l'assistant
+        # Obtenir et afficher la réponse de l'assistant au fil de l'eau (Server-Sent Events)
         with chat_container:
             with st.chat_message("assistant"):
-                with st.spinner("..."):
-                    try:
-                        headers = {
-                            "Content-Type": "application/json",
-                            "Authorization": f"Bearer {st.session_state.id_token}"
-                        }
-                        response = requests.post(
-                            f"{FASTAPI_API_URL}/chat",
-                            headers=headers,
-                            json={"message": prompt}
-                        )
+                steps_container = st.container()
+                answer_placeholder = st.empty()
+                answer_placeholder.markdown("...")
+                try:
+                    headers = {
+                        "Content-Type": "application/json",
+                        "Authorization": f"Bearer {st.session_state.id_token}"
+                    }
+                    assistant_response = ""
+                    with http.post(
+                        f"{FASTAPI_API_URL}/chat/stream",
+                        headers=headers,
+                        json={"message": prompt, "conversation_id": st.session_state.conversation_id},
+                        stream=True,
+                        timeout=CHAT_STREAM_TIMEOUT
+                    ) as response:
                         response.raise_for_status()
-                        assistant_response = response.json()["response"]
-                        st.markdown(assistant_response)
-                        # Ajouter la réponse de l'assistant à l'historique
-                        st.session_state.messages.append({"role": "assistant", "content": assistant_response})
+                        for line in response.iter_lines(decode_unicode=True):
+                            if not line or not line.startswith("data: "):
+                                continue
+                            event = json.loads(line[len("data: "):])
 
-                    except requests.exceptions.HTTPError as http_err:
-                        error_message = f"Erreur HTTP : {http_err.response.status_code}. Détail : {http_err.response.text}"
-                        st.error(error_message)
-                        st.session_state.messages.append({"role": "assistant", "content": error_message})
-                    except requests.exceptions.RequestException as e:
-                        error_message = f"Erreur de connexion à l'API : {e}"
-                        st.error(error_message)
-                        st.session_state.messages.append({"role": "assistant", "content": error_message})
-                    except Exception as e:
-                        error_message = f"Une erreur inattendue est survenue: {e}"
-                        st.error(error_message)
-                        st.session_state.messages.append({"role": "assistant", "content": error_message})
\ No newline at end of file
+                            if event["type"] == "tool_start":
+                                steps_container.caption(f"🔧 {event['tool']} : {event['input']}")
+                            elif event["type"] == "token":
+                                assistant_response += event["content"]
+                                answer_placeholder.markdown(assistant_response + "▌")
+                            elif event["type"] == "final":
+                                # La réponse complète fait foi (tokens éventuellement manquants)
+                                assistant_response = event["content"]
+                            elif event["type"] == "error":
+                                raise RuntimeError(event["content"])
+
+                    answer_placeholder.markdown(assistant_response)
+                    # Ajouter la réponse de l'assistant à l'historique
+                    st.session_state.messages.append({"role": "assistant", "content": assistant_response})
+
+                except requests.exceptions.HTTPError as http_err:
+                    error_message = f"Erreur HTTP : {http_err.response.status_code}. Détail : {http_err.response.text}"
+                    answer_placeholder.error(error_message)
+                    st.session_state.messages.append({"role": "assistant", "content": error_message})
+                except requests.exceptions.RequestException as e:
+                    error_message = f"Erreur de connexion à l'API : {e}"
+                    answer_placeholder.error(error_message)
+                    st.session_state.messages.append({"role": "assistant", "content": error_message})
+                except Exception as e:
+                    error_message = f"Une erreur inattendue est survenue: {e}"
+                    answer_placeholder.error(error_message)
+                    st.session_state.messages.append({"role": "assistant", "content": error_message})
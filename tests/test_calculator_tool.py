@@ -0,0 +1,90 @@
+import pytest
+
+from tools import calculator_tool
+from tools.calculator_tool import CalculationError, CalculatorTool, evaluate, format_result
+
+@pytest.mark.parametrize("expression, expected", [
+    ("2+2", "4"),
+    ("2^10", "1024"),
+    ("-3 * (4 - 1)", "-9"),
+    ("round(sin(pi/2), 3)", "1"),
+    ("sum([1, 2, range(3)])", "6"),
+    ("mean(range(1, 101))", "50.5"),
+    ("max(3, 4)", "4"),
+    ("[1, [2, 3], (4,)]", "[1, 2, 3, 4]"),
+])
+def test_allowed_expressions(expression, expected):
+    assert format_result(evaluate(expression)) == expected
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os')",
+    "(1).__class__",
+    "x + 1",
+    "'abc'",
+    "True + 1",
+    "lambda: 1",
+    "[i for i in range(3)]",
+    "{1: 2}",
+    "round(1.5, ndigits=1)",
+    "1 if 1 else 2",
+    "1 < 2",
+])
+def test_rejected_expressions(expression):
+    with pytest.raises(CalculationError):
+        evaluate(expression)
+
+def test_node_limit():
+    evaluate("+".join(["1"] * (calculator_tool.MAX_NODES // 2)))
+    with pytest.raises(CalculationError, match="complexe"):
+        evaluate("+".join(["1"] * calculator_tool.MAX_NODES))
+
+def test_element_limit(monkeypatch):
+    # Chaque liste respecte la limite, mais leur combinaison bloquerait le processus
+    with pytest.raises(CalculationError):
+        evaluate("percentile(range(1000000), range(0, 100, 0.0001))")
+    monkeypatch.setattr(calculator_tool, "MAX_ELEMENTS", 1000)
+    assert evaluate("len([range(500), range(500)])") == 1000
+    for expression in ("range(1001)", "linspace(0, 1, 1001)", "[range(600), range(600)]", "sum(range(600), [range(600)])"):
+        with pytest.raises(CalculationError, match="trop grande"):
+            evaluate(expression)
+
+def test_percentile_limits():
+    assert format_result(evaluate("percentile(range(1, 101), 50)")) == "50.5"
+    assert format_result(evaluate("percentile([1, 2, 3], [0, 100])")) == "[1, 3]"
+    for expression in ("percentile([1, 2], 150)", "percentile([1, 2], -1)", "percentile(range(200), range(101))"):
+        with pytest.raises(CalculationError):
+            evaluate(expression)
+
+def test_work_limit(monkeypatch):
+    monkeypatch.setattr(calculator_tool, "MAX_WORK", 10_000)
+    evaluate("percentile(range(100), range(100))")
+    with pytest.raises(CalculationError, match="coûteux"):
+        evaluate("percentile(range(1000), range(100))")
+
+def test_nested_lists_are_checked_before_being_joined(monkeypatch):
+    monkeypatch.setattr(calculator_tool, "MAX_ELEMENTS", 1000)
+    built = []
+    original = calculator_tool._range
+
+    def tracked_range(*args):
+        built.append(args)
+        return original(*args)
+
+    monkeypatch.setitem(calculator_tool._FUNCTIONS, "range", tracked_range)
+    calculator_tool.compile_expression.cache_clear()
+    with pytest.raises(CalculationError):
+        evaluate("[range(600), range(600), range(600), range(600)]")
+    # Les parties suivantes ne sont pas calculées une fois la limite dépassée
+    assert len(built) == 2
+    calculator_tool.compile_expression.cache_clear()
+
+@pytest.mark.parametrize("expression", ["9**9**9", "2**20000", "(2**9000) * (2**9000)", "factorial(5000)"])
+def test_integer_limits(expression):
+    with pytest.raises(CalculationError):
+        evaluate(expression)
+
+def test_tool_reports_errors():
+    tool = CalculatorTool()
+    assert tool.run("2*21") == "Résultat: 42"
+    assert tool.run("1/0") == "Erreur de calcul: division par zéro"
+    assert tool.run("open('x')").startswith("Erreur de calcul")
@@ -0,0 +1,107 @@
+import pytest
+
+from retriever.chunking import _is_heading, split_blocks
+
+@pytest.mark.parametrize("line", [
+    "# Introduction",
+    "3 Résultats",
+    "2.1 Méthode de calcul",
+    "IV. Conclusion",
+    "Chapitre 4",
+    "ANNEXE B",
+    "CONDITIONS GÉNÉRALES",
+])
+def test_headings(line):
+    assert _is_heading(line)
+
+@pytest.mark.parametrize("line", [
+    "3 pommes et 2 poires",
+    "12 mois de garantie",
+    "iv. conclusion",
+    "Le texte continue ici",
+])
+def test_numbered_lines_in_lowercase_are_not_headings(line):
+    assert not _is_heading(line)
+
+def test_lowercase_numbered_line_stays_in_its_paragraph():
+    text = "La recette demande\n3 pommes et 2 poires\net un peu de sucre."
+    assert split_blocks(text) == [("paragraph", "La recette demande 3 pommes et 2 poires et un peu de sucre.")]
+
+from langchain_core.documents import Document
+
+from retriever.chunking import PageFurnitureFilter, TokenChunker
+
+LEGAL = ("Les informations contenues dans ce document sont confidentielles et ne peuvent être communiquées "
+         "à des tiers sans l'accord écrit préalable de la direction juridique, qui reste seule compétente "
+         "pour autoriser leur diffusion totale ou partielle, y compris aux partenaires du groupe.")
+
+def chunker(**params) -> TokenChunker:
+    return TokenChunker(tokenizer=None, **{"max_tokens": 40, "overlap_tokens": 10, **params})
+
+def pages(*texts) -> list:
+    return [Document(page_content=text, metadata={"page": i}) for i, text in enumerate(texts)]
+
+def test_chunks_never_exceed_max_tokens():
+    splitter = chunker()
+    text = "\n".join([
+        "1 Introduction",
+        " ".join(f"Phrase numéro {i} du premier paragraphe, assez longue pour compter." for i in range(12)),
+        "",
+        "https://exemple.com/" + "cheminsansespaces" * 40,
+        "",
+        "texteextraitsansaucunespace" * 30,
+    ])
+    chunks = splitter.split_documents(pages(text))
+    assert len(chunks) > 5
+    # Le titre de section rappelé en tête de chaque chunk est compté
+    assert all(splitter.count_tokens(chunk.page_content) <= 40 for chunk in chunks)
+    assert all(chunk.page_content.startswith("1 Introduction\n") for chunk in chunks)
+    assert all(chunk.metadata["section"] == "1 Introduction" for chunk in chunks)
+
+def test_consecutive_chunks_overlap():
+    splitter = chunker()
+    sentences = [f"Phrase {word} du texte." for word in ("un", "deux", "trois", "quatre", "cinq", "six", "sept", "huit")]
+    chunks = [chunk.page_content for chunk in splitter.split_documents(pages(" ".join(sentences)))]
+    assert len(chunks) > 1
+    for previous, current in zip(chunks, chunks[1:]):
+        last_sentence = previous.rsplit(". ", 1)[-1]
+        assert current.startswith(last_sentence)
+        assert splitter.count_tokens(last_sentence) <= 10
+
+def test_repeated_headers_and_footers_are_removed():
+    # Moins de pages que la fenêtre du filtre : tout est lu avant d'être rendu
+    bodies = ["Le chiffre d'affaires progresse.\nLes marges restent stables.",
+              "Les effectifs augmentent.\nDeux sites ont ouvert.",
+              "La dette diminue.\nLa trésorerie est solide.",
+              "Les perspectives sont bonnes.\nLe dividende est maintenu."]
+    texts = [f"Rapport annuel 2024\n{body}\nPage {i} / 4" for i, body in enumerate(bodies, 1)]
+    furniture = PageFurnitureFilter(window=8)
+    cleaned = [page.page_content for page in furniture.filter(pages(*texts))]
+    assert cleaned == bodies
+    assert furniture.removed_lines == 8
+
+def test_unrepeated_lines_are_kept():
+    texts = ["Premier titre\nCorps un.", "Deuxième titre\nCorps deux."]
+    cleaned = [page.page_content for page in PageFurnitureFilter().filter(pages(*texts))]
+    assert cleaned == texts
+
+def test_near_duplicate_paragraphs_are_dropped():
+    splitter = chunker(max_tokens=200, overlap_tokens=20)
+    near_duplicate = LEGAL.replace("groupe.", "groupe concernés.")
+    chunks = splitter.split_documents(pages(f"Première page.\n\n{LEGAL}", f"Deuxième page.\n\n{near_duplicate}"))
+    text = "\n".join(chunk.page_content for chunk in chunks)
+    assert text.count("direction juridique") == 1
+    assert "Deuxième page." in text
+    assert splitter.duplicate_paragraphs == 1
+
+def test_duplicate_chunks_are_dropped():
+    splitter = chunker()
+    contact = "Contact : service client du lundi au vendredi."
+    chunks = splitter.split_documents(pages(contact, contact, "Autre contenu."))
+    assert [chunk.page_content for chunk in chunks] == [contact, "Autre contenu."]
+    assert splitter.duplicates == 1
+
+def test_deduplication_can_be_disabled():
+    splitter = chunker(dedup_similarity=0)
+    contact = "Contact : service client du lundi au vendredi."
+    assert len(splitter.split_documents(pages(contact, contact))) == 2
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from services import document_jobs
+from services.request_limits import BodySizeLimitMiddleware
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, path="/documents", max_bytes=1024)
+
+    @app.post("/documents")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return TestClient(app)
+
+def test_small_upload_is_accepted(client):
+    response = client.post("/documents", files={"file": ("a.pdf", b"%PDF-" + b"x" * 100)})
+    assert response.json() == {"size": 105}
+
+def test_upload_rejected_on_content_length(client):
+    response = client.post("/documents", files={"file": ("a.pdf", b"%PDF-" + b"x" * 4096)})
+    assert response.status_code == 413
+
+def test_upload_without_content_length_is_capped(client):
+    # Envoi chunked : la limite s'applique au fil des blocs reçus
+    def body():
+        for _ in range(10):
+            yield b"x" * 512
+
+    response = client.post("/documents", content=body(), headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+
+def test_remove_upload_only_touches_the_upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_jobs, "DOC_UPLOAD_DIR", str(tmp_path / "uploads"))
+    path = document_jobs.upload_path("alice", "job1", "rapport.pdf")
+    os.makedirs(os.path.dirname(path))
+    open(path, "wb").close()
+    outside = tmp_path / "docs" / "rapport.pdf"
+    outside.parent.mkdir()
+    outside.write_bytes(b"%PDF-")
+
+    document_jobs.remove_upload("alice", {"path": str(outside)})
+    document_jobs.remove_upload("alice", {"path": path})
+    assert outside.exists()
+    assert not os.path.exists(os.path.dirname(path))
@@ -0,0 +1,39 @@
+import pytest
+
+from retriever import doc_cache, document_registry
+from retriever.document_registry import DocumentRegistry
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(doc_cache, "DOC_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(
+        document_registry, "build_cached_index",
+        lambda filepath, splitter, params, progress=None: (filepath, {"pages": 1, "chunks": 1}, False)
+    )
+    removed = []
+    registry = DocumentRegistry(lambda: None, {}, on_removed=lambda uid, entry: removed.append(entry["path"]))
+    registry.removed = removed
+    return registry
+
+def test_replaced_and_unloaded_documents_are_reported(registry):
+    first = registry.load("alice", "uploads/u/job1/rapport.pdf")
+    registry.load("alice", "uploads/u/job1/rapport.pdf")
+    assert registry.removed == []
+    # Nouvel envoi du même nom : remplace le précédent (identifiant imposé par la file d'indexation)
+    registry.load("alice", "uploads/u/job2/rapport.pdf", doc_id="rapport")
+    assert registry.removed == ["uploads/u/job1/rapport.pdf"]
+    assert registry.unload("alice", first["doc_id"])
+    assert registry.removed == ["uploads/u/job1/rapport.pdf", "uploads/u/job2/rapport.pdf"]
+
+def test_same_name_in_different_folders_gets_distinct_ids(registry):
+    first = registry.load("alice", "docs/a/rapport.pdf")
+    second = registry.load("alice", "docs/b/rapport.pdf")
+    assert (first["doc_id"], second["doc_id"]) == ("rapport", "rapport-2")
+    assert set(registry.list("alice")) == {"rapport", "rapport-2"}
+    assert registry.removed == []
+
+def test_reloading_a_file_keeps_its_id(registry):
+    registry.load("alice", "docs/a/rapport.pdf")
+    registry.load("alice", "docs/b/rapport.pdf")
+    assert registry.load("alice", "./docs/b/rapport.pdf")["doc_id"] == "rapport-2"
+    assert len(registry.list("alice")) == 2
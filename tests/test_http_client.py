@@ -0,0 +1,17 @@
+import asyncio
+import time
+
+import httpx
+
+from services import http_client
+
+def test_retry_after_is_capped(monkeypatch):
+    responses = iter([httpx.Response(429, headers={"Retry-After": "3600"}), httpx.Response(200)])
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: next(responses)))
+    monkeypatch.setattr(http_client, "_client", client)
+
+    start = time.perf_counter()
+    # Un Retry-After d'une heure ne doit pas bloquer la requête au-delà de max_delay
+    response = asyncio.run(http_client.request_with_retries("GET", "http://service", max_delay=0.1))
+    assert response.status_code == 200
+    assert time.perf_counter() - start < 1
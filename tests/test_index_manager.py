@@ -0,0 +1,81 @@
+import hashlib
+import json
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from retriever import index_manager
+from retriever.chunking import TokenChunker
+
+class HashEmbeddings(Embeddings):
+    """Embeddings déterministes, sans modèle"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        return np.random.default_rng(seed).standard_normal(16).tolist()
+
+class JsonPagesLoader:
+    """Remplace PyPDFLoader : le « PDF » est une liste JSON de textes de pages"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def lazy_load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for page, text in enumerate(json.load(f)):
+                yield Document(page_content=text, metadata={"source": "doc.pdf", "page": page})
+
+@pytest.fixture(autouse=True)
+def offline_index(monkeypatch):
+    embeddings = HashEmbeddings()
+    monkeypatch.setattr(index_manager, "_get_embeddings", lambda: embeddings)
+    monkeypatch.setattr(index_manager, "_get_splitter", lambda: TokenChunker(tokenizer=None))
+    monkeypatch.setattr(index_manager, "PyPDFLoader", JsonPagesLoader)
+
+LEGAL = ("Les informations contenues dans ce document sont confidentielles et ne peuvent être "
+         "communiquées à des tiers sans l'accord écrit préalable de la direction juridique.")
+
+def write_pages(path, pages):
+    path.write_text(json.dumps(pages), encoding="utf-8")
+    return str(path)
+
+def indexed_chunks(index_path) -> list:
+    index = index_manager.load_faiss_index(str(index_path))
+    documents = index.docstore._dict.values()
+    return sorted((doc.metadata["page"], doc.metadata.get("section"), doc.page_content) for doc in documents)
+
+def test_incremental_upsert_matches_full_rebuild(tmp_path):
+    before = [
+        "1 Introduction\nLe contexte du projet est présenté ici.",
+        f"Suite de l'introduction.\n\n{LEGAL}",
+        "2 Méthode\nLa méthode suivie est décrite ici.",
+        f"Détails de la méthode.\n\n{LEGAL}",
+    ]
+    # Page 2 modifiée : elle perd son titre, et la page 1 perd la mention légale
+    after = [before[0], "Suite de l'introduction.", "La méthode suivie est décrite ici.", before[3]]
+
+    incremental = tmp_path / "incremental"
+    index_manager.upsert_document(write_pages(tmp_path / "v1.json", before), doc_id="doc", index_path=str(incremental))
+    summary = index_manager.upsert_document(write_pages(tmp_path / "v2.json", after), doc_id="doc", index_path=str(incremental))
+
+    rebuilt = tmp_path / "rebuilt"
+    index_manager.upsert_document(str(tmp_path / "v2.json"), doc_id="doc", index_path=str(rebuilt))
+
+    assert indexed_chunks(incremental) == indexed_chunks(rebuilt)
+    # La page 3 hérite d'une autre section et retrouve la mention légale : elle est redécoupée
+    assert summary["skipped"] == 1
+
+def test_unchanged_pages_are_not_embedded_again(tmp_path):
+    pages = ["1 Introduction\nPremière page.", "Deuxième page.", "Troisième page."]
+    index_path = str(tmp_path / "index")
+    index_manager.upsert_document(write_pages(tmp_path / "v1.json", pages), doc_id="doc", index_path=index_path)
+    summary = index_manager.upsert_document(
+        write_pages(tmp_path / "v2.json", pages[:2] + ["Troisième page, modifiée."]), doc_id="doc", index_path=index_path
+    )
+    assert summary["skipped"] == 2
+    assert summary["added"] == 1
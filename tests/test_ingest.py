@@ -0,0 +1,18 @@
+import pytest
+
+from retriever import ingest
+
+def test_pdfs_in_subfolders_keep_distinct_ids(tmp_path):
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "rapport.pdf").write_bytes(b"%PDF")
+    (tmp_path / "notes.pdf").write_bytes(b"%PDF")
+
+    doc_ids = [doc_id for _, doc_id in ingest._collect_pdfs([str(tmp_path)])]
+    assert doc_ids == ["a/rapport.pdf", "b/rapport.pdf", "notes.pdf"]
+
+def test_duplicate_ids_are_rejected_before_ingestion(tmp_path):
+    paths = [str(tmp_path / "a" / "rapport.pdf"), str(tmp_path / "b" / "rapport.pdf")]
+    with pytest.raises(ValueError, match="rapport.pdf"):
+        ingest.ingest_pdfs(paths, index_path=str(tmp_path / "index"))
+    assert not (tmp_path / "index").exists()
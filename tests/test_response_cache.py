@@ -0,0 +1,82 @@
+import pytest
+from langchain_core.agents import AgentAction
+
+from agent import AgentSession
+from memory.memory_manager import BudgetedSummaryMemory
+from services.response_cache import ResponseCache, ToolRecorder
+
+class ScriptedExecutor:
+    """Exécuteur minimal : répond par une réponse fixe et compte ses appels"""
+
+    def __init__(self, output: str, memory):
+        self.output = output
+        self.memory = memory
+        self.calls = 0
+
+    def invoke(self, inputs, config=None):
+        self.calls += 1
+        self.memory.save_context({"input": inputs["input"]}, {"output": self.output})
+        return {"output": self.output}
+
+def make_session(cache, user_id: str, history, output: str) -> AgentSession:
+    memory = BudgetedSummaryMemory(return_messages=True, output_key="output", input_key="input")
+    for question, answer in history:
+        memory.save_context({"input": question}, {"output": answer})
+    return AgentSession(ScriptedExecutor(output, memory), user_id=user_id, response_cache=cache, cache_context="agent")
+
+def test_same_question_with_different_histories_is_not_shared():
+    cache = ResponseCache(semantic=False)
+    # Les conversations ne diffèrent que par un échange ancien
+    alice = make_session(cache, "alice", [("Je m'appelle Alice", "Enchanté"), ("Merci", "De rien")], "Vous êtes Alice.")
+    bob = make_session(cache, "bob", [("Je m'appelle Bob", "Enchanté"), ("Merci", "De rien")], "Vous êtes Bob.")
+
+    assert alice.run("Quel est mon nom ?") == "Vous êtes Alice."
+    assert bob.run("Quel est mon nom ?") == "Vous êtes Bob."
+    assert bob.executor.calls == 1
+    assert len(cache) == 2
+
+def test_summary_is_part_of_the_context():
+    cache = ResponseCache(semantic=False)
+    alice = make_session(cache, "alice", [], "Vous êtes Alice.")
+    bob = make_session(cache, "bob", [], "Vous êtes Bob.")
+    alice.memory.summary = "L'utilisateur s'appelle Alice."
+    bob.memory.summary = "L'utilisateur s'appelle Bob."
+
+    alice.run("Quel est mon nom ?")
+    assert bob.run("Quel est mon nom ?") == "Vous êtes Bob."
+    assert len(cache) == 2
+
+def test_identical_conversations_share_tool_less_answers():
+    cache = ResponseCache(semantic=False)
+    first = make_session(cache, "alice", [], "Paris.")
+    second = make_session(cache, "bob", [], "Autre réponse")
+
+    first.run("Quelle est la capitale de la France ?")
+    assert second.run("Quelle est la capitale de la France ?") == "Paris."
+    assert second.executor.calls == 0
+
+class FailingTodoExecutor:
+    """Exécuteur qui ajoute une tâche puis s'interrompt (erreur ou limite d'itérations)"""
+
+    def __init__(self, memory, error: Exception = None):
+        self.memory = memory
+        self.error = error
+
+    def invoke(self, inputs, config=None):
+        for callback in config["callbacks"]:
+            if isinstance(callback, ToolRecorder):
+                callback.on_agent_action(AgentAction("TODO", "add:acheter du pain", ""))
+        if self.error is not None:
+            raise self.error
+        return {"output": "Agent stopped due to iteration limit or time limit."}
+
+@pytest.mark.parametrize("error", [RuntimeError("LLM indisponible"), None])
+def test_mutation_invalidates_user_answers_even_if_the_run_fails(error):
+    cache = ResponseCache(semantic=False)
+    cache.store("Résume mon document", "Résumé.", "alice", "ctx", [("LectureDoc", "résume")])
+    assert len(cache) == 1
+
+    memory = BudgetedSummaryMemory(return_messages=True, output_key="output", input_key="input")
+    session = AgentSession(FailingTodoExecutor(memory, error), user_id="alice", response_cache=cache)
+    session.run("Ajoute acheter du pain")
+    assert len(cache) == 0
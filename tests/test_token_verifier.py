@@ -0,0 +1,128 @@
+import threading
+import time
+
+import jwt
+import pytest
+
+from benchmarks.offline import LocalTokenIssuer
+from services.token_verifier import TokenVerificationError, TokenVerifier
+
+@pytest.fixture
+def issuer():
+    return LocalTokenIssuer(project_id="projet-test")
+
+def sign(issuer, kid: str = LocalTokenIssuer.KID, **overrides) -> str:
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{issuer.project_id}",
+        "aud": issuer.project_id,
+        "sub": "alice",
+        "iat": now,
+        "auth_time": now,
+        "exp": now + 3600,
+        **overrides,
+    }
+    return jwt.encode(claims, issuer._private_key, algorithm="RS256", headers={"kid": kid})
+
+def test_valid_token(issuer):
+    claims = issuer.verifier().verify(issuer.token("alice"))
+    assert claims["uid"] == "alice"
+
+@pytest.mark.parametrize("overrides", [
+    {"aud": "autre-projet"},
+    {"iss": "https://securetoken.google.com/autre-projet"},
+    {"exp": int(time.time()) - 3600, "iat": int(time.time()) - 7200},
+])
+def test_rejects_wrong_audience_issuer_and_expired(issuer, overrides):
+    verifier = issuer.verifier()
+    with pytest.raises(TokenVerificationError):
+        verifier.verify(sign(issuer, **overrides))
+    assert verifier.failures == 1
+
+def test_rejects_unknown_kid_without_blocking(issuer):
+    fetched = threading.Event()
+    release = threading.Event()
+    public_keys = {issuer.KID: issuer._private_key.public_key()}
+
+    def slow_fetcher():
+        fetched.set()
+        release.wait(5)
+        return public_keys, 3600
+
+    verifier = TokenVerifier(issuer.project_id, key_fetcher=slow_fetcher)
+    start = time.perf_counter()
+    with pytest.raises(TokenVerificationError):
+        verifier.verify(sign(issuer, kid="inconnu"))
+    # Le rechargement des clés a lieu en arrière-plan, pas pendant la vérification
+    assert time.perf_counter() - start < 1
+    assert fetched.wait(5)
+    release.set()
+    verifier.stop()
+
+def test_stale_keys_are_served_while_refreshing(issuer):
+    calls = []
+    public_keys = {issuer.KID: issuer._private_key.public_key()}
+
+    def fetcher():
+        calls.append(time.time())
+        if len(calls) > 1:
+            raise ConnectionError("certificats indisponibles")
+        return public_keys, 0
+
+    verifier = TokenVerifier(issuer.project_id, key_fetcher=fetcher)
+    verifier.refresh_keys()
+    # Clés périmées (max_age 0) et rafraîchissement en échec : le jeton reste vérifiable
+    assert verifier.verify(issuer.token("alice"))["uid"] == "alice"
+    verifier.stop()
+
+def test_cache_hit(issuer):
+    verifier = issuer.verifier()
+    token = issuer.token("alice")
+    first = verifier.verify(token)
+    second = verifier.verify(token)
+    assert second is first
+    assert (verifier.misses, verifier.hits) == (1, 1)
+
+def test_start_loads_keys_before_returning(issuer):
+    public_keys = {issuer.KID: issuer._private_key.public_key()}
+    verifier = TokenVerifier(issuer.project_id, key_fetcher=lambda: (public_keys, 3600))
+    verifier.start()
+    # Première requête après le démarrage : la clé est déjà là
+    assert verifier.verify(issuer.token("alice"))["uid"] == "alice"
+    verifier.stop()
+
+def test_start_raises_when_keys_are_unavailable(issuer):
+    def failing_fetcher():
+        raise ConnectionError("certificats indisponibles")
+
+    verifier = TokenVerifier(issuer.project_id, key_fetcher=failing_fetcher)
+    with pytest.raises(ConnectionError):
+        verifier.start()
+    # Le rafraîchissement en arrière-plan est lancé malgré tout
+    assert verifier._refresher is not None
+    verifier.stop()
+
+def test_fallback_verifier_without_keys(issuer):
+    def failing_fetcher():
+        raise ConnectionError("certificats indisponibles")
+
+    delegated = []
+
+    def fallback(token):
+        delegated.append(token)
+        return {"uid": "alice", "exp": int(time.time()) + 3600}
+
+    verifier = TokenVerifier(issuer.project_id, key_fetcher=failing_fetcher, fallback_verifier=fallback)
+    token = issuer.token("alice")
+    assert verifier.verify(token)["uid"] == "alice"
+    assert delegated == [token]
+    verifier.stop()
+
+def test_fallback_errors_are_verification_errors(issuer):
+    def fallback(token):
+        raise ValueError("jeton refusé")
+
+    verifier = TokenVerifier(issuer.project_id, key_fetcher=lambda: ({}, 3600), fallback_verifier=fallback)
+    with pytest.raises(TokenVerificationError):
+        verifier.verify(issuer.token("alice"))
+    verifier.stop()
@@ -1,18 +1,318 @@
 from langchain.tools import BaseTool
-import re
+import ast
 import math
+import operator
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# Limites qui bornent le temps de calcul d'une expression
+MAX_EXPRESSION_LENGTH = 2000
+MAX_NODES = 400
+MAX_ELEMENTS = 1_000_000
+# Travail d'une fonction qui combine deux listes (ex : valeurs × centiles demandés)
+MAX_WORK = 100_000_000
+MAX_QUANTILES = 100
+MAX_INT_BITS = 10_000
+MAX_FACTORIAL = 1000
+MAX_ROUND_DIGITS = 100
+MAX_BATCH_EXPRESSIONS = 50
+CALCULATOR_CACHE_SIZE = int(os.getenv("CALCULATOR_CACHE_SIZE", "1024"))
+# Éléments d'une liste affichés dans un résultat
+MAX_DISPLAYED_ELEMENTS = 20
+
+
+class CalculationError(ValueError):
+    """Expression refusée (élément non autorisé) ou dépassant les limites de calcul"""
+
+
+# --- Opérations avec limites ---
+
+def _check_int(value):
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise CalculationError("Résultat trop grand")
+    return value
+
+def _pow(a, b):
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.power(np.asarray(a, dtype=float), b)
+    if isinstance(a, int) and isinstance(b, int) and b > 0 and abs(a) > 1:
+        # Estimation de la taille du résultat avant de le calculer (ex : 9**9**9)
+        if b * abs(a).bit_length() > MAX_INT_BITS + 64:
+            raise CalculationError("Puissance trop grande")
+    return _check_int(a ** b)
+
+def _mul(a, b):
+    if isinstance(a, int) and isinstance(b, int) and a.bit_length() + b.bit_length() > MAX_INT_BITS + 1:
+        raise CalculationError("Résultat trop grand")
+    return a * b
+
+def _add(a, b):
+    return _check_int(a + b)
+
+def _sub(a, b):
+    return _check_int(a - b)
+
+_BINARY_OPERATORS = {
+    ast.Add: _add,
+    ast.Sub: _sub,
+    ast.Mult: _mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _pow,
+    # '^' est compris comme une puissance (notation usuelle d'une calculatrice)
+    ast.BitXor: _pow,
+}
+
+_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+_CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+    "tau": math.tau,
+    "inf": math.inf,
+}
+
+
+# --- Fonctions ---
+
+def _elementwise(scalar_func, array_func):
+    """Fonction mathématique applicable à un nombre (math) ou à une liste (NumPy)"""
+    def func(x):
+        if isinstance(x, np.ndarray):
+            return array_func(x)
+        return scalar_func(x)
+    return func
+
+def _log(x, base=None):
+    if isinstance(x, np.ndarray):
+        return np.log(x) if base is None else np.log(x) / np.log(base)
+    return math.log(x) if base is None else math.log(x, base)
+
+def _round(x, digits=0):
+    if not isinstance(digits, int) or abs(digits) > MAX_ROUND_DIGITS:
+        raise CalculationError("Nombre de décimales invalide")
+    if isinstance(x, np.ndarray):
+        return np.round(x, digits)
+    return round(x, digits)
+
+def _factorial(n):
+    if not isinstance(n, int) and not (isinstance(n, float) and n.is_integer()):
+        raise CalculationError("factorial n'accepte que des entiers")
+    if n > MAX_FACTORIAL:
+        raise CalculationError(f"factorial limitée à {MAX_FACTORIAL}")
+    return math.factorial(int(n))
+
+def _range(start, stop=None, step=1):
+    if stop is None:
+        start, stop = 0, start
+    if step == 0:
+        raise CalculationError("Le pas de range ne peut pas être nul")
+    if math.ceil((stop - start) / step) > MAX_ELEMENTS:
+        raise CalculationError(f"Liste trop grande (max {MAX_ELEMENTS} éléments)")
+    return np.arange(start, stop, step, dtype=float)
+
+def _linspace(start, stop, count):
+    if count > MAX_ELEMENTS:
+        raise CalculationError(f"Liste trop grande (max {MAX_ELEMENTS} éléments)")
+    return np.linspace(start, stop, int(count))
+
+def _flatten(values) -> np.ndarray:
+    """
+    Tableau des valeurs, les listes imbriquées étant mises à plat : [1, range(3)] -> [1, 0, 1, 2].
+    Le nombre d'éléments est vérifié au fil des parties, avant de les assembler.
+    """
+    parts, size = [], 0
+    for value in values:
+        part = np.ravel(np.asarray(value, dtype=float))
+        size += part.size
+        if size > MAX_ELEMENTS:
+            raise CalculationError(f"Liste trop grande (max {MAX_ELEMENTS} éléments)")
+        parts.append(part)
+    return np.concatenate(parts) if parts else np.empty(0)
+
+def _values(args) -> np.ndarray:
+    """Valeurs d'une agrégation : sum([1, 2, 3]), sum(range(10)) ou sum(1, 2, 3)"""
+    values = args[0] if len(args) == 1 and isinstance(args[0], np.ndarray) else _flatten(args)
+    if values.size == 0:
+        raise CalculationError("Aucune valeur à agréger")
+    return values
+
+def _aggregate(array_func):
+    def func(*args):
+        return array_func(_values(args))
+    return func
+
+def _extremum(scalar_func, array_func):
+    # min(3, 4) reste entier ; min([3, 4]) passe par NumPy
+    def func(*args):
+        if len(args) > 1 and not any(isinstance(arg, np.ndarray) for arg in args):
+            return scalar_func(args)
+        return array_func(_values(args))
+    return func
+
+def _check_work(*sizes):
+    if math.prod(sizes) > MAX_WORK:
+        raise CalculationError("Calcul trop coûteux")
+
+def _percentile(values, q):
+    values = _values((values,))
+    quantiles = np.asarray(q, dtype=float)
+    if quantiles.size > MAX_QUANTILES:
+        raise CalculationError(f"Trop de centiles (max {MAX_QUANTILES})")
+    if not np.all((quantiles >= 0) & (quantiles <= 100)):
+        raise CalculationError("Les centiles doivent être compris entre 0 et 100")
+    _check_work(values.size, max(1, quantiles.size))
+    return np.percentile(values, quantiles)
+
+_FUNCTIONS = {
+    "sin": _elementwise(math.sin, np.sin),
+    "cos": _elementwise(math.cos, np.cos),
+    "tan": _elementwise(math.tan, np.tan),
+    "asin": _elementwise(math.asin, np.arcsin),
+    "acos": _elementwise(math.acos, np.arccos),
+    "atan": _elementwise(math.atan, np.arctan),
+    "sinh": _elementwise(math.sinh, np.sinh),
+    "cosh": _elementwise(math.cosh, np.cosh),
+    "tanh": _elementwise(math.tanh, np.tanh),
+    "sqrt": _elementwise(math.sqrt, np.sqrt),
+    "exp": _elementwise(math.exp, np.exp),
+    "log10": _elementwise(math.log10, np.log10),
+    "log2": _elementwise(math.log2, np.log2),
+    "floor": _elementwise(math.floor, np.floor),
+    "ceil": _elementwise(math.ceil, np.ceil),
+    "abs": _elementwise(abs, np.abs),
+    "degrees": _elementwise(math.degrees, np.degrees),
+    "radians": _elementwise(math.radians, np.radians),
+    "log": _log,
+    "ln": _elementwise(math.log, np.log),
+    "round": _round,
+    "factorial": _factorial,
+    "gcd": math.gcd,
+    "hypot": math.hypot,
+    "atan2": math.atan2,
+    "range": _range,
+    "linspace": _linspace,
+    "sum": _aggregate(np.sum),
+    "prod": _aggregate(np.prod),
+    "mean": _aggregate(np.mean),
+    "median": _aggregate(np.median),
+    "std": _aggregate(np.std),
+    "var": _aggregate(np.var),
+    "len": _aggregate(len),
+    "min": _extremum(min, np.min),
+    "max": _extremum(max, np.max),
+    "percentile": _percentile,
+}
+
+
+# --- Compilation ---
+
+def _build(node, counter):
+    """Transforme un nœud AST autorisé en fonction sans argument qui calcule sa valeur"""
+    counter[0] += 1
+    if counter[0] > MAX_NODES:
+        raise CalculationError("Expression trop complexe")
+
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise CalculationError("Seuls les nombres sont autorisés")
+        return lambda: value
+
+    if isinstance(node, ast.Name):
+        if node.id not in _CONSTANTS:
+            raise CalculationError(f"Nom inconnu : {node.id}")
+        value = _CONSTANTS[node.id]
+        return lambda: value
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        op, operand = _UNARY_OPERATORS[type(node.op)], _build(node.operand, counter)
+        return lambda: op(operand())
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        op = _BINARY_OPERATORS[type(node.op)]
+        left, right = _build(node.left, counter), _build(node.right, counter)
+        return lambda: op(left(), right())
+
+    if isinstance(node, (ast.List, ast.Tuple)):
+        elements = [_build(element, counter) for element in node.elts]
+        return lambda: _flatten(element() for element in elements)
+
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS or node.keywords:
+            name = node.func.id if isinstance(node.func, ast.Name) else "?"
+            raise CalculationError(f"Fonction non autorisée : {name}")
+        func = _FUNCTIONS[node.func.id]
+        args = [_build(arg, counter) for arg in node.args]
+        return lambda: func(*(arg() for arg in args))
+
+    raise CalculationError(f"Élément non autorisé : {type(node).__name__}")
+
+@lru_cache(maxsize=CALCULATOR_CACHE_SIZE)
+def compile_expression(expression: str):
+    """Expression analysée et validée une seule fois : les appels suivants réutilisent le résultat"""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise CalculationError("Expression trop longue")
+    try:
+        tree = ast.parse(expression.replace("×", "*").replace("÷", "/"), mode="eval")
+    except (SyntaxError, ValueError):
+        raise CalculationError("Expression mathématique invalide")
+    return _build(tree.body, [0])
+
+def evaluate(expression: str):
+    """Valeur d'une expression (nombre ou tableau NumPy) ; lève CalculationError si elle est refusée"""
+    compiled = compile_expression(expression.strip())
+    with np.errstate(all="ignore"):
+        return compiled()
+
+
+def format_result(value) -> str:
+    if isinstance(value, np.ndarray):
+        items = [format_result(v) for v in value.ravel()[:MAX_DISPLAYED_ELEMENTS]]
+        if value.size > MAX_DISPLAYED_ELEMENTS:
+            items.append(f"... ({value.size} éléments)")
+        return "[" + ", ".join(items) + "]"
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer() and abs(value) < 2 ** 53:
+        return str(int(value))
+    return str(value)
+
 
 class CalculatorTool(BaseTool):
     name: str = "Calculator"
-    description: str = "Effectue des calculs mathématiques. Entrez une expression comme '2+2' ou 'sin(45)'"
+    description: str = (
+        "Effectue des calculs mathématiques. Entrez une expression comme '2+2', 'sin(pi/4)' ou '2^10'. "
+        "Fonctions : sqrt, log, ln, exp, sin, cos, tan, round, factorial... "
+        "Listes et statistiques : sum([1, 2, 3]), mean(range(1, 101)), median, std, var, min, max, percentile(liste, 90). "
+        "Plusieurs expressions séparées par ';' sont calculées en un seul appel."
+    )
 
-    def _run(self, query: str) -> str:
+    def _evaluate_one(self, expression: str) -> str:
         try:
-            # Sécurité : vérifier que la requête ne contient que des caractères mathématiques
-            if not re.match(r'^[\d+\-*/().^% sincoetanlg! ]+$', query):
-                return "Expression mathématique invalide"
-            
-            result = eval(query, {'__builtins__': None}, math.__dict__)
-            return f"Résultat: {result}"
+            return format_result(evaluate(expression))
+        except CalculationError as e:
+            return f"Erreur de calcul: {e}"
+        except ZeroDivisionError:
+            return "Erreur de calcul: division par zéro"
         except Exception as e:
-            return f"Erreur de calcul: {str(e)}"
\ No newline at end of file
+            return f"Erreur de calcul: {str(e)}"
+
+    def _run(self, query: str) -> str:
+        expressions = [expression.strip() for expression in re.split(r"[;\n]", query) if expression.strip()]
+        if not expressions:
+            return "Expression mathématique invalide"
+        if len(expressions) > MAX_BATCH_EXPRESSIONS:
+            return f"Trop d'expressions (max {MAX_BATCH_EXPRESSIONS} par appel)"
+
+        if len(expressions) == 1:
+            result = self._evaluate_one(expressions[0])
+            return result if result.startswith("Erreur") else f"Résultat: {result}"
+        return "\n".join(f"{expression} = {self._evaluate_one(expression)}" for expression in expressions)
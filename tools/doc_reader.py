@@ -1,82 +1,170 @@
 import os
+import threading
+from typing import List
 from langchain.tools import BaseTool
-from langchain.chains import RetrievalQA
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI # AJOUTE cette ligne
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.documents import Document
 from dotenv import load_dotenv # AJOUTE cette ligne pour que le tool puisse charger sa propre clé si nécessaire
+from services.tracing import TracingCallbackHandler, span
+from services.llm_gateway import create_chat_model
 
 load_dotenv() # AJOUTE cette ligne ici pour s'assurer que les variables sont chargées pour ce fichier
 
+# Recherche : hybride BM25 + FAISS, avec déduplication MMR ; le reranking
+# cross-encoder est optionnel (modèle supplémentaire à charger)
+RETRIEVAL_MODE = os.getenv("DOC_RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_K = int(os.getenv("DOC_RETRIEVAL_K", "3"))
+RETRIEVAL_RERANK = os.getenv("DOC_RETRIEVAL_RERANK", "false").lower() == "true"
+RETRIEVAL_MMR = os.getenv("DOC_RETRIEVAL_MMR", "true").lower() == "true"
+# Utilisateur utilisé quand l'outil est appelé sans session (ex: agent.run en local)
+DEFAULT_USER = "default"
+
+def _make_splitter():
+    # Découpage en tokens (CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS), commun avec retriever/index_manager.py
+    from retriever.chunking import TokenChunker
+
+    return TokenChunker()
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_document_registry():
+    """
+    Registre des documents du processus, partagé par l'outil et les tâches d'indexation
+    de l'API (services/document_jobs.py) : un document indexé en arrière-plan est
+    aussitôt visible de l'agent
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                # Import différé (FAISS, chargeurs PDF) : payé au premier usage, pas au démarrage
+                from retriever.document_registry import DocumentRegistry
+                from services.document_jobs import remove_upload
+
+                _registry = DocumentRegistry(
+                    splitter_factory=_make_splitter,
+                    splitter_params=_make_splitter().params(),
+                    # Un document envoyé à l'API retiré (ou remplacé) du catalogue : son PDF est supprimé
+                    on_removed=remove_upload
+                )
+    return _registry
+
+class RegistryRetriever(BaseRetriever):
+    """Retriever qui interroge les documents sélectionnés d'un utilisateur"""
+    registry: object
+    user_id: str
+    k: int = RETRIEVAL_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        with span("retrieval", k=self.k, mode=RETRIEVAL_MODE) as attrs:
+            results = self.registry.search(
+                self.user_id, query, k=self.k,
+                mode=RETRIEVAL_MODE, rerank=RETRIEVAL_RERANK, mmr=RETRIEVAL_MMR
+            )
+            attrs["results"] = len(results)
+        return [
+            Document(
+                page_content=result["content"],
+                metadata={"source": result["source"], "page": result["page"], "doc_id": result["doc_id"], "score": result["score"]}
+            )
+            for result in results
+        ]
+
 class DocReaderTool(BaseTool):
     name: str = "LectureDoc"
     description: str = (
-        "Lit un PDF et répond aux questions dessus. "
-        "Utilisez 'load:<chemin_vers_pdf>' pour charger un document, puis posez vos questions."
+        "Lit des PDF et répond aux questions dessus, en cherchant dans tous les documents sélectionnés. "
+        "Utilisez 'load:<chemin_vers_pdf>' pour charger un document, 'docs' pour lister les documents chargés, "
+        "'use:<doc1,doc2>' (ou 'use:all') pour choisir les documents interrogés, "
+        "'unload:<doc>' pour en retirer un, puis posez vos questions."
     )
-    index: object = None
-    qa_chain: object = None
-    embeddings: object = None
+    registry: object = None
     llm: object = None
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        object.__setattr__(self, "index", None)
-        object.__setattr__(self, "qa_chain", None)
-        object.__setattr__(self, "embeddings", HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"))
+        object.__setattr__(self, "registry", get_document_registry())
         
         # MODIFIE cette ligne pour utiliser Gemini
         # Assurez-vous que GEMINI_API_KEY est disponible dans les variables d'environnement
         gemini_api_key = os.getenv("GEMINI_API_KEY")
         if not gemini_api_key:
             raise ValueError("GEMINI_API_KEY n'est pas définie pour DocReaderTool")
-        object.__setattr__(self, "llm", ChatGoogleGenerativeAI(
-            model="models/gemini-1.5-flash-latest", # Ou le modèle Gemini que vous préférez
+        # Même passerelle que l'agent : quotas et concurrence communs
+        object.__setattr__(self, "llm", create_chat_model(
+            "models/gemini-1.5-flash-latest", # Ou le modèle Gemini que vous préférez
             temperature=0,
-            google_api_key=gemini_api_key # Passez la clé API ici
+            api_key=gemini_api_key
         ))
 
-    def load_pdf(self, filepath):
+    def load_pdf(self, filepath, user_id: str = DEFAULT_USER):
         if not os.path.exists(filepath):
             return f"Fichier {filepath} introuvable"
         
         try: # AJOUTE un bloc try-except ici pour capturer les erreurs de lecture PDF
-            loader = PyPDFLoader(filepath)
-            docs = loader.load()
-            if not docs: # Vérifie si le PDF est vide après chargement
-                return f"Le fichier PDF '{os.path.basename(filepath)}' ne contient aucune page ou est corrompu."
-            
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200
-            )
-            splits = text_splitter.split_documents(docs)
-            
-            if not splits: # Vérifie si le splitter a produit des chunks
-                 return f"Impossible d'extraire du texte du fichier PDF '{os.path.basename(filepath)}'. Il est peut-être vide ou non textuel."
-
-            object.__setattr__(self, "index", FAISS.from_documents(splits, self.embeddings))
-            object.__setattr__(self, "qa_chain", RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.index.as_retriever()
-            ))
-            return f"Document {os.path.basename(filepath)} chargé avec succès"
+            # L'index est réutilisé depuis le cache disque si ce contenu a déjà été indexé
+            entry = self.registry.load(user_id, filepath)
+            suffix = " (depuis le cache)" if entry["from_cache"] else ""
+            return f"Document {entry['source']} chargé avec succès{suffix} (identifiant : {entry['doc_id']})"
+        except ValueError as e:
+            return f"Impossible d'utiliser le fichier PDF '{os.path.basename(filepath)}' : {str(e)}"
         except Exception as e:
             return f"Erreur lors du chargement ou du traitement du PDF '{os.path.basename(filepath)}': {str(e)}"
 
-    def _run(self, query: str) -> str:
+    def list_documents(self, user_id: str = DEFAULT_USER) -> str:
+        documents = self.registry.list(user_id)
+        if not documents:
+            return "Aucun document chargé."
+        return "\n".join(
+            f"{'✅' if entry['selected'] else '⬜'} {doc_id} ({entry['source']}, {entry['pages']} pages)"
+            for doc_id, entry in documents.items()
+        )
+
+    def run_for_user(self, user_id: str, query: str) -> str:
+        """Exécute une commande ou une question dans l'espace documentaire de user_id"""
+        command = query.strip()
+        lowered = command.lower()
+
         # On accepte 'load:<chemin>' ou 'load <chemin>'
-        if query.lower().startswith("load:") or query.lower().startswith("load "):
-            filepath = query.split(":", 1)[-1].strip() if ":" in query else query.split(" ", 1)[-1].strip()
-            return self.load_pdf(filepath)
-        
-        if not self.qa_chain:
+        if lowered.startswith("load:") or lowered.startswith("load "):
+            filepath = command.split(":", 1)[-1].strip() if ":" in command else command.split(" ", 1)[-1].strip()
+            return self.load_pdf(filepath, user_id=user_id)
+
+        if lowered in ("docs", "list"):
+            return self.list_documents(user_id)
+
+        if lowered.startswith("use:"):
+            value = command.split(":", 1)[1].strip()
+            doc_ids = None if value.lower() == "all" else [d.strip() for d in value.split(",") if d.strip()]
+            try:
+                selection = self.registry.select(user_id, doc_ids)
+            except KeyError as e:
+                return f"Document(s) inconnu(s) : {e.args[0]}"
+            return f"Documents interrogés : {', '.join(selection) or 'aucun'}"
+
+        if lowered.startswith("unload:"):
+            doc_id = command.split(":", 1)[1].strip()
+            if self.registry.unload(user_id, doc_id):
+                return f"Document {doc_id} retiré"
+            return f"Document {doc_id} inconnu"
+
+        if not any(entry["selected"] for entry in self.registry.list(user_id).values()):
             return "Veuillez d'abord charger un PDF avec 'load:<chemin_vers_pdf>'"
         
         try:
-            return self.qa_chain.run(query)
+            from langchain.chains import RetrievalQA
+
+            qa_chain = RetrievalQA.from_chain_type(
+                llm=self.llm,
+                chain_type="stuff",
+                retriever=RegistryRetriever(registry=self.registry, user_id=user_id)
+            )
+            # Le LLM de l'outil est tracé avec la requête en cours
+            result = qa_chain.invoke({"query": query}, config={"callbacks": [TracingCallbackHandler()]})
+            return result["result"]
         except Exception as e:
-            return f"Erreur lors de la recherche: {str(e)}"
\ No newline at end of file
+            return f"Erreur lors de la recherche: {str(e)}"
+
+    def _run(self, query: str) -> str:
+        return self.run_for_user(DEFAULT_USER, query)
@@ -0,0 +1,62 @@
+import threading
+
+from langchain.tools import BaseTool
+
+
+class LazyTool(BaseTool):
+    """
+    Outil construit au premier appel : le nom et la description sont lus sur la classe
+    (nécessaires au prompt de l'agent), l'instance (modèles, clients, index) n'est créée
+    qu'à la première utilisation ou lors du préchauffage.
+    """
+    name: str
+    description: str
+    # True si l'outil gère des données par utilisateur (méthode run_for_user)
+    user_bound: bool = False
+    tool_class: object = None
+    instance: object = None
+    lock: object = None
+
+    def __init__(self, tool_class, **kwargs):
+        fields = tool_class.model_fields
+        super().__init__(
+            name=fields["name"].default,
+            description=fields["description"].default,
+            user_bound=hasattr(tool_class, "run_for_user"),
+            **kwargs
+        )
+        object.__setattr__(self, "tool_class", tool_class)
+        object.__setattr__(self, "lock", threading.Lock())
+
+    @property
+    def loaded(self) -> bool:
+        return self.instance is not None
+
+    def get_instance(self):
+        if self.instance is None:
+            with self.lock:
+                if self.instance is None:
+                    object.__setattr__(self, "instance", self.tool_class())
+                    print(f"✅ {self.tool_class.__name__} initialisé")
+        return self.instance
+
+    def run_for_user(self, user_id: str, query: str) -> str:
+        try:
+            tool = self.get_instance()
+        except Exception as e:
+            return f"Outil {self.name} indisponible : {e}"
+        return tool.run_for_user(user_id, query) if self.user_bound else tool._run(query)
+
+    def _run(self, query: str) -> str:
+        try:
+            tool = self.get_instance()
+        except Exception as e:
+            return f"Outil {self.name} indisponible : {e}"
+        return tool._run(query)
+
+    async def _arun(self, query: str) -> str:
+        try:
+            tool = self.get_instance()
+        except Exception as e:
+            return f"Outil {self.name} indisponible : {e}"
+        return await tool._arun(query)
@@ -1,20 +1,81 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
 from langchain.tools import BaseTool
-from langchain_community.tools import DuckDuckGoSearchRun
+
+from services.search_cache import SearchCache, SingleFlight
+from services.tracing import record_cache, span
+
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "search_cache.sqlite3")
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "600"))
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", "4"))
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "15"))
 
 class SearchTool(BaseTool):
+    """
+    Recherche DuckDuckGo avec cache des résultats (mémoire + SQLite, TTL) et
+    regroupement des requêtes identiques simultanées (un seul appel réseau).
+    Les appels sortants passent par un pool dédié de SEARCH_MAX_CONCURRENCY threads.
+    """
     name: str = "RechercheWeb"
     description: str = "Recherche une information sur le web avec DuckDuckGo."
-    search: DuckDuckGoSearchRun = None  # <--- Ajoute cette ligne
+    search: object = None  # DuckDuckGoSearchRun par défaut (tout objet avec une méthode run(query))
+    cache: object = None
+    single_flight: object = None
+    fetch_pool: object = None
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        object.__setattr__(self, "search", DuckDuckGoSearchRun())
+        if self.search is None:
+            # Import différé : le module n'est chargé qu'à la construction de l'outil
+            from langchain_community.tools import DuckDuckGoSearchRun
+
+            object.__setattr__(self, "search", DuckDuckGoSearchRun())
+        object.__setattr__(self, "cache", SearchCache(SEARCH_CACHE_PATH, ttl_seconds=SEARCH_CACHE_TTL_SECONDS))
+        object.__setattr__(self, "single_flight", SingleFlight())
+        object.__setattr__(self, "fetch_pool", ThreadPoolExecutor(max_workers=SEARCH_MAX_CONCURRENCY, thread_name_prefix="web-search"))
+
+    def _fetch(self, query: str) -> str:
+        result = self.search.run(query)
+        self.cache.put(query, result)
+        return result
+
+    def _submit(self, query: str):
+        """Future du résultat de query (partagé avec les requêtes identiques en cours)"""
+        return self.single_flight.do(SearchCache.key(query), lambda: self._fetch(query), self.fetch_pool)
+
+    def _cached(self, query: str):
+        cached = self.cache.get(query)
+        record_cache("search", cached is not None)
+        return cached
 
     def _run(self, query: str) -> str:
+        cached = self._cached(query)
+        if cached is not None:
+            return cached
         try:
-            return self.search.run(query)
+            with span("web_search"):
+                return self._submit(query).result(timeout=SEARCH_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            return f"Erreur lors de la recherche: pas de réponse en moins de {SEARCH_TIMEOUT_SECONDS:.0f} secondes"
         except Exception as e:
             return f"Erreur lors de la recherche: {e}"
 
     async def _arun(self, query: str) -> str:
-        raise NotImplementedError("Pas de support async pour le moment")
\ No newline at end of file
+        cached = self._cached(query)
+        if cached is not None:
+            return cached
+        try:
+            # L'attente ne bloque ni la boucle d'événements ni un thread de l'appelant
+            future = asyncio.wrap_future(self._submit(query))
+            with span("web_search"):
+                return await asyncio.wait_for(asyncio.shield(future), timeout=SEARCH_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            return f"Erreur lors de la recherche: pas de réponse en moins de {SEARCH_TIMEOUT_SECONDS:.0f} secondes"
+        except Exception as e:
+            return f"Erreur lors de la recherche: {e}"
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "coalesced": self.single_flight.coalesced, "in_flight": self.single_flight.in_flight()}
@@ -1,36 +1,177 @@
+import os
+import sqlite3
+import threading
+import time
+
 from langchain.tools import BaseTool
 
-todo_list = []
+TODO_DB_PATH = os.getenv("TODO_DB_PATH", "todo.sqlite3")
+TODO_PAGE_SIZE = int(os.getenv("TODO_PAGE_SIZE", "20"))
+# Utilisateur utilisé quand l'outil est appelé sans session (ex: agent.run en local)
+DEFAULT_USER = "default"
+
+class TodoStore:
+    """
+    Tâches par utilisateur dans SQLite. Chaque tâche a un numéro stable propre à
+    l'utilisateur (jamais réutilisé), attribué dans une transaction exclusive :
+    plusieurs threads ou processus peuvent écrire en même temps sans conflit.
+    """
+
+    def __init__(self, path: str = TODO_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS todos (
+                uid TEXT NOT NULL,
+                task_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (uid, task_id)
+            );
+            CREATE TABLE IF NOT EXISTS todo_counters (
+                uid TEXT PRIMARY KEY,
+                next_id INTEGER NOT NULL
+            );
+        """)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None : les transactions sont gérées explicitement
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, uid: str, texts) -> list:
+        """Ajoute les tâches texts, retourne [(numéro, texte)]"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT next_id FROM todo_counters WHERE uid = ?", (uid,)).fetchone()
+            first_id = row[0] if row else 1
+            added = [(first_id + i, text) for i, text in enumerate(texts)]
+            now = time.time()
+            conn.executemany(
+                "INSERT INTO todos (uid, task_id, text, created_at) VALUES (?, ?, ?, ?)",
+                [(uid, task_id, text, now) for task_id, text in added]
+            )
+            conn.execute(
+                "INSERT INTO todo_counters (uid, next_id) VALUES (?, ?) "
+                "ON CONFLICT(uid) DO UPDATE SET next_id = excluded.next_id",
+                (uid, first_id + len(added))
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def remove(self, uid: str, task_ids) -> list:
+        """Supprime les tâches task_ids, retourne [(numéro, texte)] de celles qui existaient"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = []
+            for task_id in task_ids:
+                row = conn.execute(
+                    "SELECT task_id, text FROM todos WHERE uid = ? AND task_id = ?", (uid, task_id)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM todos WHERE uid = ? AND task_id = ?", (uid, task_id))
+                    removed.append(row)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def page(self, uid: str, page: int = 1, page_size: int = TODO_PAGE_SIZE):
+        """Page de tâches (ordre de création) : ([(numéro, texte)], nombre total)"""
+        conn = self._conn()
+        total = conn.execute("SELECT COUNT(*) FROM todos WHERE uid = ?", (uid,)).fetchone()[0]
+        rows = conn.execute(
+            "SELECT task_id, text FROM todos WHERE uid = ? ORDER BY task_id LIMIT ? OFFSET ?",
+            (uid, page_size, (page - 1) * page_size)
+        ).fetchall()
+        return rows, total
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_todo_store() -> TodoStore:
+    """Stockage de tâches unique pour tout le processus"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TodoStore()
+    return _store
+
+def _split_items(value: str) -> list:
+    # Plusieurs éléments séparés par des retours à la ligne ou des points-virgules
+    return [item.strip() for line in value.splitlines() for item in line.split(";") if item.strip()]
 
 class TodoTool(BaseTool):
     name: str = "TODO"
     description: str = (
-        "Gère la liste de tâches. Format: 'add:ma tâche' pour ajouter, 'list' pour afficher, 'remove:numéro' pour supprimer"
+        "Gère la liste de tâches. Format: 'add:ma tâche' pour ajouter (plusieurs tâches séparées par ';' "
+        "en un seul appel), 'list' pour afficher (ou 'list:2' pour la page 2), "
+        "'remove:numéro' pour supprimer (plusieurs numéros séparés par ',')"
     )
+    store: object = None
 
-    def _run(self, query: str) -> str:
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        object.__setattr__(self, "store", get_todo_store())
+
+    def run_for_user(self, user_id: str, query: str) -> str:
+        """Exécute une commande sur la liste de tâches de user_id"""
         try:
-            if query.startswith("add:"):
-                task = query.split("add:")[1].strip()
-                todo_list.append(task)
-                return f'✅ Tâche ajoutée : "{task}"'
-            
-            elif query == "list":
-                if not todo_list:
+            command = query.strip()
+
+            if command.startswith("add:"):
+                tasks = _split_items(command[len("add:"):])
+                if not tasks:
+                    return "Aucune tâche à ajouter"
+                added = self.store.add(user_id, tasks)
+                if len(added) == 1:
+                    return f'✅ Tâche ajoutée : "{added[0][1]}" (n°{added[0][0]})'
+                return f"✅ {len(added)} tâches ajoutées :\n" + "\n".join(f"{task_id}. {text}" for task_id, text in added)
+
+            elif command == "list" or command.startswith("list:"):
+                page = int(command.split(":", 1)[1].strip() or 1) if ":" in command else 1
+                page = max(page, 1)
+                tasks, total = self.store.page(user_id, page=page, page_size=TODO_PAGE_SIZE)
+                if not total:
                     return "Votre liste de tâches est vide."
-                return "\n".join(f"{i+1}. {t}" for i, t in enumerate(todo_list))
-            
-            elif query.startswith("remove:"):
-                num = int(query.split("remove:")[1].strip()) - 1
-                if 0 <= num < len(todo_list):
-                    removed = todo_list.pop(num)
-                    return f'❌ Tâche supprimée : "{removed}"'
-                return "Numéro de tâche invalide"
-            
+                if not tasks:
+                    return f"Page {page} vide ({total} tâches au total)"
+                pages = (total + TODO_PAGE_SIZE - 1) // TODO_PAGE_SIZE
+                lines = [f"{task_id}. {text}" for task_id, text in tasks]
+                if pages > 1:
+                    lines.append(f"(page {page}/{pages}, {total} tâches ; 'list:{page + 1}' pour la suite)" if page < pages
+                                 else f"(page {page}/{pages}, {total} tâches)")
+                return "\n".join(lines)
+
+            elif command.startswith("remove:"):
+                task_ids = [int(value) for value in command[len("remove:"):].replace(";", ",").split(",") if value.strip()]
+                removed = self.store.remove(user_id, task_ids)
+                if not removed:
+                    return "Numéro de tâche invalide"
+                missing = set(task_ids) - {task_id for task_id, _ in removed}
+                message = "\n".join(f'❌ Tâche supprimée : "{text}"' for _, text in removed)
+                if missing:
+                    message += f"\nNuméro(s) introuvable(s) : {', '.join(str(task_id) for task_id in sorted(missing))}"
+                return message
+
             return "Commande non reconnue. Utilisez add:, list ou remove:"
-        
+
         except Exception as e:
             return f"Erreur : {str(e)}"
 
-    async def _arun(self, query: str) -> str:
-        raise NotImplementedError("Pas de support async pour le moment")
\ No newline at end of file
+    def _run(self, query: str) -> str:
+        return self.run_for_user(DEFAULT_USER, query)